@@ -4,6 +4,7 @@ import argparse
 from .__init__ import __version__
 
 from .muttui import muttui_parser
+from .batch import batch_parser
 from .add_tree_node_labels import add_tree_node_labels_parser
 from .cluster_spectra import cluster_spectra_parser
 from .combine_spectra import combine_spectra_parser
@@ -28,6 +29,10 @@ def main():
         help="run the MutTui pipeline")
     muttui_subparser = muttui_parser(muttui_subparser)
 
+    batch_subparser = subparsers.add_parser("batch",
+        help="run the MutTui pipeline on each of the datasets in a manifest")
+    batch_subparser = batch_parser(batch_subparser)
+
     korimuto_subparser = subparsers.add_parser("korimuto",
         help="calculates a mutational spectrum from SNP data")
     korimuto_subparser = korimuto_parser(korimuto_subparser)
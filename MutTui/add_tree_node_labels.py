@@ -2,27 +2,27 @@
 #First processing step to label a tree for MutTui
 
 import argparse
-from Bio import Phylo
+from .array_tree import readTree, writeNewick
+from .profiling import profileCommand, profileStage, countOperations
 
 #Removes confidence values from the tree
 #These will be bootstrap supports, etc that will be written with the node labels if not removed
+#Takes an ArrayTree
 def cleanTree(tree):
-    #Iterate through the clades and remove clade confidence values
-    for clade in tree.find_clades():
-        if clade.confidence or (clade.confidence == 0.0):
-            clade.confidence = None
+    tree.confidences = [None] * len(tree)
     
     return(tree)
 
-#Adds node labels to a given tree
+#Adds node labels to a given ArrayTree, internal nodes are numbered in preorder
 def labelTreeNodes(tree):
     #Will be incremented with each node
     nodeIterator = 1
 
     #Iterate through the internal nodes and add labels
-    for clade in tree.find_clades():
-        if not clade.is_terminal():
-            clade.name = "Node" + str(nodeIterator)
+    terminal = tree.terminal.tolist()
+    for i in range(len(tree)):
+        if not terminal[i]:
+            tree.names[i] = "Node" + str(nodeIterator)
             nodeIterator += 1
     
     return(tree)
@@ -42,22 +42,33 @@ def add_tree_node_labels_parser(parser):
                         dest = "outFile",
                         required = True,
                         help = "Name of output tree file")
+    parser.add_argument("--profile",
+                        dest = "profile",
+                        help = "Write the wall time, CPU time and peak memory of each stage to run_profile.json in the directory " +
+                        "of the output file",
+                        action = "store_true",
+                        default = False)
     
     parser.set_defaults(func=add_tree_node_labels)
     
     return(parser)
 
 
+@profileCommand("label-nodes", lambda args: args.outFile)
 def add_tree_node_labels(args):
 
     #Clean the tree to remove any bootstrap supports
-    tree = cleanTree(Phylo.read(args.tree.name, "newick"))
+    with profileStage("tree_import"):
+        tree = cleanTree(readTree(args.tree.name, "newick"))
+    countOperations("clades", len(tree))
     
     #Label the tree nodes
-    labelledTree = labelTreeNodes(tree)
+    with profileStage("labelling"):
+        labelledTree = labelTreeNodes(tree)
 
     #Write the labelled tree
-    Phylo.write(labelledTree, args.outFile, "newick")
+    with profileStage("writing"):
+        writeNewick(labelledTree, args.outFile)
 
     return
 
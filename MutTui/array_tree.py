@@ -0,0 +1,306 @@
+#Phylogenetic trees stored as arrays with an entry for each clade in preorder, rather than as linked Bio.Phylo clades
+#Trees are read, traversed and written without recursion so very deep trees, e.g. ladder-like outbreak trees, can be used
+#The clades below each clade are consecutive in preorder, so the clades and tips in a subtree are a range of the arrays
+
+import numpy as np
+import re
+from Bio import Phylo
+
+#Tokens in a newick tree: brackets, commas, the terminating semicolon, comments, branch lengths, quoted names,
+#names and whitespace. Comments and names that reach the end of the text read so far may be incomplete
+nexus_tokens = re.compile(r"[(),;]|\[[^\]]*\]?|:[^(),;\[\]\s]*|'[^']*'?|[^(),;\[\]:'\s]+|\s+")
+
+#Statement at the start of the tree in a nexus file
+nexus_tree_start = re.compile(r"\btree\s+[^=;]*=", re.IGNORECASE)
+
+#Names that do not need to be quoted when writing a newick tree
+newick_unquoted_name = re.compile(r"[^\s\(\)\[\]\'\:\;\,]+")
+
+#Converts a numerical internal node name to a confidence value in the same way as Bio.Phylo, returns None if the name is not a number
+def parseConfidence(text):
+    if text.isdigit():
+        return(int(text))
+    try:
+        return(float(text))
+    except ValueError:
+        return(None)
+
+class ArrayTree:
+
+    #names, comments and confidences are lists with None for clades without a value, parents contains the position of the
+    #parent of each clade in preorder, -1 for the root, and branchLengths contains nan for clades without a branch length
+    def __init__(self, names, parents, branchLengths, confidences = None, comments = None):
+        self.names = list(names)
+        self.parent = np.asarray(parents, dtype = np.int64)
+        self.branchLength = np.asarray(branchLengths, dtype = np.float64)
+        self.confidences = list(confidences) if confidences is not None else [None] * len(self.names)
+        self.comments = list(comments) if comments is not None else [None] * len(self.names)
+
+        #The children of clade i are children[childOffsets[i]:childOffsets[i + 1]], in the order of the tree
+        childCounts = np.bincount(self.parent[1:], minlength = len(self.names))
+        self.childOffsets = np.concatenate(([0], np.cumsum(childCounts)))
+        self.children = np.argsort(self.parent[1:], kind = "stable") + 1
+        self.terminal = childCounts == 0
+
+        #The clades below clade i, including clade i, are clades i to subtreeEnd[i] - 1
+        #Sizes are added to the parent of each clade from the last clade in preorder, so every clade is complete before its parent
+        sizes = [1] * len(self.names)
+        parents = self.parent.tolist()
+        for i in range(len(sizes) - 1, 0, -1):
+            sizes[parents[i]] += sizes[i]
+        self.subtreeEnd = np.arange(len(self.names), dtype = np.int64) + np.array(sizes, dtype = np.int64)
+
+    def __len__(self):
+        return(len(self.names))
+
+    #Positions of the children of a clade
+    def getChildren(self, position):
+        return(self.children[self.childOffsets[position]:self.childOffsets[position + 1]])
+
+    #Positions of the tips below a clade, in the order of the tree
+    def getTerminals(self, position = 0):
+        return(np.nonzero(self.terminal[position:self.subtreeEnd[position]])[0] + position)
+
+    #Number of tips below each clade
+    def countTerminals(self):
+        tipsBefore = np.concatenate(([0], np.cumsum(self.terminal)))
+        return(tipsBefore[self.subtreeEnd] - tipsBefore[:-1])
+
+    #Number of branches between the root and each clade, parents are before their children in preorder
+    def getDepths(self):
+        depths = [0] * len(self.names)
+        parents = self.parent.tolist()
+        for i in range(1, len(depths)):
+            depths[i] = depths[parents[i]] + 1
+        return(np.array(depths, dtype = np.int64))
+
+    #Returns a tree with the clades in the given order, order must be a preorder of the tree
+    def reorder(self, order):
+        order = np.asarray(order, dtype = np.int64)
+        positions = np.empty(len(order), dtype = np.int64)
+        positions[order] = np.arange(len(order))
+        parents = np.where(self.parent[order] >= 0, positions[np.maximum(self.parent[order], 0)], -1)
+
+        return(ArrayTree([self.names[i] for i in order], parents, self.branchLength[order],
+                         [self.confidences[i] for i in order], [self.comments[i] for i in order]))
+
+    #Returns the tree with the children of each clade sorted by their number of tips, as Bio.Phylo ladderize and treetime
+    #Children with the same number of tips stay in the same order, clades with the most tips are last unless reverse is True
+    def ladderize(self, reverse = False):
+        tips = self.countTerminals()
+        #Order of the children within each clade
+        childRanks = np.arange(len(self.children)) - self.childOffsets[self.parent[self.children]]
+        if reverse:
+            sortedChildren = self.children[np.lexsort((childRanks, -tips[self.children], self.parent[self.children]))]
+        else:
+            sortedChildren = self.children[np.lexsort((childRanks, tips[self.children], self.parent[self.children]))]
+        sortedChildren = sortedChildren.tolist()
+        offsets = self.childOffsets.tolist()
+
+        #Visit the clades in preorder with the children in their sorted order
+        order = list()
+        toVisit = [0]
+        while toVisit:
+            position = toVisit.pop()
+            order.append(position)
+            toVisit.extend(reversed(sortedChildren[offsets[position]:offsets[position + 1]]))
+
+        return(self.reorder(order))
+
+    #Names internal nodes without a name as in treetime, NODE_ followed by the position of the node among the internal
+    #nodes in preorder. Names already used in the tree are skipped, as in treetime
+    def nameTreetimeNodes(self):
+        usedNames = set([name for name in self.names if name])
+        nodeCount = 0
+        for i in np.nonzero(~self.terminal)[0].tolist():
+            if not self.names[i]:
+                name = "NODE_" + format(nodeCount, "07d")
+                while name in usedNames:
+                    nodeCount += 1
+                    name = "NODE_" + format(nodeCount, "07d")
+                self.names[i] = name
+                usedNames.add(name)
+            nodeCount += 1
+
+        return(self)
+
+    #Converts the tree to a Bio.Phylo tree
+    def toPhylo(self, rooted = False):
+        clades = list()
+        for name, parent, branchLength, confidence, comment in zip(self.names, self.parent.tolist(), self.branchLength.tolist(),
+                                                                   self.confidences, self.comments):
+            clade = Phylo.Newick.Clade(name = name, branch_length = None if np.isnan(branchLength) else branchLength,
+                                       confidence = confidence, comment = comment)
+            clades.append(clade)
+            if parent >= 0:
+                clades[parent].clades.append(clade)
+
+        return(Phylo.Newick.Tree(root = clades[0], rooted = rooted))
+
+    #Creates an array tree from a Bio.Phylo tree
+    @classmethod
+    def fromPhylo(cls, tree):
+        names, parents, branchLengths, confidences, comments = list(), list(), list(), list(), list()
+
+        #Clades still to be visited with the position of their parent, children are added in reverse so they are visited in order
+        toVisit = [(tree.root, -1)]
+        while toVisit:
+            clade, parent = toVisit.pop()
+            parents.append(parent)
+            names.append(clade.name)
+            branchLengths.append(np.nan if clade.branch_length is None else clade.branch_length)
+            confidences.append(clade.confidence)
+            comments.append(getattr(clade, "comment", None))
+            for child in reversed(clade.clades):
+                toVisit.append((child, len(names) - 1))
+
+        return(cls(names, parents, branchLengths, confidences, comments))
+
+    #Converts the tree to a newick string in the same format as Bio.Phylo.write
+    def toNewick(self):
+        #Text of the name, confidence, branch length and comment written after each clade
+        labels = list()
+        for name, branchLength, confidence, comment, terminal in zip(self.names, self.branchLength.tolist(), self.confidences,
+                                                                     self.comments, self.terminal.tolist()):
+            label = name or ""
+            if label and (not newick_unquoted_name.fullmatch(label)):
+                label = "'" + label.replace("\\", "\\\\").replace("'", "\\'") + "'"
+            branchLength = 0.0 if np.isnan(branchLength) else branchLength
+            if terminal or (confidence is None):
+                label += ":%1.5f" % branchLength
+            else:
+                label += "%1.2f:%1.5f" % (confidence, branchLength)
+            if comment:
+                label += "[" + str(comment).replace("[", "\\[").replace("]", "\\]") + "]"
+            labels.append(label)
+
+        #Visit the clades in preorder, opening a bracket before the first child of each clade and closing it after the
+        #last. Closing brackets are added to the visit order as negative positions
+        text = list()
+        children = self.children.tolist()
+        offsets = self.childOffsets.tolist()
+        toVisit = [0]
+        while toVisit:
+            position = toVisit.pop()
+            if position < 0:
+                text.append(")" + labels[-position - 1])
+            elif offsets[position] == offsets[position + 1]:
+                text.append(labels[position])
+            else:
+                text.append("(")
+                toVisit.append(-position - 1)
+                #Commas between the children are added to the visit order as None
+                for i, child in enumerate(reversed(children[offsets[position]:offsets[position + 1]])):
+                    if i != 0:
+                        toVisit.append(None)
+                    toVisit.append(child)
+                continue
+            if toVisit and (toVisit[-1] is None):
+                toVisit.pop()
+                text.append(",")
+
+        return("".join(text) + ";")
+
+#Reads the first tree in a newick or nexus file in chunks, returns an ArrayTree
+#Internal nodes with numerical names have these as their confidence, as in Bio.Phylo
+def readTree(treeFile, treeFormat = "newick", chunkSize = 1048576):
+    names, parents, branchLengths, confidences, comments = [None], [-1], [np.nan], [None], [None]
+    #The clade currently being read and the clades upstream of it
+    current = 0
+    upstream = []
+    #Set if the tree has no brackets around the root, in which case a root is added
+    missingRoot = False
+
+    with open(treeFile, "r") as infile:
+        text = ""
+        #Read until the start of the tree statement in a nexus file
+        if treeFormat == "nexus":
+            treeStart = None
+            while treeStart is None:
+                chunk = infile.read(chunkSize)
+                if not chunk:
+                    raise RuntimeError("No tree found in " + treeFile)
+                text += chunk
+                treeStart = nexus_tree_start.search(text)
+            text = text[treeStart.end():]
+
+        complete = False
+        finalChunk = False
+        while not complete:
+            chunk = infile.read(chunkSize)
+            if not chunk:
+                finalChunk = True
+            text += chunk
+
+            tokens = nexus_tokens.findall(text)
+            #The last token may continue in the next chunk, keep it to be read with the next chunk
+            if tokens and (not finalChunk) and text.endswith(tokens[-1]):
+                text = tokens.pop()
+            else:
+                text = ""
+
+            for t in tokens:
+                if t in "(,":
+                    if t == "(":
+                        upstream.append(current)
+                    elif not upstream:
+                        #A comma outside the brackets, the clades read so far are children of a root that is added at the end
+                        missingRoot = True
+                        upstream.append(-1)
+                    names.append(None)
+                    parents.append(upstream[-1])
+                    branchLengths.append(np.nan)
+                    confidences.append(None)
+                    comments.append(None)
+                    current = len(names) - 1
+                elif t == ")":
+                    if not upstream:
+                        raise RuntimeError("Unbalanced brackets in " + treeFile)
+                    current = upstream.pop()
+                elif t == ";":
+                    complete = True
+                    break
+                elif t[0] == "[":
+                    comments[current] = t[1:-1]
+                elif t[0] == ":":
+                    #Branch length, preceded by a confidence value if present
+                    values = t[1:].split(":")
+                    branchLengths[current] = float(values[-1])
+                    if len(values) > 1:
+                        confidences[current] = float(values[0])
+                elif t[0] == "'":
+                    names[current] = t.strip("'")
+                elif not t.isspace():
+                    names[current] = t
+
+            if finalChunk and (not complete):
+                #The semicolon at the end of a newick tree is optional
+                if (treeFormat == "newick") and (len(upstream) == int(missingRoot)):
+                    complete = True
+                else:
+                    raise RuntimeError("Incomplete tree in " + treeFile)
+
+    if missingRoot:
+        names.insert(0, None)
+        parents = [-1] + [p + 1 for p in parents]
+        branchLengths.insert(0, np.nan)
+        confidences.insert(0, None)
+        comments.insert(0, None)
+
+    tree = ArrayTree(names, parents, branchLengths, confidences, comments)
+
+    #Numerical names of internal nodes are confidence values
+    for i in np.nonzero(~tree.terminal)[0].tolist():
+        if tree.names[i] and (tree.confidences[i] is None):
+            tree.confidences[i] = parseConfidence(tree.names[i])
+            if tree.confidences[i] is not None:
+                tree.names[i] = None
+
+    return(tree)
+
+#Writes an ArrayTree to a newick file in the same format as Bio.Phylo.write
+def writeNewick(tree, treeFile):
+    with open(treeFile, "w") as outFile:
+        outFile.write(tree.toNewick() + "\n")
+
+    return
@@ -0,0 +1,274 @@
+#Runs the MutTui pipeline on each of the datasets in a manifest
+#The jobs are run in a pool of processes that are started once, so modules are only imported once by each process and
+#files used by several jobs, such as the reference genome and GFF, are only read once by each process
+#The manifest is either a tab separated file with a header or a JSON list of jobs. Each job has a name and MutTui run
+#options named as the long options of MutTui run without the leading dashes, e.g. alignment, tree, labels, reference.
+#Options that do not take a value, e.g. strand_bias, are given as true or false
+#Each job is written to its own output directory together with a status record. Jobs that have completed are skipped
+#when the batch is rerun, so failed jobs can be retried without rerunning the jobs that succeeded
+
+import os
+import io
+import sys
+import json
+import time
+import shlex
+import argparse
+import traceback
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .muttui import muttui_parser
+from .profiling import profileCommand, profileStage, countOperations
+from .isvalid import *
+
+from .__init__ import __version__
+
+#Name of the status record in the output directory of each job
+status_file = "muttui_status.json"
+
+
+
+def batch_parser(parser):
+
+    parser.description = "Run the MutTui pipeline on each of the datasets in a manifest"
+
+    #Options for input and output files
+    io_opts = parser.add_argument_group("Input/output")
+    io_opts.add_argument("-m",
+                        "--manifest",
+                        dest = "manifest",
+                        required = True,
+                        help = "Manifest of the jobs to run, either a tab separated file with a header or a JSON list of jobs (.json). " +
+                        "Each job needs a name and the MutTui run options of the job, named as the long options of MutTui run " +
+                        "without the leading dashes, e.g. alignment, tree, labels, reference, conversion, gff. Options that do not " +
+                        "take a value are given as true or false",
+                        type = argparse.FileType("r"))
+    io_opts.add_argument("-o",
+                        "--out_dir",
+                        dest = "output_dir",
+                        required = True,
+                        help = "Location of output directory, should already be created. Each job is written to a directory named " +
+                        "as the job within this directory unless an out_dir is given for the job in the manifest",
+                        type = lambda x: is_valid_folder(parser, x))
+
+    #Other options
+    parser.add_argument("--run_options",
+                        dest = "run_options",
+                        help = "MutTui run options used for every job, in addition to the options in the manifest. Supply these " +
+                        "together in quotes",
+                        type = str,
+                        default = None)
+    parser.add_argument("--workers",
+                        dest = "workers",
+                        help = "Number of jobs run at the same time, each in a separate process. If more than 1, each job is run " +
+                        "with a single MutTui run worker, ignoring --workers given to the job. Default = 1",
+                        type = int,
+                        default = 1)
+    parser.add_argument("--rerun",
+                        dest = "rerun",
+                        help = "Rerun jobs that have already completed. By default, jobs with a completed status record are skipped " +
+                        "so only failed jobs and jobs that have not been run are run",
+                        action = "store_true",
+                        default = False)
+    parser.add_argument("--profile",
+                        dest = "profile",
+                        help = "Write the wall time, CPU time and peak memory of the batch to run_profile.json in the output directory. " +
+                        "To profile each job, add --profile to --run_options",
+                        action = "store_true",
+                        default = False)
+    parser.add_argument("--version",
+                        action = "version",
+                        version = "%(prog)s " + __version__)
+
+    parser.set_defaults(func=batch)
+
+    return parser
+
+
+
+#Returns the parser of MutTui run, used to check and parse the options of each job
+def getRunParser():
+    return(muttui_parser(argparse.ArgumentParser(prog = "MutTui run")))
+
+#Reads the jobs in a manifest, returns a list of dictionaries with options as keys and values as strings
+def readManifest(manifestFile):
+    if manifestFile.name.endswith(".json"):
+        jobs = list()
+        for job in json.load(manifestFile):
+            #Values that are not strings, e.g. true, false and numbers, are converted to the strings used in a tab separated manifest
+            jobs.append({option: (str(value).lower() if isinstance(value, bool) else str(value)) for option, value in job.items() if value is not None})
+    else:
+        lines = [line.rstrip("\r\n") for line in manifestFile if line.strip()]
+        header = lines[0].split("\t")
+        jobs = [dict(zip(header, line.split("\t"))) for line in lines[1:]]
+
+    #Check each job has a unique name
+    names = [job.get("name", "") for job in jobs]
+    if "" in names:
+        raise RuntimeError("Each job in the manifest needs a name")
+    if len(set(names)) != len(names):
+        raise RuntimeError("Job names in the manifest need to be unique")
+
+    return(jobs)
+
+#Converts the options of a job to MutTui run arguments
+def getJobArguments(job, runParser, outputDir, runOptions = None):
+    #Long options of MutTui run without the leading dashes
+    runActions = {o[2:]: action for action in runParser._actions for o in action.option_strings if o.startswith("--")}
+
+    if runOptions:
+        arguments = shlex.split(runOptions)
+    else:
+        arguments = list()
+
+    for option, value in job.items():
+        if (option in ["name", "out_dir"]) or (value == ""):
+            continue
+        if option not in runActions:
+            raise RuntimeError("Job " + job["name"] + " has option " + option + " which is not a MutTui run option")
+        #Options without a value are added if they are true
+        if runActions[option].nargs == 0:
+            if value.lower() in ["true", "yes", "1"]:
+                arguments.append("--" + option)
+            elif value.lower() not in ["false", "no", "0"]:
+                raise RuntimeError("Option " + option + " of job " + job["name"] + " should be true or false")
+        else:
+            arguments += ["--" + option, value]
+
+    arguments += ["--out_dir", outputDir]
+
+    return(arguments)
+
+#Reads the status record of a job, returns None if the job has not been run
+def readStatus(outputDir):
+    try:
+        with open(os.path.join(outputDir, status_file)) as statusFile:
+            return(json.load(statusFile))
+    except (OSError, ValueError):
+        return(None)
+
+#Writes the status record of a job, the record is moved into place so it is never partially written
+def writeStatus(outputDir, status):
+    with open(os.path.join(outputDir, status_file + ".tmp"), "w") as statusFile:
+        json.dump(status, statusFile, indent = 2)
+    os.replace(os.path.join(outputDir, status_file + ".tmp"), os.path.join(outputDir, status_file))
+
+    return
+
+#Runs a single job, the output of the job is written to muttui.log in its output directory
+#Returns the status record of the job, errors in the job are recorded as a failed job rather than raised
+#If inWorker is True the job is run in a worker process of the batch. Worker processes cannot start their own processes
+#on all versions of Python, so the job is run with a single worker
+def runJob(name, arguments, outputDir, inWorker = False):
+    status = {"name": name, "arguments": arguments, "status": "running", "start": time.time()}
+    writeStatus(outputDir, status)
+
+    #MutTui run sets the cache directory for its run, this is restored so it is not used by later jobs in the process
+    cacheDir = os.environ.get("MUTTUI_CACHE_DIR")
+
+    args = None
+    with open(os.path.join(outputDir, "muttui.log"), "w") as log:
+        try:
+            with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+                args = getRunParser().parse_args(arguments)
+                if inWorker and (args.workers > 1):
+                    print("Running with 1 worker rather than " + str(args.workers) + " as the batch is run with more than 1 worker")
+                    args.workers = 1
+                args.func(args)
+            status["status"] = "complete"
+        #Invalid options exit MutTui run with an error in muttui.log
+        except (Exception, SystemExit):
+            status["status"] = "failed"
+            status["error"] = traceback.format_exc()
+            log.write(status["error"])
+
+    if cacheDir is None:
+        os.environ.pop("MUTTUI_CACHE_DIR", None)
+    else:
+        os.environ["MUTTUI_CACHE_DIR"] = cacheDir
+
+    #Close the input files of the job
+    if args is not None:
+        for value in vars(args).values():
+            if isinstance(value, io.IOBase) and (value not in [sys.stdin, sys.stdout, sys.stderr]):
+                value.close()
+
+    status["end"] = time.time()
+    writeStatus(outputDir, status)
+
+    return(status)
+
+@profileCommand("batch", lambda args: args.output_dir)
+def batch(args):
+
+    jobs = readManifest(args.manifest)
+    runParser = getRunParser()
+
+    #Output directory and MutTui run arguments of each job
+    jobOutputs = dict()
+    jobArguments = dict()
+    for job in jobs:
+        jobOutputs[job["name"]] = job.get("out_dir") or os.path.join(args.output_dir, job["name"])
+        os.makedirs(jobOutputs[job["name"]], exist_ok = True)
+        jobArguments[job["name"]] = getJobArguments(job, runParser, jobOutputs[job["name"]], args.run_options)
+
+    #Status of each job, jobs that have completed are skipped unless --rerun is specified
+    statuses = dict()
+    toRun = list()
+    for job in jobs:
+        status = readStatus(jobOutputs[job["name"]])
+        if (not args.rerun) and (status is not None) and (status["status"] == "complete"):
+            statuses[job["name"]] = status
+        else:
+            toRun.append(job["name"])
+
+    print("Running " + str(len(toRun)) + " of " + str(len(jobs)) + " jobs, " + str(len(jobs) - len(toRun)) + " already completed")
+
+    try:
+        with profileStage("jobs"):
+            if args.workers > 1:
+                with ProcessPoolExecutor(max_workers = args.workers) as executor:
+                    futures = {executor.submit(runJob, name, jobArguments[name], jobOutputs[name], True): name for name in toRun}
+                    for future in as_completed(futures):
+                        name = futures[future]
+                        try:
+                            statuses[name] = future.result()
+                        #The worker running the job failed, e.g. BrokenProcessPool if it was killed, so the job is recorded as failed
+                        except Exception:
+                            statuses[name] = {"name": name, "arguments": jobArguments[name], "status": "failed", "error": traceback.format_exc(),
+                                              "end": time.time()}
+                            writeStatus(jobOutputs[name], statuses[name])
+                        print("Job " + name + " " + statuses[name]["status"])
+            else:
+                for name in toRun:
+                    statuses[name] = runJob(name, jobArguments[name], jobOutputs[name])
+                    print("Job " + name + " " + statuses[name]["status"])
+        countOperations("jobs_run", len(toRun))
+    finally:
+        #Write the status of every job in the manifest, jobs without a status were not run as the batch was stopped
+        with open(os.path.join(args.output_dir, "batch_status.csv"), "w") as outFile:
+            outFile.write("Job,Status,Output_directory\n")
+            for job in jobs:
+                outFile.write(job["name"] + "," + statuses.get(job["name"], {"status": "not_run"})["status"] + "," + jobOutputs[job["name"]] + "\n")
+
+    failed = [job["name"] for job in jobs if statuses[job["name"]]["status"] != "complete"]
+    if failed:
+        print(str(len(failed)) + " jobs failed: " + ",".join(failed) + ". Rerun the batch to retry the failed jobs")
+
+    return
+
+
+
+def main():
+    # set up and parse arguments
+    parser = argparse.ArgumentParser()
+    parser = batch_parser(parser)
+    args = parser.parse_args()
+
+    # run batch
+    args.func(args)
+
+    return
+
+if __name__ == "__main__":
+    main()
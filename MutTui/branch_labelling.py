@@ -1,7 +1,10 @@
 #Functions for labelling branches into spectrum categories
 
 import operator
+import numpy as np
 from Bio import Phylo
+from .tree_index import TreeIndex
+from .array_tree import readTree
 
 #Converts taxon labels to a dictionary with labels as keys and taxa as values
 def getLabelDict(tree, labels):
@@ -32,7 +35,7 @@ def getLabelDict(tree, labels):
     labelDict[otherLabel] = []
 
     #Iterate through the taxa and add to labelDict if not already included
-    for eachTaxon in tree.get_terminals():
+    for eachTaxon in TreeIndex(tree).getTerminals():
         if eachTaxon.name not in analysedTaxa:
             labelDict[otherLabel].append(eachTaxon.name)
     
@@ -44,7 +47,7 @@ def labelAllBranches(tree):
     treeLabels = ["A"]
 
     #Iterate through the branches and add the label A to them
-    for clade in tree.find_clades():
+    for clade in TreeIndex(tree).clades:
         clade.clade_label = "A"
     
     return(tree, treeLabels)
@@ -55,7 +58,10 @@ def labelBranchesTreetime(tree):
     #Appended with each internal node
     iterator = 0
 
-    for clade in tree.find_clades():
+    #Names already in the tree, treetime skips node labels that are already used
+    usedNames = set([clade.name for clade in TreeIndex(tree).clades if clade.name])
+
+    for clade in TreeIndex(tree).clades:
         if not clade.is_terminal():
             #Check if the clade already has a name in the input tree, if it does then keep that name
             #If it doesn't, name it with its node number in the tree
@@ -63,7 +69,10 @@ def labelBranchesTreetime(tree):
             #nodes without labels will be given a node label. This is how treetime deals with partially labelled
             #trees so will enable matching of branch names with the branch_mutations.txt file
             if not clade.name:
+                while "NODE_" + str(iterator).zfill(7) in usedNames:
+                    iterator += 1
                 clade.name = "NODE_" + str(iterator).zfill(7)
+                usedNames.add(clade.name)
             iterator += 1
     
     return(tree)
@@ -104,53 +113,64 @@ def rootState(tree, confidence, gtr, root_state):
         rState = attributes[(max(prob.items(), key = operator.itemgetter(1))[0]).strip()]
 
     #Add the label to the root
-    for clade in tree.find_clades():
-        #Check if the clade is the root
-        if len(tree.get_path(clade)) == 0:
-            clade.comment = '[&group="' + rState + '"]'
+    tree.root.comment = '[&group="' + rState + '"]'
     
     return(tree)
 
+#Identifies each clade of a tree by the tips below it, used to match clades between trees
+#Each tip has a random 64 bit hash in tipHashes and each clade is identified by the XOR of the hashes of its tips and its number
+#of tips. Takes the names of the clades in preorder, whether each clade is a tip and the end of each subtree in preorder
+#The tips below a clade are consecutive in preorder so the hash of each clade is found from cumulative XORs of the tip hashes
+def getCladeHashes(names, terminal, subtreeEnd, tipHashes):
+    values = np.zeros(len(names), dtype = np.uint64)
+    values[terminal] = [tipHashes[names[i]] for i in np.nonzero(terminal)[0].tolist()]
+    cumulativeHashes = np.concatenate((np.zeros(1, dtype = np.uint64), np.bitwise_xor.accumulate(values)))
+    cumulativeTips = np.concatenate(([0], np.cumsum(terminal)))
+    starts = np.arange(len(names))
+
+    return(list(zip((cumulativeHashes[subtreeEnd] ^ cumulativeHashes[starts]).tolist(), (cumulativeTips[subtreeEnd] - cumulativeTips[starts]).tolist())))
+
 #Transfers labels from a tree labelled with label_tree.py to the treetime reconstruction tree
 def getLabelledTreeLabels(tree, treeFile):
-    nodeTree = Phylo.read(treeFile.name, "newick")
+    nodeTree = readTree(treeFile.name, "newick")
 
-    #Will be incremented with each node
-    nodeIterator = 1
-
-    #Extract nodeTree to a dictionary with nodes as keys and labels and tips as values
-    #Will use this to transfer labels from nodeTree to the main tree by matching the descendent tips
+    #Transfer labels from nodeTree to the main tree by matching the descendent tips
     #Cannot use the same labels as treetime often iterates through the branches in a different order
-    nodeTips = {}
-
-    #Iterate through the clades in nodeTree and add to nodeTips
-    for clade in nodeTree.find_clades():
-        if clade.is_terminal():
-            nodeTips["Node" + str(nodeIterator)] = [clade.name.split("____")[1], [clade.name.split("____")[0]]]
+    #The label of each clade in nodeTree, tips are labelled with their name followed by ____ and their label
+    nodeTips = list()
+    nodeLabels = list()
+    for name, terminal in zip(nodeTree.names, nodeTree.terminal.tolist()):
+        if terminal:
+            nodeTips.append(name.split("____")[0])
+            nodeLabels.append(name.split("____")[1])
         else:
-            nodeTips["Node" + str(nodeIterator)] = [clade.name, []]
-            #Add the tips in the clade to the empty list
-            for tip in clade.get_terminals():
-                nodeTips["Node" + str(nodeIterator)][1].append(tip.name.split("____")[0])
-        nodeIterator += 1
+            nodeTips.append(name)
+            nodeLabels.append(name)
+
+    treeIndex = TreeIndex(tree)
+    treeTips = [clade.name for clade in treeIndex.clades]
+
+    #Give each tip in the trees a random hash, the same in each run
+    tipNames = sorted(set([nodeTips[i] for i in np.nonzero(nodeTree.terminal)[0].tolist()] +
+                          [treeTips[i] for i in np.nonzero(treeIndex.terminal)[0].tolist()]))
+    tipHashes = dict(zip(tipNames, np.random.default_rng(0).integers(0, 2**64, size = len(tipNames), dtype = np.uint64)))
+
+    #Clades in nodeTree keyed by their tips, if clades have the same tips the first in preorder is used
+    nodeHashes = dict()
+    for i, cladeHash in enumerate(getCladeHashes(nodeTips, nodeTree.terminal, nodeTree.subtreeEnd, tipHashes)):
+        if cladeHash not in nodeHashes:
+            nodeHashes[cladeHash] = i
 
     #Will be filled with the unique labels from the tree
     treeLabels = []
 
     #Iterate through the clades, identify the corresponding clade in nodeTree from the descendent tips
     #add the label as clade_label and add unique labels to treeLabels
-    for clade in tree.find_clades():
-        cladeTips = []
-        for tip in clade.get_terminals():
-            cladeTips.append(tip.name)
-        
-        #Identify the corresponding clade in nodeTree
-        for eachClade in nodeTips:
-            if sorted(nodeTips[eachClade][1]) == sorted(cladeTips):
-                clade.clade_label = nodeTips[eachClade][0]
-                if nodeTips[eachClade][0] not in treeLabels:
-                    treeLabels.append(nodeTips[eachClade][0])
-                break
+    for clade, cladeHash in zip(treeIndex.clades, getCladeHashes(treeTips, treeIndex.terminal, treeIndex.subtreeEnd, tipHashes)):
+        if cladeHash in nodeHashes:
+            clade.clade_label = nodeLabels[nodeHashes[cladeHash]]
+            if clade.clade_label not in treeLabels:
+                treeLabels.append(clade.clade_label)
     
     return(tree, treeLabels)
 
@@ -160,7 +180,7 @@ def labelBranchesNames(tree):
     treeLabels = []
 
     #Iterate through the branches and add the label A to them
-    for clade in tree.find_clades():
+    for clade in TreeIndex(tree).clades:
         clade.clade_label = clade.name
     
     return(tree, treeLabels)
@@ -170,7 +190,7 @@ def labelBranchesNames(tree):
 def labelBranchesMugration(tree, mugrationTree):
     #Extract the mugration tree to a dictionary with clade names as keys and labels as values
     cladeDict = {}
-    for clade in mugrationTree.find_clades():
+    for clade in TreeIndex(mugrationTree).clades:
         if clade.name:
             cladeDict[clade.name] = clade.comment.split('="')[1].split('"')[0]
         else:
@@ -180,7 +200,7 @@ def labelBranchesMugration(tree, mugrationTree):
     treeLabels = list(set(cladeDict.values()))
 
     #Iterate through the clades in the mutation tree and add their label
-    for clade in tree.find_clades():
+    for clade in TreeIndex(tree).clades:
         if clade.name:
             clade.clade_label = cladeDict[clade.name]
         else:
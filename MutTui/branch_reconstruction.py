@@ -0,0 +1,192 @@
+#Reconstructs the mutational spectra of the branches of the tree
+#The tree can be split into subtrees that are reconstructed in separate processes. The mutations on the branches are
+#written to text tables and the channels of the mutations added to the spectra are kept with their branch, so the
+#reconstructions of the subtrees can be combined in the order of the tree and give the same output as a single process
+
+import io
+import numpy as np
+from concurrent.futures import Future
+from .reconstruct_spectrum import *
+from .spectrum import Spectrum, strands
+from .output_tables import TableWriter
+from .tree_index import buildSubtree
+
+class BranchReconstruction:
+
+    #branchCategories contains the label of each branch with mutations, None if the branch is not included in a spectrum
+    #geneIndex is only used if synonymous or strandBias are True
+    def __init__(self, branchCategories, referenceLength, geneIndex, rna, synonymous, strandBias):
+        self.branchCategories = branchCategories
+        self.referenceLength = referenceLength
+        self.geneIndex = geneIndex
+        self.rna = rna
+        self.synonymous = synonymous
+        self.strandBias = strandBias
+
+        #Spectra used to identify the channels of the mutations, the mutations are not added to these
+        if rna:
+            self.spectrum = Spectrum("RNA192")
+        else:
+            self.spectrum = Spectrum("SBS96")
+        self.doubleSpectrum = Spectrum("DBS78")
+        self.sbSpectrum = Spectrum("SB192")
+
+        #The 4 nucleotides, used to check if mutated, upstream and downstream bases are nucleotides
+        self.nucleotides = ["A","C","G","T"]
+
+        self.newTables()
+
+    #Starts new tables of mutations and a new list of the channels of the branches
+    def newTables(self):
+        self.outMutationsNotUsed = TableWriter(io.StringIO(), None)
+        self.outAllMutations = TableWriter(io.StringIO(), None)
+        self.outAllDouble = TableWriter(io.StringIO(), None)
+
+        #Label and SBS, strand bias and DBS channels of each reconstructed branch
+        self.branchChannels = list()
+
+    #Returns the reconstructed branches as the text of mutations_not_included.csv, all_included_mutations.csv and
+    #all_included_double_substitutions.csv without headers and the list of branch channels, then starts new tables
+    def getResults(self):
+        tables = list()
+        for table in [self.outMutationsNotUsed, self.outAllMutations, self.outAllDouble]:
+            table.flush()
+            tables.append(table.outFile.getvalue())
+        branchChannels = self.branchChannels
+
+        self.newTables()
+
+        return(tables, branchChannels)
+
+    #Identifies the contextual mutations on a branch, updatedReference is the reference at the start of the branch
+    #Returns the mutations retained on the branch, these are the mutations applied to the reference of the downstream branches
+    def reconstructBranch(self, clade, branchMutations, updatedReference):
+        #The label of the current branch, this will be None if the branch is not included in a spectrum
+        branchCategory = self.branchCategories[clade.name]
+
+        #Write the mutations on the branch to the not used file
+        if branchCategory is None:
+            self.outMutationsNotUsed.addRows(*formatMutationArray(branchMutations), clade.name, "Label_changes_on_branch")
+            return(branchMutations)
+
+        #Extract double substitutions, remove mutations at the ends of the genome or not involving 2 nucleotides
+        branchMutations, doubleSubstitutions = filterMutations(branchMutations, clade, self.nucleotides, self.referenceLength, self.outMutationsNotUsed)
+
+        #Check if only synonymous mutations should be included, if so filter the mutations
+        if self.synonymous:
+            branchMutations = extractSynonymous(branchMutations, updatedReference, self.geneIndex)
+
+        #Extract the upstream and downstream bases of all mutations along the branch
+        upstreamCodes, downstreamCodes, nucleotideContext = getBranchContexts(branchMutations, updatedReference)
+        referenceCodes = reduce_array[branchMutations["ref"]]
+        mutantCodes = reduce_array[branchMutations["alt"]]
+
+        #Identify the spectrum channel of each mutation, this will be the reverse complement channel
+        #for half of DNA mutations, the mutations with nucleotide contexts are added to the spectrum
+        channels, forwardChannels = self.spectrum.getChannels(upstreamCodes, referenceCodes, mutantCodes, downstreamCodes)
+        sbsChannels = channels[nucleotideContext]
+
+        #Write the mutations whose upstream or downstream nucleotides are not A, C, G or T to the not used file
+        self.outMutationsNotUsed.addRows(*formatMutationArray(branchMutations[~nucleotideContext]), clade.name, "Surrounding_position_not_nucleotide")
+
+        #Write the included mutations. The forward mutation is written for all RNA mutations and half of DNA mutations,
+        #the remaining mutations are written as the reverse complement
+        includedMutations = branchMutations[nucleotideContext]
+        forward = forwardChannels[nucleotideContext]
+        upstreamASCII = base_array[upstreamCodes[nucleotideContext]]
+        downstreamASCII = base_array[downstreamCodes[nucleotideContext]]
+        references = asciiToString(np.where(forward, includedMutations["ref"], complement_ascii[includedMutations["ref"]]))
+        mutants = asciiToString(np.where(forward, includedMutations["alt"], complement_ascii[includedMutations["alt"]]))
+        upstreamBases = asciiToString(np.where(forward, upstreamASCII, complement_ascii[downstreamASCII]))
+        downstreamBases = asciiToString(np.where(forward, downstreamASCII, complement_ascii[upstreamASCII]))
+        substitutions = [u + "[" + r + ">" + m + "]" + d for u, r, m, d in zip(upstreamBases, references, mutants, downstreamBases)]
+        self.outAllMutations.addRows(*formatMutations(references, includedMutations["alignment_position"], includedMutations["genome_position"], mutants), substitutions, clade.name)
+
+        #If calculating strand bias, extract the strand bias of the mutations with nucleotide contexts, the mutations with
+        #a strand are added to the strand bias spectrum. Mutations that are intergenic or in multiple genes on
+        #different strands are excluded
+        if self.strandBias:
+            strandBias = getStrandBias(branchMutations, self.geneIndex)
+
+            #Strand code of each mutation in the strand bias spectrum, -1 if the mutation is not included
+            strandCodes = np.full(len(branchMutations), -1, dtype = int)
+            for i, strand in enumerate(strands):
+                strandCodes[(strandBias == strand) & nucleotideContext] = i
+
+            sbChannels = self.sbSpectrum.getChannels(strandCodes, upstreamCodes, referenceCodes, mutantCodes, downstreamCodes)[0]
+            sbChannels = sbChannels[strandCodes >= 0]
+        else:
+            sbChannels = None
+
+        #Identify the channels of the double substitutions
+        ####No double substitution for RNA currently, will be updated
+        if (len(doubleSubstitutions) > 0) and (not self.rna):
+            #The first and second mutation of each double substitution, an unpaired final mutation is not included
+            pairedLength = 2 * (len(doubleSubstitutions) // 2)
+            firstMutations = doubleSubstitutions[0:pairedLength:2]
+            secondMutations = doubleSubstitutions[1:pairedLength:2]
+
+            #Base codes of the reference and mutant bases of the 2 mutations in each double substitution
+            firstReferenceCodes = reduce_array[firstMutations["ref"]]
+            secondReferenceCodes = reduce_array[secondMutations["ref"]]
+            firstMutantCodes = reduce_array[firstMutations["alt"]]
+            secondMutantCodes = reduce_array[secondMutations["alt"]]
+            nucleotideDouble = (firstReferenceCodes < 4) & (secondReferenceCodes < 4) & (firstMutantCodes < 4) & (secondMutantCodes < 4)
+
+            doubleChannels, forwardDouble = self.doubleSpectrum.getChannels(firstReferenceCodes, secondReferenceCodes, firstMutantCodes, secondMutantCodes)
+            dbsChannels = doubleChannels[nucleotideDouble]
+
+            #Write both mutations of the double substitutions that do not involve two nucleotides to the unused file
+            notNucleotidePairs = np.nonzero(~nucleotideDouble)[0]
+            notNucleotideMutations = doubleSubstitutions[np.column_stack((2 * notNucleotidePairs, 2 * notNucleotidePairs + 1)).ravel()]
+            self.outMutationsNotUsed.addRows(*formatMutationArray(notNucleotideMutations), clade.name, "Double_substitution_does_not_involve_two_nucleotides")
+
+            #Write the included double substitutions, as the reverse complement of both mutations if forwardDouble is False
+            forward = forwardDouble[nucleotideDouble]
+            first = firstMutations[nucleotideDouble]
+            second = secondMutations[nucleotideDouble]
+            references = [r1 + r2 for r1, r2 in zip(asciiToString(np.where(forward, first["ref"], complement_ascii[second["ref"]])), asciiToString(np.where(forward, second["ref"], complement_ascii[first["ref"]])))]
+            mutants = [m1 + m2 for m1, m2 in zip(asciiToString(np.where(forward, first["alt"], complement_ascii[second["alt"]])), asciiToString(np.where(forward, second["alt"], complement_ascii[first["alt"]])))]
+            substitutions = [r + ">" + m for r, m in zip(references, mutants)]
+            self.outAllDouble.addRows(*formatMutations(references, first["alignment_position"], first["genome_position"], mutants), substitutions, clade.name, np.where(forward, "Forward", "Reverse").tolist())
+        else:
+            dbsChannels = None
+
+        self.branchChannels.append((branchCategory, sbsChannels, sbChannels, dbsChannels))
+
+        return(branchMutations)
+
+#Reconstructs the branches in a subtree, run in a separate process for each subtree
+#names and parents describe the subtree, see TreeIndex.getSubtreeArrays, referenceArray contains the base codes of
+#the reference at the start of the branch leading to the subtree
+#branchMutationDict and branchCategories contain the mutations and labels of the branches in the subtree
+#Returns the results of BranchReconstruction.getResults
+def reconstructSubtree(names, parents, referenceArray, branchMutationDict, branchCategories, referenceLength, geneIndex, rna, synonymous, strandBias):
+    reconstruction = BranchReconstruction(branchCategories, referenceLength, geneIndex, rna, synonymous, strandBias)
+
+    #The retained mutations of each branch are applied to the reference of the downstream branches
+    for clade, updatedReference in iterateBranchReferences(None, branchMutationDict, referenceArray, subtree = buildSubtree(names, parents)):
+        if clade.name in branchMutationDict:
+            branchMutationDict[clade.name] = reconstruction.reconstructBranch(clade, branchMutationDict[clade.name], updatedReference)
+
+    return(reconstruction.getResults())
+
+#Adds a reconstruction from BranchReconstruction.getResults, or a future returning one, to the output tables and spectra
+#tables are the TableWriters of mutations_not_included.csv, all_included_mutations.csv and all_included_double_substitutions.csv
+#The spectra are dictionaries or BranchSpectra with the branch categories as keys, sbSpectra is None if strand bias is not calculated
+def addReconstruction(reconstruction, tables, spectra, sbSpectra, doubleSpectra):
+    if isinstance(reconstruction, Future):
+        reconstruction = reconstruction.result()
+    tableTexts, branchChannels = reconstruction
+
+    for table, text in zip(tables, tableTexts):
+        table.addText(text)
+
+    for branchCategory, sbsChannels, sbChannels, dbsChannels in branchChannels:
+        spectra[branchCategory].addChannels(sbsChannels)
+        if sbChannels is not None:
+            sbSpectra[branchCategory].addChannels(sbChannels)
+        if dbsChannels is not None:
+            doubleSpectra[branchCategory].addChannels(dbsChannels)
+
+    return
@@ -0,0 +1,253 @@
+#Stores results that are slow to calculate so they can be reused by later runs
+#Results are saved in a cache directory and identified by a hash of the content they were calculated from
+#The cache directory is ~/.cache/muttui by default and can be changed with the MUTTUI_CACHE_DIR environment variable,
+#setting MUTTUI_CACHE_DIR to an empty string turns off the cache
+
+import os
+import functools
+import hashlib
+import shutil
+import tempfile
+import numpy as np
+
+#Returns the cache directory, None if the cache is turned off
+def getCacheDir(cacheDir = None):
+    if cacheDir is None:
+        cacheDir = os.environ.get("MUTTUI_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "muttui"))
+
+    if cacheDir == "":
+        return(None)
+    else:
+        return(cacheDir)
+
+#Hashes the given strings or bytes, used as the key of a cached result
+def hashContent(*contents):
+    h = hashlib.sha256()
+    for content in contents:
+        if isinstance(content, str):
+            content = content.encode()
+        h.update(content)
+        #Separate the contents so they are not hashed as a single string
+        h.update(b"\0")
+
+    return(h.hexdigest())
+
+#Path of a cached result within the cache directory
+def getCachePath(cacheDir, section, key, extension):
+    return(os.path.join(cacheDir, section, key + extension))
+
+#Loads a cached array, returns None if the array is not in the cache or cannot be read
+def loadCachedArray(section, key, cacheDir = None):
+    cacheDir = getCacheDir(cacheDir)
+    if cacheDir is None:
+        return(None)
+
+    try:
+        return(np.load(getCachePath(cacheDir, section, key, ".npy"), allow_pickle = False))
+    except (OSError, ValueError):
+        return(None)
+
+#Saves an array to the cache. The array is written to a temporary file and moved into place so runs
+#sharing the cache directory never read a partially written file. Failing to write to the cache is not an error
+def saveCachedArray(values, section, key, cacheDir = None):
+    cacheDir = getCacheDir(cacheDir)
+    if cacheDir is None:
+        return
+
+    tmpName = None
+    try:
+        os.makedirs(os.path.join(cacheDir, section), exist_ok = True)
+        tmpFile, tmpName = tempfile.mkstemp(dir = os.path.join(cacheDir, section), suffix = ".tmp")
+        with os.fdopen(tmpFile, "wb") as outFile:
+            np.save(outFile, values, allow_pickle = False)
+        os.replace(tmpName, getCachePath(cacheDir, section, key, ".npy"))
+    except OSError:
+        if tmpName is not None and os.path.exists(tmpName):
+            os.remove(tmpName)
+        return
+
+    return
+
+#Loads a cached set of named arrays, returns None if the arrays are not in the cache or cannot be read
+def loadCachedArrays(section, key, cacheDir = None):
+    cacheDir = getCacheDir(cacheDir)
+    if cacheDir is None:
+        return(None)
+
+    try:
+        with np.load(getCachePath(cacheDir, section, key, ".npz"), allow_pickle = False) as cached:
+            return({name: cached[name] for name in cached.files})
+    except (OSError, ValueError, KeyError):
+        return(None)
+
+#Saves a dictionary of named arrays to the cache in the same way as saveCachedArray
+def saveCachedArrays(arrays, section, key, cacheDir = None):
+    cacheDir = getCacheDir(cacheDir)
+    if cacheDir is None:
+        return
+
+    tmpName = None
+    try:
+        os.makedirs(os.path.join(cacheDir, section), exist_ok = True)
+        tmpFile, tmpName = tempfile.mkstemp(dir = os.path.join(cacheDir, section), suffix = ".tmp")
+        with os.fdopen(tmpFile, "wb") as outFile:
+            np.savez(outFile, **arrays)
+        os.replace(tmpName, getCachePath(cacheDir, section, key, ".npz"))
+    except OSError:
+        if tmpName is not None and os.path.exists(tmpName):
+            os.remove(tmpName)
+        return
+
+    return
+
+#Loads an array saved next to the file it was calculated from, returns None if the array has not been saved, was saved
+#from a file with a different size or contents or cannot be read. Arrays are not loaded if the cache is turned off
+#The contents are compared with a hash rather than the modification time, which can be kept when a file is changed,
+#copied or restored
+def loadAdjacentArray(fileName, cacheDir = None):
+    if getCacheDir(cacheDir) is None:
+        return(None)
+
+    try:
+        with np.load(fileName + ".npz", allow_pickle = False) as saved:
+            if (int(saved["size"]) != os.path.getsize(fileName)) or (str(saved["hash"]) != hashFiles(fileName)):
+                return(None)
+            return(saved["values"])
+    except (OSError, ValueError, KeyError):
+        return(None)
+
+#Saves an array next to the file it was calculated from in the same way as saveCachedArray, e.g. conversion.txt.npz
+#for conversion.txt, along with the size and a hash of the file. Failing to write the array, e.g. to a read only
+#directory, is not an error
+def saveAdjacentArray(values, fileName, cacheDir = None):
+    if getCacheDir(cacheDir) is None:
+        return
+
+    tmpName = None
+    try:
+        size = os.path.getsize(fileName)
+        contentHash = hashFiles(fileName)
+        tmpFile, tmpName = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(fileName)), suffix = ".tmp")
+        with os.fdopen(tmpFile, "wb") as outFile:
+            np.savez(outFile, values = values, size = np.int64(size), hash = np.array(contentHash))
+        os.replace(tmpName, fileName + ".npz")
+    except OSError:
+        if tmpName is not None and os.path.exists(tmpName):
+            os.remove(tmpName)
+        return
+
+    return
+
+#Keeps the results of a function that reads a file in memory so the file is only read once by each process while it
+#is unchanged. Used for input files shared by the jobs of MutTui batch, e.g. the reference genome and GFF
+def memoizeFile(maxsize = 8):
+    def decorator(function):
+        @functools.lru_cache(maxsize = maxsize)
+        def cached(fileName, mtime, size):
+            return(function(fileName))
+
+        @functools.wraps(function)
+        def memoized(fileName):
+            try:
+                stat = os.stat(fileName)
+            except OSError:
+                return(function(fileName))
+            return(cached(os.path.abspath(fileName), stat.st_mtime_ns, stat.st_size))
+
+        return(memoized)
+
+    return(decorator)
+
+#Reads a binary file in chunks of chunkSize bytes
+def readChunks(fileName, chunkSize = 1048576):
+    with open(fileName, "rb") as inFile:
+        for chunk in iter(lambda: inFile.read(chunkSize), b""):
+            yield(chunk)
+
+#Hashes the given iterables of bytes, each is hashed in the same way as a file with the same contents by hashFiles
+def hashChunks(*contents):
+    h = hashlib.sha256()
+    for chunks in contents:
+        for chunk in chunks:
+            h.update(chunk)
+        h.update(b"\0")
+
+    return(h.hexdigest())
+
+#Hashes the contents of the given files, reading them in chunks so large files are not loaded into memory
+def hashFiles(*fileNames, chunkSize = 1048576):
+    return(hashChunks(*[readChunks(fileName, chunkSize) for fileName in fileNames]))
+
+#Copies cached files to outputDir, returns False if the files are not in the cache
+#The time of the cached files is updated so recently used files are kept when the cache is reduced with evictCache
+def loadCachedFiles(fileNames, outputDir, section, key, cacheDir = None):
+    cacheDir = getCacheDir(cacheDir)
+    if cacheDir is None:
+        return(False)
+
+    cachePath = getCachePath(cacheDir, section, key, "")
+    try:
+        for fileName in fileNames:
+            shutil.copyfile(os.path.join(cachePath, fileName), os.path.join(outputDir, fileName))
+        os.utime(cachePath)
+    except OSError:
+        return(False)
+
+    return(True)
+
+#Saves files from inputDir to the cache. The files are copied to a temporary directory that is moved into place so runs
+#sharing the cache directory never read partially written files. Failing to write to the cache is not an error
+def saveCachedFiles(fileNames, inputDir, section, key, cacheDir = None):
+    cacheDir = getCacheDir(cacheDir)
+    if cacheDir is None:
+        return
+
+    tmpDir = None
+    try:
+        os.makedirs(os.path.join(cacheDir, section), exist_ok = True)
+        tmpDir = tempfile.mkdtemp(dir = os.path.join(cacheDir, section), suffix = ".tmp")
+        for fileName in fileNames:
+            shutil.copyfile(os.path.join(inputDir, fileName), os.path.join(tmpDir, fileName))
+        os.replace(tmpDir, getCachePath(cacheDir, section, key, ""))
+    except OSError:
+        #The files may have been saved by another run using the same cache directory
+        if tmpDir is not None:
+            shutil.rmtree(tmpDir, ignore_errors = True)
+        return
+
+    return
+
+#Removes the least recently used results from a section of the cache until the section is at most maximumSize bytes
+def evictCache(section, maximumSize, cacheDir = None):
+    cacheDir = getCacheDir(cacheDir)
+    if cacheDir is None:
+        return
+
+    #Size and time of last use of each result in the section
+    results = list()
+    try:
+        for entry in os.scandir(os.path.join(cacheDir, section)):
+            if entry.name.endswith(".tmp"):
+                continue
+            if entry.is_dir():
+                size = sum([f.stat().st_size for f in os.scandir(entry.path) if f.is_file()])
+            else:
+                size = entry.stat().st_size
+            results.append((entry.stat().st_mtime, size, entry.path))
+    except OSError:
+        return
+
+    totalSize = sum([r[1] for r in results])
+    for time, size, path in sorted(results):
+        if totalSize <= maximumSize:
+            break
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except OSError:
+            continue
+        totalSize -= size
+
+    return
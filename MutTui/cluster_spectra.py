@@ -13,6 +13,7 @@ import matplotlib
 matplotlib.use('AGG')
 from matplotlib import pyplot as plt
 from .plot_spectrum import convertSpectrumDictProportions
+from .profiling import profileCommand, profileStage, countOperations
 
 #Converts a set of spectra into a list of dictionaries
 def convertSpectraList(spectra, labels):
@@ -269,6 +270,7 @@ def extractUMAP(sL, labels, colours, output_dir):
     umapFig.figure.savefig(output_dir + "sample_umap.pdf")
 
 
+@profileCommand("cluster", lambda args: args.output_dir)
 def cluster_spectra(args):
     #If using labels, verify that there are the same number of labels as spectra
     if args.labels:
@@ -279,48 +281,54 @@ def cluster_spectra(args):
     args.output_dir = os.path.join(args.output_dir, "")
 
     #If multiple spectra are provided, extract these to lists
-    if args.spectra:
-        spectraList, sampleNames = convertSpectraList(args.spectra, args.labels)
-    else:
-        #Extract the catalog into spectraList
-        spectraList, sampleNames = convertCatalog(args.catalog)
+    with profileStage("spectra_import"):
+        if args.spectra:
+            spectraList, sampleNames = convertSpectraList(args.spectra, args.labels)
+        else:
+            #Extract the catalog into spectraList
+            spectraList, sampleNames = convertCatalog(args.catalog)
+    countOperations("spectra_read", len(spectraList))
     
     #Calculate distances between all pairs of spectra
-    distances = getDistanceMatrix(spectraList)
+    with profileStage("distances"):
+        distances = getDistanceMatrix(spectraList)
 
     #Write cosine similarity and distances
-    s_out = open(args.output_dir + "cosine_similarity.csv", "w")
-    d_out = open(args.output_dir + "cosine_distances.csv", "w")
-    s_out.write("Sample")
-    d_out.write("Sample")
-    for sample in sampleNames:
-        s_out.write("," + sample)
-        d_out.write("," + sample)
-    s_out.write("\n")
-    d_out.write("\n")
-    for row in range(len(distances)):
-        s_out.write(sampleNames[row])
-        d_out.write(sampleNames[row])
-        for column in distances[row]:
-            s_out.write("," + str(1 - column))
-            d_out.write("," + str(column))
+    with profileStage("writing"):
+        s_out = open(args.output_dir + "cosine_similarity.csv", "w")
+        d_out = open(args.output_dir + "cosine_distances.csv", "w")
+        s_out.write("Sample")
+        d_out.write("Sample")
+        for sample in sampleNames:
+            s_out.write("," + sample)
+            d_out.write("," + sample)
         s_out.write("\n")
         d_out.write("\n")
-    s_out.close()
-    d_out.close()
+        for row in range(len(distances)):
+            s_out.write(sampleNames[row])
+            d_out.write(sampleNames[row])
+            for column in distances[row]:
+                s_out.write("," + str(1 - column))
+                d_out.write("," + str(column))
+            s_out.write("\n")
+            d_out.write("\n")
+        s_out.close()
+        d_out.close()
     
-    #Extract the colours from the colour file if present
-    colourDict, cConversion = getColourDict(args.colour_file)
+    #Cluster and plot the spectra
+    with profileStage("plotting"):
+        #Extract the colours from the colour file if present
+        colourDict, cConversion = getColourDict(args.colour_file)
 
-    #Extract spectra to arrays
-    sA = arraySpectra(spectraList, args.rna)
+        #Extract spectra to arrays
+        sA = arraySpectra(spectraList, args.rna)
 
-    #MDS of mutation proportions
-    sbsPCA(sA, sampleNames, colourDict, args.colour_labels, args.output_dir)
+        #MDS of mutation proportions
+        sbsPCA(sA, sampleNames, colourDict, args.colour_labels, args.output_dir)
 
-    #MDS of sample distances
-    if args.mds_distance:
-        plotMDS(distances, sampleNames, colourDict, args.output_dir)
+        #MDS of sample distances
+        if args.mds_distance:
+            plotMDS(distances, sampleNames, colourDict, args.output_dir)
 
     return
 
@@ -387,6 +395,11 @@ def cluster_spectra_parser(parser):
                         dest = "output_dir",
                         required = True,
                         help = "Output directory")
+    parser.add_argument("--profile",
+                        dest = "profile",
+                        help = "Write the wall time, CPU time and peak memory of each stage to run_profile.json in the output directory",
+                        action = "store_true",
+                        default = False)
 
     parser.set_defaults(func=cluster_spectra)
 
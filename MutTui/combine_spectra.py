@@ -3,6 +3,7 @@
 
 import argparse
 from .plot_spectrum import convertSpectrumDict
+from .profiling import profileCommand
 
 def combine_spectra_parser(parser):
 
@@ -20,11 +21,18 @@ def combine_spectra_parser(parser):
                         dest = "outFile",
                         required = True,
                         help = "Name of the output file to which the combined spectrum will be written")
+    parser.add_argument("--profile",
+                        dest = "profile",
+                        help = "Write the wall time, CPU time and peak memory of the command to run_profile.json in the directory " +
+                        "of the output file",
+                        action = "store_true",
+                        default = False)
 
     parser.set_defaults(func=combine_spectra)
 
     return(parser)
 
+@profileCommand("combine", lambda args: args.outFile)
 def combine_spectra(args):
 
     #Import the first spectrum, convert it to a dictionary that the others will be combined into
@@ -7,8 +7,10 @@
 
 import argparse
 from .plot_spectrum import convertSpectrumDict, convertSpectrumDictProportions
+from .profiling import profileCommand, profileStage, countOperations
 
 
+@profileCommand("catalogue", lambda args: args.outFile)
 def combine_spectra_into_catalog(args):
 
     #Check a maximum of 1 label option is provided
@@ -22,11 +24,13 @@ def combine_spectra_into_catalog(args):
     spectraDict = {}
 
     #Extract the spectra into spectraDict
-    for spectrum in args.spectra:
-        if args.proportions:
-            spectraDict[spectrum.name] = convertSpectrumDictProportions(spectrum)
-        else:
-            spectraDict[spectrum.name] = convertSpectrumDict(spectrum)
+    with profileStage("spectra_import"):
+        for spectrum in args.spectra:
+            if args.proportions:
+                spectraDict[spectrum.name] = convertSpectrumDictProportions(spectrum)
+            else:
+                spectraDict[spectrum.name] = convertSpectrumDict(spectrum)
+    countOperations("spectra_read", len(spectraDict))
     
     #Dictionary with sample names as keys and files as values
     sampleDict = {}
@@ -47,33 +51,35 @@ def combine_spectra_into_catalog(args):
             sampleDict["Sample" + str(i + 1)] = spectrum.name
     
     #Write the sample to file conversion
-    conversionFile = open("sample_in_catalog_to_file_conversion.csv", "w")
-    conversionFile.write("File,Sample_in_combined_catalog\n")
-    for eachSample in sampleDict:
-        conversionFile.write(sampleDict[eachSample] + "," + eachSample + "\n")
+    with profileStage("writing"):
+        conversionFile = open("sample_in_catalog_to_file_conversion.csv", "w")
+        conversionFile.write("File,Sample_in_combined_catalog\n")
+        for eachSample in sampleDict:
+            conversionFile.write(sampleDict[eachSample] + "," + eachSample + "\n")
     
-    #Write the header to the output files
-    outFile.write("Substitution")
-    outFileMatrix.write("Mutation Types")
-    for sample in sampleDict:
-        outFile.write("," + sample)
-        outFileMatrix.write("\t" + sample)
-    outFile.write("\n")
-    outFileMatrix.write("\n")
-    
-    #Iterate through the mutations and write their number in each sample
-    firstKey = list(spectraDict.keys())[0]
-    for mutation in spectraDict[firstKey]:
-        outFile.write(mutation)
-        outFileMatrix.write(mutation)
+        #Write the header to the output files
+        outFile.write("Substitution")
+        outFileMatrix.write("Mutation Types")
         for sample in sampleDict:
-            outFile.write("," + str(spectraDict[sampleDict[sample]][mutation]))
-            outFileMatrix.write("\t" + str(spectraDict[sampleDict[sample]][mutation]))
+            outFile.write("," + sample)
+            outFileMatrix.write("\t" + sample)
         outFile.write("\n")
         outFileMatrix.write("\n")
-
-    outFile.close()
-    conversionFile.close()
+    
+        #Iterate through the mutations and write their number in each sample
+        firstKey = list(spectraDict.keys())[0]
+        for mutation in spectraDict[firstKey]:
+            outFile.write(mutation)
+            outFileMatrix.write(mutation)
+            for sample in sampleDict:
+                outFile.write("," + str(spectraDict[sampleDict[sample]][mutation]))
+                outFileMatrix.write("\t" + str(spectraDict[sampleDict[sample]][mutation]))
+            outFile.write("\n")
+            outFileMatrix.write("\n")
+
+        outFile.close()
+        outFileMatrix.close()
+        conversionFile.close()
 
     return
 
@@ -117,6 +123,12 @@ def combine_spectra_into_catalog_parser(parser):
                         required = True,
                         help = "Output file prefix. Two files will be written - a csv catalog" + 
                         " and a tab separated mutation matrix")
+    parser.add_argument("--profile",
+                        dest = "profile",
+                        help = "Write the wall time, CPU time and peak memory of each stage to run_profile.json in the directory " +
+                        "of the output prefix",
+                        action = "store_true",
+                        default = False)
     
     parser.set_defaults(func=combine_spectra_into_catalog)
 
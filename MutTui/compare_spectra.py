@@ -6,6 +6,7 @@
 import argparse
 from .reconstruct_spectrum import getMutationDict
 from .plot_spectrum import *
+from .profiling import profileCommand, profileStage
 
 #Converts a given spectrum from number of mutations to proportion of mutations and returns the spectrum as a dictionary
 #def convertSpectrumProportions(spectrum):
@@ -61,11 +62,18 @@ def compare_spectra_parser(parser):
                         dest = "out_prefix",
                         required = True,
                         help = "The prefix of the output files")
+    parser.add_argument("--profile",
+                        dest = "profile",
+                        help = "Write the wall time, CPU time and peak memory of each stage to run_profile.json in the directory " +
+                        "of the output prefix",
+                        action = "store_true",
+                        default = False)
 
     parser.set_defaults(func=compare_spectra)
 
     return(parser)
 
+@profileCommand("compare", lambda args: args.out_prefix)
 def compare_spectra(args):
 
     #Import the spectra into dictionaries
@@ -94,11 +102,13 @@ def compare_spectra(args):
 
     outFile.close()
 
-    if not args.rna:
-        plotSpectrumComparison(spectrumDifference, args.out_prefix + "_spectrum_comparison.pdf")
-        plotSpectrumPointComparison(spectrum1Proportions, spectrum2Proportions, args.out_prefix + "_proportion_comparison.pdf")
-    else:
-        plotRNASpectrumComparison(spectrumDifference, args.out_prefix + "_spectrum_comparison.pdf")
+    #Plot the comparison of the spectra
+    with profileStage("plotting"):
+        if not args.rna:
+            plotSpectrumComparison(spectrumDifference, args.out_prefix + "_spectrum_comparison.pdf")
+            plotSpectrumPointComparison(spectrum1Proportions, spectrum2Proportions, args.out_prefix + "_proportion_comparison.pdf")
+        else:
+            plotRNASpectrumComparison(spectrumDifference, args.out_prefix + "_spectrum_comparison.pdf")
 
     return
 
@@ -2,6 +2,7 @@
 #In output, column 1 is alignment position, column 2 is genome position
 
 import argparse
+from .profiling import profileCommand
 
 def convert_vcf_position_translation_parser(parser):
 
@@ -24,11 +25,18 @@ def convert_vcf_position_translation_parser(parser):
                         dest = "outfile",
                         required = True,
                         help = "Name of output file")
+    parser.add_argument("--profile",
+                        dest = "profile",
+                        help = "Write the wall time, CPU time and peak memory of the command to run_profile.json in the directory " +
+                        "of the output file",
+                        action = "store_true",
+                        default = False)
 
     parser.set_defaults(func=convert_vcf_position_translation)
 
     return(parser)
 
+@profileCommand("convert-vcf", lambda args: args.outfile)
 def convert_vcf_position_translation(args):
 
     #Import the vcf file
@@ -0,0 +1,73 @@
+#Index of the genes in a GFF file used to find the genes that contain genome positions
+#The genome is split into segments at every gene start and end, each segment is covered by the same genes along its length
+#The genes covering each segment are stored in an overlap table so positions can be looked up together
+
+import numpy as np
+
+class GeneIndex:
+
+    #names, starts, ends and strands of the genes in the order of the GFF file, starts and ends are 1 based and inclusive
+    def __init__(self, names, starts, ends, strands):
+        self.names = np.array(names, dtype = str)
+        self.starts = np.array(starts, dtype = np.int64)
+        self.ends = np.array(ends, dtype = np.int64)
+        self.strands = np.array(strands, dtype = "U1")
+        #Position of each gene in the arrays, keyed by gene name
+        self.positions = {name: i for i, name in enumerate(self.names.tolist())}
+
+        #Genome positions at which the genes covering the genome change, each segment runs from one breakpoint to the next
+        self.breakpoints = np.unique(np.concatenate((self.starts, self.ends + 1)))
+
+        #First and last segment covered by each gene
+        firstSegments = np.searchsorted(self.breakpoints, self.starts)
+        lastSegments = np.searchsorted(self.breakpoints, self.ends + 1) - 1
+        segmentCounts = np.maximum(lastSegments - firstSegments + 1, 0)
+
+        #Every segment covered by each gene, ordered by segment and then by the order of the genes in the GFF
+        geneSegments = np.repeat(firstSegments - np.cumsum(segmentCounts) + segmentCounts, segmentCounts) + np.arange(segmentCounts.sum())
+        genes = np.repeat(np.arange(len(self.names)), segmentCounts)
+        order = np.lexsort((genes, geneSegments))
+
+        #Overlap table, the genes covering segment i are segmentGenes[segmentOffsets[i]:segmentOffsets[i + 1]]
+        self.segmentGenes = genes[order]
+        self.segmentOffsets = np.concatenate(([0], np.cumsum(np.bincount(geneSegments, minlength = len(self.breakpoints)))))
+
+    def __len__(self):
+        return(len(self.names))
+
+    #Finds the genes containing each of the given genome positions
+    #Returns the position in the input and the gene of each pair of a position and a gene containing it
+    def getGenes(self, genomePositions):
+        genomePositions = np.asarray(genomePositions, dtype = np.int64)
+        if len(self.breakpoints) == 0:
+            return(np.zeros(0, dtype = np.int64), np.zeros(0, dtype = np.int64))
+
+        #Segment of each position, -1 if the position is before the first gene
+        segments = np.searchsorted(self.breakpoints, genomePositions, side = "right") - 1
+        inSegment = segments >= 0
+        segments = np.where(inSegment, segments, 0)
+
+        geneCounts = np.where(inSegment, self.segmentOffsets[segments + 1] - self.segmentOffsets[segments], 0)
+        positionIndices = np.repeat(np.arange(len(genomePositions)), geneCounts)
+        #Position of each pair within the genes of its segment
+        withinSegment = np.arange(geneCounts.sum()) - np.repeat(np.cumsum(geneCounts) - geneCounts, geneCounts)
+        geneIndices = self.segmentGenes[self.segmentOffsets[segments[positionIndices]] + withinSegment]
+
+        return(positionIndices, geneIndices)
+
+    #Returns whether each of the given genome positions is within at least one gene
+    def inGene(self, genomePositions):
+        return(np.bincount(self.getGenes(genomePositions)[0], minlength = len(genomePositions)) > 0)
+
+    #Returns the names of the genes containing a genome position, in the order of the GFF
+    def getGeneNames(self, genomePosition):
+        return(self.names[self.getGenes([genomePosition])[1]].tolist())
+
+    #Arrays used to save the index
+    def toArrays(self):
+        return({"names": self.names, "starts": self.starts, "ends": self.ends, "strands": self.strands})
+
+    #Creates an index from saved arrays
+    @classmethod
+    def fromArrays(cls, arrays):
+        return(cls(arrays["names"], arrays["starts"], arrays["ends"], arrays["strands"]))
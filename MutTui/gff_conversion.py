@@ -1,58 +1,64 @@
 #Functions to work with GFF files
 
-from io import StringIO
-from Bio import SeqIO
-import gffutils as gff
-
-#Clean other "##" starting lines from gff file, as it confuses parsers
-#Taken from prokka.py in Panaroo
-def clean_gff_string(gff_string):
-    splitlines = gff_string.splitlines()
-    lines_to_delete = []
-    for index in range(len(splitlines)):
-        if '##sequence-region' in splitlines[index]:
-            lines_to_delete.append(index)
-    for index in sorted(lines_to_delete, reverse=True):
-        del splitlines[index]
-    cleaned_gff = "\n".join(splitlines)
-    return cleaned_gff
-
-#Takes a GFF file and returns a list of lists
-#Each entry in list is a gene with 4 components - gene name, gene start, gene end, strand
-def convertGFF(gff_file_name):
-    gff_file = open(gff_file_name, "r")
+from .gene_index import GeneIndex
+from .cache import hashContent, loadCachedArrays, saveCachedArrays, memoizeFile
+
+#Reads the coordinates of the CDS in the annotation section of a GFF file, in the order of the file
+#Returns a dictionary with CDS IDs as keys and lists of start, end and strand as values
+#CDS without an ID are named by their feature type and their number among the features of that type without an ID, e.g. CDS_1
+def getCDSCoordinates(gff_string):
+    cdsCoordinates = dict()
+    unnamed = dict()
+
+    for line in gff_string.splitlines():
+        #Skip directives, comments and blank lines
+        if (line.startswith("#")) or (line.strip() == ""):
+            continue
+
+        fields = line.rstrip("\n\r").split("\t")
+        if len(fields) != 9:
+            print("Problem reading GFF line", line)
+            raise RuntimeError("Error reading GFF file")
+
+        #Feature IDs are taken from the ID attribute
+        attributes = dict([a.split("=", 1) for a in fields[8].split(";") if "=" in a])
+        if "ID" in attributes:
+            featureID = attributes["ID"]
+        else:
+            unnamed[fields[2]] = unnamed.get(fields[2], 0) + 1
+            featureID = fields[2] + "_" + str(unnamed[fields[2]])
+
+        if "CDS" in fields[2]:
+            cdsCoordinates[featureID] = [int(fields[3]), int(fields[4]), fields[6]]
 
-    #Open file, split into genes and sequence
-    lines = gff_file.read().replace(",", "")
+    return(cdsCoordinates)
+
+#Takes a GFF file and returns a GeneIndex of its CDS
+#Each gene has 4 components - gene name, gene start, gene end, strand
+#The CDS lines are read directly from the annotation section rather than building a feature database, only the
+#coordinates and strand of each CDS are needed
+#The gene coordinates are cached using a hash of the GFF so the GFF only needs to be parsed once
+#and kept in memory so runs in the same process only read the GFF once
+@memoizeFile()
+def convertGFF(gff_file_name):
+    with open(gff_file_name, "r") as gff_file:
+        #Open file, split into genes and sequence
+        lines = gff_file.read().replace(",", "")
     split = lines.split("##FASTA")
 
     if len(split) != 2:
-        print("Problem reading GFF file", gff_file.name)
+        print("Problem reading GFF file", gff_file_name)
         raise RuntimeError("Error reading GFF file")
     
-    #Convert GFF sequence to fasta format
-    with StringIO(split[1]) as temp_fasta:
-        sequences = list(SeqIO.parse(temp_fasta, "fasta"))
-    
-    parsed_gff = gff.create_db(clean_gff_string(split[0]),
-                                dbfn = ":memory:",
-                                force = True,
-                                keep_order = True,
-                                from_string = True)
-    
-    geneCoordinates = dict()
-    geneDict = dict()
+    key = hashContent(lines)
+    cached = loadCachedArrays("gff", key)
+    if cached is not None:
+        return(GeneIndex.fromArrays(cached))
     
-    for entry in parsed_gff.all_features(featuretype = ()):
-        if "CDS" not in entry.featuretype:
-            continue
-        else:
-            geneCoordinates[entry.id] = [entry.start, entry.stop, entry.strand]
-            for position in range(entry.start, (entry.stop + 1)):
-                #If the position is in overlapping genes, all genes will be included separated by ____
-                if position in geneDict:
-                    geneDict[position] = geneDict[position] + "____" + entry.id
-                else:
-                    geneDict[position] = entry.id
-
-    return(geneCoordinates, geneDict)
\ No newline at end of file
+    geneCoordinates = getCDSCoordinates(split[0])
+
+    geneIndex = GeneIndex(list(geneCoordinates.keys()), [c[0] for c in geneCoordinates.values()],
+                          [c[1] for c in geneCoordinates.values()], [c[2] for c in geneCoordinates.values()])
+    saveCachedArrays(geneIndex.toArrays(), "gff", key)
+
+    return(geneIndex)
@@ -14,8 +14,10 @@ import argparse
 import pandas as pd
 from Bio import SeqIO
 import sys
-from .reconstruct_spectrum import getMutationDict, getContext, complement
+from .reconstruct_spectrum import getContext, complement, encodeSequence
+from .spectrum import Spectrum
 from .plot_spectrum import convertSpectrumFormat, plotSpectrumFromDict
+from .profiling import profileCommand, profileStage, countOperations
 
 #Extracts variants from a VCF file, returns a list of lists with
 #each list containing chromosome, position, reference, variant
@@ -131,26 +133,35 @@ def korimuto_parser(parser):
                         dest = "out",
                         required = True,
                         help = "Prefix for output files. By default, these will be saved in the current directory")
+    parser.add_argument("--profile",
+                        dest = "profile",
+                        help = "Write the wall time, CPU time and peak memory of each stage and counts of the mutations processed " +
+                        "to run_profile.json in the directory of the output prefix",
+                        action = "store_true",
+                        default = False)
     
     parser.set_defaults(func = korimuto)
 
     return(parser)
 
 
+@profileCommand("korimuto", lambda args: args.out)
 def korimuto(args):
 
     #Extract variants from input file
-    if args.variant:
-        variants = extractFromVariantFile(args.v_file)
-    else:
-        variants = extractFromVCF(args.v_file)
+    with profileStage("variant_import"):
+        if args.variant:
+            variants = extractFromVariantFile(args.v_file)
+        else:
+            variants = extractFromVCF(args.v_file)
     
     #Import multi-contig reference to a dictionary
-    if args.multi_contig:
-        reference = extractMultiContig(args.reference.name)
-    else:
-        #Import reference as single contig and extract to string
-        reference = str(SeqIO.read(args.reference.name, "fasta").seq).upper()
+    with profileStage("reference"):
+        if args.multi_contig:
+            reference = extractMultiContig(args.reference.name)
+        else:
+            #Import reference as single contig and extract to string
+            reference = str(SeqIO.read(args.reference.name, "fasta").seq).upper()
 
     outMutationsNotUsed = open(args.out + "_mutations_not_included.csv", "w")
     outMutationsNotUsed.write("Mutation_in_genome,Reason_not_included\n")
@@ -159,49 +170,70 @@ def korimuto(args):
     outAllMutations.write("Mutation_in_genome,Substitution\n")
     
     #Empty spectrum
-    spectrum = getMutationDict()
+    spectrum = Spectrum("SBS96")
 
     #Nucleotides, used to check if mutation involves 2 nucleotides
     nucleotides = ["A","C","G","T"]
 
+    #Mutations included in the spectrum and their contexts
+    includedMutations = list()
+    includedContexts = list()
+
     #Iterate through the variants, get their genomic context, check if they involve all nucleotides and add to spectrum
-    for mutation in variants:
-        if (mutation[0] not in nucleotides) or (mutation[1] not in nucleotides):
-            outMutationsNotUsed.write(mutation[0] + str(mutation[2]) + mutation[1] + ",mutation_does_not_involve_2_nucleotides\n")
-        #Remove cases where the variant matches the reference
-        elif mutation[0] == mutation[1]:
-            outMutationsNotUsed.write(mutation[0] + str(mutation[2]) + mutation[1] + ",variant_matches_reference\n")
-        else:
-            if args.multi_contig:
-                mutationContext = getMultiContigContext(mutation, reference)
+    with profileStage("classification"):
+        for mutation in variants:
+            if (mutation[0] not in nucleotides) or (mutation[1] not in nucleotides):
+                outMutationsNotUsed.write(mutation[0] + str(mutation[2]) + mutation[1] + ",mutation_does_not_involve_2_nucleotides\n")
+            #Remove cases where the variant matches the reference
+            elif mutation[0] == mutation[1]:
+                outMutationsNotUsed.write(mutation[0] + str(mutation[2]) + mutation[1] + ",variant_matches_reference\n")
             else:
-                mutationContext = getContext(mutation, reference)
+                if args.multi_contig:
+                    mutationContext = getMultiContigContext(mutation, reference)
+                else:
+                    mutationContext = getContext(mutation, reference)
 
-            #Check if the mutation, upstream or downstream nucleotides are not A, C, G or T
-            if (mutationContext[0] not in nucleotides) or (mutationContext[1] not in nucleotides):
-                outMutationsNotUsed.write(mutation[0] + str(mutation[2]) + mutation[1] + ",surrounding_position_not_nucleotide\n")
-            else:
-                #This will be true for all RNA mutations and half of DNA mutations
-                if (mutationContext[0] + mutation[0] + mutation[1] + mutationContext[1]) in spectrum:
-                    spectrum[mutationContext[0] + mutation[0] + mutation[1] + mutationContext[1]] += 1
-                    outAllMutations.write(mutation[0] + str(mutation[2]) + mutation[1] + "," + mutationContext[0] + "[" + mutation[0] + ">" + mutation[1] + "]" + mutationContext[1] + "\n")
-                #Add to the corresponding complement
+                #Check if the mutation, upstream or downstream nucleotides are not A, C, G or T
+                if (mutationContext[0] not in nucleotides) or (mutationContext[1] not in nucleotides):
+                    outMutationsNotUsed.write(mutation[0] + str(mutation[2]) + mutation[1] + ",surrounding_position_not_nucleotide\n")
                 else:
-                    spectrum[complement(mutationContext[1]) + complement(mutation[0]) + complement(mutation[1]) + complement(mutationContext[0])] += 1
-                    outAllMutations.write(complement(mutation[0]) + str(mutation[2]) + complement(mutation[1]) + "," + complement(mutationContext[1]) + "[" + complement(mutation[0]) + ">" + complement(mutation[1]) + "]" + complement(mutationContext[0]) + "\n")
+                    includedMutations.append(mutation)
+                    includedContexts.append(mutationContext)
     
+        #Identify the channel of each included mutation and add to the spectrum
+        channels, forwardChannels = spectrum.getChannels(encodeSequence("".join([c[0] for c in includedContexts])),
+                                                         encodeSequence("".join([m[0] for m in includedMutations])),
+                                                         encodeSequence("".join([m[1] for m in includedMutations])),
+                                                         encodeSequence("".join([c[1] for c in includedContexts])))
+        spectrum.addChannels(channels)
+
+        for i, mutation in enumerate(includedMutations):
+            mutationContext = includedContexts[i]
+            #This will be true for half of mutations
+            if forwardChannels[i]:
+                outAllMutations.write(mutation[0] + str(mutation[2]) + mutation[1] + "," + mutationContext[0] + "[" + mutation[0] + ">" + mutation[1] + "]" + mutationContext[1] + "\n")
+            #Add to the corresponding complement
+            else:
+                outAllMutations.write(complement(mutation[0]) + str(mutation[2]) + complement(mutation[1]) + "," + complement(mutationContext[1]) + "[" + complement(mutation[0]) + ">" + complement(mutation[1]) + "]" + complement(mutationContext[0]) + "\n")
+
+    #Count the variants read and included in the spectrum if korimuto is being profiled
+    countOperations("variants_read", len(variants))
+    countOperations("mutations_included", len(includedMutations))
+
     #Write the spectrum
-    outFile = open(args.out + "_mutational_spectrum.csv", "w")
-    outFile.write("Substitution,Number_of_mutations\n")
-    for eachMutation in spectrum:
-        outFile.write(eachMutation[0] + "[" + eachMutation[1] + ">" + eachMutation[2] + "]" + eachMutation[3] + "," + str(spectrum[eachMutation]) + "\n")
-    outFile.close()
+    with profileStage("writing"):
+        outFile = open(args.out + "_mutational_spectrum.csv", "w")
+        spectrum.writeSpectrum(outFile)
+        outFile.close()
+        outMutationsNotUsed.close()
+        outAllMutations.close()
 
     #Plot the spectrum
-    outSpectrum = open(args.out + "_mutational_spectrum.pdf", "w")
-    spectrumFormat = convertSpectrumFormat(spectrum)
-    plotSpectrumFromDict(spectrumFormat, outSpectrum)
-    outSpectrum.close()
+    with profileStage("plotting"):
+        outSpectrum = open(args.out + "_mutational_spectrum.pdf", "w")
+        spectrumFormat = convertSpectrumFormat(spectrum)
+        plotSpectrumFromDict(spectrumFormat, outSpectrum)
+        outSpectrum.close()
 
     return
 
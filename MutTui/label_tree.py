@@ -3,23 +3,28 @@
 #Uses the node numbers from add_tree_node_labels.py to specify internal branches and the taxon IDs to specify tip branches
 
 import argparse
-from Bio import Phylo
 from .add_tree_node_labels import cleanTree
+from .array_tree import readTree, writeNewick
+from .profiling import profileCommand, profileStage, countOperations
 
-#Labels the nodes and tips of the tree with their names
+#Labels the nodes and tips of an ArrayTree with their names
+#Returns the name of each clade in preorder, tips keep their names and internal nodes are numbered as in add_tree_node_labels.py
 def labelAllClades(tree):
+    nodeNames = list()
+
     #Will be incremented with each node
     nodeIterator = 1
 
     #Iterate through the clades and add labels
-    for clade in tree.find_clades():
-        if clade.is_terminal():
-            clade.node_name = clade.name
+    terminal = tree.terminal.tolist()
+    for i in range(len(tree)):
+        if terminal[i]:
+            nodeNames.append(tree.names[i])
         else:
-            clade.node_name = "Node" + str(nodeIterator)
+            nodeNames.append("Node" + str(nodeIterator))
             nodeIterator += 1
     
-    return(tree)
+    return(nodeNames)
 
 #Extracts dictionary from state changes, nodes as keys, states as values
 def getStateDict(states, stateFile):
@@ -35,40 +40,30 @@ def getStateDict(states, stateFile):
     
     return(stateDict)
 
-#Gets the state of the upstream clade
-def getParentState(tree, clade):
-    #Check if the clade is one downstream of the root
-    if len(tree.get_path(clade)) >= 2:
-        nodeState = tree.get_path(clade)[-2].name
-    else:
-        nodeState = str(tree.root.name)
-    
-    return(nodeState)
-
-#Labels each internal node and tip in a tree with their state
+#Labels each internal node and tip in an ArrayTree with their state
 #Sets the root state to the provided root state and changes the state along specified branches
-def labelTreeState(tree, root_state, stateDict):
+#nodeNames contains the names of the clades from labelAllClades
+def labelTreeState(tree, root_state, stateDict, nodeNames):
     #Set the root state
-    tree.root.name = root_state
-
-    #Iterate through the clades, check if their state needs to be changed
-    #otherwise use the state at the parent node
-    for clade in tree.find_clades():
-        #Do not analyse the root
-        if len(tree.get_path(clade)) != 0:
-            #Check if the state changes along the branch
-            if clade.node_name in stateDict:
-                if clade.is_terminal():
-                    clade.name = clade.name + "____" + stateDict[clade.node_name]
-                else:
-                    clade.name = stateDict[clade.node_name]
-            
-            #Infer and keep the state at the parent node
-            else:
-                if clade.is_terminal():
-                    clade.name = clade.name + "____" + getParentState(tree, clade)
-                else:
-                    clade.name = getParentState(tree, clade)
+    tree.names[0] = root_state
+
+    parents = tree.parent.tolist()
+    terminal = tree.terminal.tolist()
+
+    #Iterate through the clades in preorder, check if their state needs to be changed
+    #otherwise use the state at the parent node, which has already been labelled
+    for i in range(1, len(tree)):
+        #Check if the state changes along the branch
+        if nodeNames[i] in stateDict:
+            state = stateDict[nodeNames[i]]
+        #Infer and keep the state at the parent node
+        else:
+            state = str(tree.names[parents[i]])
+
+        if terminal[i]:
+            tree.names[i] = tree.names[i] + "____" + state
+        else:
+            tree.names[i] = state
     
     return(tree)
 
@@ -109,27 +104,38 @@ def label_tree_parser(parser):
                         dest = "outFile",
                         required = True,
                         help = "Output newick tree file")
+    parser.add_argument("--profile",
+                        dest = "profile",
+                        help = "Write the wall time, CPU time and peak memory of each stage to run_profile.json in the directory " +
+                        "of the output file",
+                        action = "store_true",
+                        default = False)
 
     parser.set_defaults(func = label_tree)
 
     return(parser)
 
+@profileCommand("label-tree", lambda args: args.outFile)
 def label_tree(args):
 
     #Clean the tree to remove any bootstrap supports
-    tree = cleanTree(Phylo.read(args.tree.name, "newick"))
+    with profileStage("tree_import"):
+        tree = cleanTree(readTree(args.tree.name, "newick"))
+    countOperations("clades", len(tree))
 
     #Label the tree
-    labelledTree = labelAllClades(tree)
+    with profileStage("labelling"):
+        nodeNames = labelAllClades(tree)
 
-    #Extract the state changes to a dictionary, node names as keys, states as values
-    stateDict = getStateDict(args.state_changes, args.state_file)
+        #Extract the state changes to a dictionary, node names as keys, states as values
+        stateDict = getStateDict(args.state_changes, args.state_file)
 
-    #Label the tree with the given state
-    stateTree = labelTreeState(labelledTree, args.root_state, stateDict)
+        #Label the tree with the given state
+        stateTree = labelTreeState(tree, args.root_state, stateDict, nodeNames)
 
     #Write the state labelled tree
-    Phylo.write(stateTree, args.outFile, "newick")
+    with profileStage("writing"):
+        writeNewick(stateTree, args.outFile)
 
     return
 
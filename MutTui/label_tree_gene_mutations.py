@@ -3,6 +3,7 @@
 import argparse
 import pandas as pd
 from Bio import Phylo
+from .tree_index import TreeIndex
 
 #Extract mutations from a variant effect file
 #Returns dictionary with node names as keys and mutations as values
@@ -26,12 +27,13 @@ def extractMutationEffects(mFile, genes, effects):
 
 #From label_tree.py
 #Gets the state of the upstream clade
-def getParentState(tree, clade):
+#Takes a TreeIndex of the tree
+def getParentState(treeIndex, clade):
     #Check if the clade is one downstream of the root
-    if len(tree.get_path(clade)) >= 2:
-        nodeState = tree.get_path(clade)[-2].state
+    if treeIndex.getDepth(clade) >= 2:
+        nodeState = treeIndex.getParent(clade).state
     else:
-        nodeState = str(tree.root.state)
+        nodeState = str(treeIndex.root.state)
     
     return(nodeState)
 
@@ -43,10 +45,12 @@ def labelTreeMutations(tree, mutations):
     #Keys are branch names, values are labels
     branches = dict()
 
+    treeIndex = TreeIndex(tree)
+
     #Iterate through the clades in the tree, check if they have mutations in mutations,
     #update their label if necessary, if not add label from parent clade
-    for clade in tree.find_clades():
-        upstreamLabel = getParentState(tree, clade)
+    for clade in treeIndex.clades:
+        upstreamLabel = getParentState(treeIndex, clade)
         
         #Add the gene label if there are mutations on the branch
         if clade.name in mutations:
@@ -0,0 +1,104 @@
+#Tables of the mutations inferred by treetime stored as parallel arrays, one for each column, rather than a record per mutation
+#The mutations of all branches are read into a single table with the mutations of each branch in consecutive rows, the
+#mutations of a branch are a slice of the table and share its arrays
+
+import numpy as np
+from collections.abc import MutableMapping
+
+class MutationTable:
+
+    #Names of the columns, the reference and mutant bases are ASCII codes
+    columns = ("ref", "alignment_position", "genome_position", "alt")
+
+    def __init__(self, ref, alignmentPositions, genomePositions, alt):
+        self.arrays = {"ref": np.asarray(ref, dtype = np.uint8),
+                       "alignment_position": np.asarray(alignmentPositions, dtype = np.int32),
+                       "genome_position": np.asarray(genomePositions, dtype = np.int32),
+                       "alt": np.asarray(alt, dtype = np.uint8)}
+
+    def __len__(self):
+        return(len(self.arrays["ref"]))
+
+    #Returns a column if key is a column name, otherwise returns a table of the rows selected by key, which can be
+    #anything used to index a numpy array. Slices share the arrays of the table
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return(self.arrays[key])
+        else:
+            return(MutationTable(*[self.arrays[c][key] for c in self.columns]))
+
+    #Returns the rows of the table as tuples
+    def tolist(self):
+        return(list(zip(*[self.arrays[c].tolist() for c in self.columns])))
+
+    #Creates a table from treetime mutations, e.g. A12G, translating the alignment positions to genome positions
+    @classmethod
+    def fromStrings(cls, mutations, translation):
+        alignmentPositions = np.array([m[1:-1] for m in mutations], dtype = np.int64).astype(np.int32)
+        ref = np.frombuffer("".join([m[0] for m in mutations]).encode(), dtype = np.uint8)
+        alt = np.frombuffer("".join([m[-1] for m in mutations]).encode(), dtype = np.uint8)
+        #The translation is an array with the genome position at each alignment position, None if they are the same
+        if translation is None:
+            genomePositions = alignmentPositions.copy()
+        else:
+            genomePositions = np.zeros(len(alignmentPositions), dtype = np.int32)
+            inTranslation = alignmentPositions < len(translation)
+            genomePositions[inTranslation] = translation[alignmentPositions[inTranslation]]
+            if not np.all(genomePositions):
+                raise KeyError("Alignment positions " + ",".join(map(str, alignmentPositions[genomePositions == 0][:10])) + " are not in the position translation")
+
+        return(cls(ref, alignmentPositions, genomePositions, alt))
+
+#The mutations on each branch of a tree, used as a dictionary with branch names as keys and tables of mutations as values
+#The mutations of all branches are in a single table, the mutations on branch i are in rows offsets[i] to offsets[i + 1]
+#Branches can be given new tables, e.g. once their mutations have been filtered, these replace the rows of the branch
+class BranchMutationTable(MutableMapping):
+
+    def __init__(self, table, branchNames, offsets):
+        self.table = table
+        self.branchNames = list(branchNames)
+        self.offsets = np.asarray(offsets, dtype = np.int64)
+        #Position of each branch in branchNames
+        self.branchIndex = {name: i for i, name in enumerate(self.branchNames)}
+
+        #Tables that have replaced the rows of a branch or been added for a new branch
+        self.replaced = dict()
+
+    #Creates the table from comma separated strings of treetime mutations, e.g. A12G,C15T, on each branch
+    @classmethod
+    def fromStrings(cls, branchNames, branchMutations, translation):
+        mutations = ",".join(branchMutations).split(",") if branchMutations else []
+        offsets = np.concatenate(([0], np.cumsum([m.count(",") + 1 for m in branchMutations], dtype = np.int64)))
+
+        return(cls(MutationTable.fromStrings(mutations, translation), branchNames, offsets))
+
+    #Branch id of each row of the table, the position of its branch in branchNames
+    def getBranchIds(self):
+        return(np.repeat(np.arange(len(self.branchNames), dtype = np.int32), np.diff(self.offsets)))
+
+    def __getitem__(self, branch):
+        if branch in self.replaced:
+            return(self.replaced[branch])
+        i = self.branchIndex[branch]
+        return(self.table[self.offsets[i]:self.offsets[i + 1]])
+
+    def __setitem__(self, branch, mutations):
+        self.replaced[branch] = mutations
+
+    def __delitem__(self, branch):
+        if branch in self.branchIndex:
+            raise KeyError("Branches in the table cannot be removed")
+        del self.replaced[branch]
+
+    def __contains__(self, branch):
+        return((branch in self.branchIndex) or (branch in self.replaced))
+
+    def __iter__(self):
+        for branch in self.branchNames:
+            yield(branch)
+        for branch in self.replaced:
+            if branch not in self.branchIndex:
+                yield(branch)
+
+    def __len__(self):
+        return(len(self.branchNames) + len([b for b in self.replaced if b not in self.branchIndex]))
@@ -2,6 +2,10 @@
 
 import os
 import argparse
+import contextlib
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
 from .treetime import run_treetime, change_gaps_to_Ns
 from .isvalid import *
 from Bio import AlignIO, Phylo
@@ -10,6 +14,12 @@ from .branch_labelling import *
 from .reconstruct_spectrum import *
 from .plot_spectrum import *
 from .gff_conversion import *
+from .spectrum import Spectrum, BranchSpectra, writeBranchSpectra
+from .tree_index import TreeIndex
+from .array_tree import readTree
+from .output_tables import TableWriter, openTable
+from .branch_reconstruction import BranchReconstruction, reconstructSubtree, addReconstruction
+from .profiling import profileCommand, profileStage, countOperations, isProfiling
 
 from .__init__ import __version__
 
@@ -96,6 +106,33 @@ def muttui_parser(parser):
                         help = "Additional options to supply to treetime (these are not checked). Supply these together in quotes",
                         type = str,
                         default = None)
+    treetime.add_argument("--treetime_backend",
+                        dest = "treetime_backend",
+                        help = "Run treetime ancestral reconstruction in MutTui through the treetime Python interface (api) " + 
+                        "or as a separate treetime command (subprocess). The treetime command is used if the Python interface " + 
+                        "is not available or the treetime version is not supported. Default = api",
+                        choices = ["api", "subprocess"],
+                        default = "api")
+    treetime.add_argument("--pipe_treetime",
+                        dest = "pipe_treetime",
+                        help = "Pass the alignment with gaps converted to Ns directly to treetime rather than writing " + 
+                        "gaps_to_N_alignment.fasta. Only used with --treetime_backend api",
+                        action = "store_true",
+                        default = False)
+    treetime.add_argument("--cache_dir",
+                        dest = "cache_dir",
+                        help = "Directory used to cache treetime reconstructions and other intermediate results so they are reused by " + 
+                        "later runs with the same alignment, tree and treetime options. Can be shared by several projects. " + 
+                        "Default = the MUTTUI_CACHE_DIR environment variable if set, otherwise ~/.cache/muttui. " + 
+                        "Use an empty string to turn off the cache",
+                        type = str,
+                        default = None)
+    treetime.add_argument("--cache_size",
+                        dest = "cache_size",
+                        help = "Maximum size in GB of the cached treetime reconstructions, the least recently used reconstructions " + 
+                        "are removed when this is exceeded. Default = 20",
+                        type = float,
+                        default = 20)
     
     #Other options
     parser.add_argument("--rna",
@@ -152,7 +189,39 @@ def muttui_parser(parser):
     parser.add_argument("--branch_specific",
                         dest = "branch_specific",
                         help = "Calculate the mutational spectrum for each branch in the tree separately. Only branches containing at least " + 
-                        "the number of mutations specified with -bm will be included",
+                        "the number of mutations specified with -bm will be included. If labels are given with -l or -lt, the spectra " + 
+                        "of the labels are calculated from the branches containing at least -bm mutations",
+                        action = "store_true",
+                        default = False)
+    parser.add_argument("--compress_tables",
+                        dest = "compress_tables",
+                        help = "Write all_included_mutations.csv, all_included_double_substitutions.csv and mutations_not_included.csv " + 
+                        "gzip compressed, with .gz added to the file names. These can be used as input to summarise_branch_mutations.py " + 
+                        "and post_process_branch_mutations.py",
+                        action = "store_true",
+                        default = False)
+    parser.add_argument("--branch_outputs",
+                        dest = "branch_outputs",
+                        help = "Used with --branch_specific. The spectra of all branches are written to branch_specific_spectra.npz. " + 
+                        "Use this option to also write and plot the spectra of the given number of branches with the most mutations " + 
+                        "in the same way as the spectra of labels. Default = 0",
+                        type = int,
+                        default = 0)
+    parser.add_argument("--branch_catalog",
+                        dest = "branch_catalog",
+                        help = "Used with --branch_specific. Also write the spectra of all branches to combined_catalog.csv",
+                        action = "store_true",
+                        default = False)
+    parser.add_argument("--workers",
+                        dest = "workers",
+                        help = "Number of processes used to reconstruct the spectra, the tree is split into subtrees that are reconstructed " + 
+                        "in separate processes, and to write and plot the spectra of each label. Default = 1",
+                        type = int,
+                        default = 1)
+    parser.add_argument("--profile",
+                        dest = "profile",
+                        help = "Write the wall time, CPU time and peak memory of each stage of the run and counts of the branches " +
+                        "and mutations processed to run_profile.json in the output directory",
                         action = "store_true",
                         default = False)
     parser.add_argument("--version",
@@ -165,11 +234,117 @@ def muttui_parser(parser):
 
 
 
+#Writes and plots the spectra of a label: the SBS spectrum, the rescaled SBS spectrum, the mutation types, the double
+#substitution spectrum if the data is not RNA and the strand bias spectrum if sbSpectrum is not None
+#Takes only the spectra of the label so this can be run in a separate process for each label
+def writeLabelSpectra(eachLabel, spectrum, doubleSpectrum, sbSpectrum, refContexts, outputDir, rna):
+    #Write the spectrum
+    outFile = open(outputDir + "mutational_spectrum_label_" + eachLabel + ".csv", "w")
+    spectrum.writeSpectrum(outFile)
+    outFile.close()
+
+    #Plot the spectrum
+    with profileStage("plotting"):
+        outSpectrum = open(outputDir + "mutational_spectrum_label_" + eachLabel + ".pdf", "w")
+        spectrumFormat = convertSpectrumFormat(spectrum)
+        if not rna:
+            plotSpectrumFromDict(spectrumFormat, outSpectrum)
+        else:
+            plotRNA(spectrumFormat, False, outSpectrum)
+        outSpectrum.close()
+
+    #Rescale the spectrum
+    rescaledSpectrum = rescaleSBS(spectrum, refContexts, 1000000, rna)
+    outRescaled = open(outputDir + "mutational_spectrum_label_" + eachLabel + "_rescaled.csv", "w")
+    rescaledSpectrum.writeSpectrum(outRescaled)
+    outRescaled.close()
+
+    #Plot the rescaled spectrum
+    with profileStage("plotting"):
+        outRSpectrum = open(outputDir + "mutational_spectrum_label_" + eachLabel + "_rescaled.pdf", "w")
+        spectrumFormat = convertSpectrumFormat(rescaledSpectrum)
+        if not rna:
+            plotSpectrumFromDict(spectrumFormat, outRSpectrum)
+        else:
+            plotRNA(spectrumFormat, False, outRSpectrum)
+        outRSpectrum.close()
+
+    #Calculate the number of each type of mutation
+    mtCounts = mutationTypeCount(spectrum, rna)
+    #Write the mutation type counts
+    outMT = open(outputDir + "mutation_types_label_" + eachLabel + ".csv", "w")
+    outMT.write("Mutation_type,Number_of_mutations\n")
+    for m in mtCounts:
+        outMT.write(m + "," + str(mtCounts[m]) + "\n")
+    outMT.close()
+
+    #Plot the mutation type counts
+    with profileStage("plotting"):
+        outMTSpectrum = open(outputDir + "mutation_types_label_" + eachLabel + ".pdf", "w")
+        if not rna:
+            plotMutationType(mtCounts, outMTSpectrum)
+        else:
+            plotRNAMT(mtCounts, outMTSpectrum)
+        outMTSpectrum.close()
+
+    ####No double substitution for RNA currently, will be updated
+    if not rna:
+        #Write the double substitution spectrum
+        outDouble = open(outputDir + "DBS_label_" + eachLabel + ".csv", "w")
+        doubleSpectrum.writeSpectrum(outDouble)
+        outDouble.close()
+    
+        #Plot the double substitution spectrum
+        with profileStage("plotting"):
+            outDoubleSpectrum = open(outputDir + "DBS_label_" + eachLabel + ".pdf", "w")
+            doubleFormat = convertSpectrumFormat(doubleSpectrum)
+            plotDouble(doubleFormat, False, outDoubleSpectrum)
+            outDoubleSpectrum.close()
+
+    #Write the strand bias spectrum
+    if sbSpectrum is not None:
+        outSB = open(outputDir + "strand_bias_label_" + eachLabel + ".csv", "w")
+        sbSpectrum.writeSpectrum(outSB)
+        outSB.close()
+    
+        #Plot the strand bias spectrum
+        with profileStage("plotting"):
+            outSBP = open(outputDir + "strand_bias_label_" + eachLabel + ".pdf", "w")
+            plotSB(sbSpectrum, False, outSBP)
+            outSBP.close()
+
+    return
+
+
+
+#Writes a catalog with a row for each mutation and a column for each label
+#counts is an array of mutation counts with a row for each mutation and a column for each label
+def writeCombinedCatalog(fileName, channels, labels, counts):
+    outCombined = open(fileName, "w")
+    outCombined.write("Substitution")
+    for eachLabel in labels:
+        outCombined.write("," + eachLabel)
+    outCombined.write("\n")
+
+    for eachMutation, mutationCounts in zip(channels, counts.tolist()):
+        outCombined.write(eachMutation + "," + ",".join([str(c) for c in mutationCounts]) + "\n")
+
+    outCombined.close()
+
+    return
+
+
+
+@profileCommand("run", lambda args: args.output_dir)
 def muttui(args):
 
     #Make sure trailing forward slash is present in output directory
     args.output_dir = os.path.join(args.output_dir, "")
 
+    #Set the cache directory for this run, this is also used by the processes started by MutTui
+    if args.cache_dir is not None:
+        os.environ["MUTTUI_CACHE_DIR"] = args.cache_dir
+
     #If --branch_specific is used, set --include_all_branches to true
     if args.branch_specific:
         args.include_all_branches = True
@@ -177,42 +352,72 @@ def muttui(args):
     #Minimum mutations to include a branch, only used with --branch_specific
     minimumMutations = int(args.branch_mutations)
 
-    #Open output files
-    outMutationsNotUsed = open(args.output_dir + "mutations_not_included.csv", "w")
-    outMutationsNotUsed.write("Mutation_in_alignment,Mutation_in_genome,Branch,Reason_not_included\n")
+    #Open output files, the mutations are written in blocks of rows
+    outMutationsNotUsed = TableWriter(openTable(args.output_dir + "mutations_not_included.csv", args.compress_tables),
+                                      ["Mutation_in_alignment", "Mutation_in_genome", "Branch", "Reason_not_included"])
 
-    outAllMutations = open(args.output_dir + "all_included_mutations.csv", "w")
-    outAllMutations.write("Mutation_in_alignment,Mutation_in_genome,Substitution,Branch\n")
+    outAllMutations = TableWriter(openTable(args.output_dir + "all_included_mutations.csv", args.compress_tables),
+                                  ["Mutation_in_alignment", "Mutation_in_genome", "Substitution", "Branch"])
 
-    outAllDouble = open(args.output_dir + "all_included_double_substitutions.csv", "w")
-    outAllDouble.write("Mutation_in_alignment,Mutation_in_genome,Substitution,Branch,Original_mutation\n")
+    outAllDouble = TableWriter(openTable(args.output_dir + "all_included_double_substitutions.csv", args.compress_tables),
+                               ["Mutation_in_alignment", "Mutation_in_genome", "Substitution", "Branch", "Original_mutation"])
 
     if not args.start_from_treetime:
-        print("Running treetime ancestral reconstruction to identify mutations")
-
-        #Convert gaps to Ns in the alignment, run treetime on the new alignment
-        change_gaps_to_Ns(args.alignment, args.output_dir)
-        run_treetime(open(args.output_dir + "gaps_to_N_alignment.fasta"), args.tree, args.output_dir, args.add_treetime_cmds)
+        with profileStage("treetime"):
+            print("Running treetime ancestral reconstruction to identify mutations")
+
+            #Convert gaps to Ns in the alignment, run treetime on the new alignment
+            #With the api backend, treetime is run on the converted alignment in MutTui and returns the reconstruction
+            #so the alignment and tree written by treetime do not need to be read
+            #With --pipe_treetime the converted alignment is read directly by treetime and gaps_to_N_alignment.fasta is only
+            #written if the treetime command has to be run instead
+            pipeAlignment = args.pipe_treetime and (args.treetime_backend == "api")
+            if pipeAlignment:
+                treetimeAlignment = contextlib.nullcontext(args.alignment)
+            else:
+                change_gaps_to_Ns(args.alignment, args.output_dir)
+                treetimeAlignment = open(args.output_dir + "gaps_to_N_alignment.fasta")
+            with treetimeAlignment as alignmentFile:
+                reconstruction = run_treetime(alignmentFile, args.tree, args.output_dir, args.add_treetime_cmds,
+                                              cacheSize = int(args.cache_size * 1e9), backend = args.treetime_backend, convertGaps = pipeAlignment)
     
         print("treetime reconstruction complete. Importing alignment from reconstruction and tree")
 
-        #Import the alignment from treetime
-        alignment = AlignIO.read(args.output_dir + "ancestral_sequences.fasta", "fasta")
+        #Import the root sequence from treetime, this is the only sequence used from the alignment
+        with profileStage("alignment_import"):
+            if reconstruction is None:
+                alignment = readFastaRecord(args.output_dir + "ancestral_sequences.fasta")
+            else:
+                alignment = reconstruction.rootAlignment
         
     else:
+        reconstruction = None
+
         #Import the already calculated alignment from treetime
         print("Importing alignment from reconstruction and tree")
         #Make sure the trailing forward slash is present in output directory
         args.treetime_out = os.path.join(args.treetime_out, "")
 
-        #Import the alignment from treetime
-        alignment = AlignIO.read(args.treetime_out + "ancestral_sequences.fasta", "fasta")
+        #Import the root sequence from treetime, this is the only sequence used from the alignment
+        with profileStage("alignment_import"):
+            alignment = readFastaRecord(args.treetime_out + "ancestral_sequences.fasta")
+    
+    #Convert the positions in the alignment to genome positions, if --all_sites specified the positions will be the same
+    #and no translation is needed
+    with profileStage("position_translation"):
+        if args.all_sites:
+            positionTranslation = None
+        else:
+            positionTranslation = convertTranslation(args.conversion)
     
-    #Import the original unlabelled tree
-    tree = Phylo.read(args.tree.name, "newick")
-    #Ladderize the tree so the branches are in the same order as the treetime tree
-    tree.ladderize()
-    tree = labelBranchesTreetime(tree)
+    #Import the tree and the mutations along each branch from the treetime reconstruction
+    #The tree is in the same order as the ladderized input tree, with nodes named as in treetime
+    with profileStage("tree_import"):
+        if reconstruction is None:
+            tree, branchMutationDict = readAnnotatedTree(args.output_dir + "annotated_tree.nexus", positionTranslation)
+        else:
+            tree = reconstruction.tree
+            branchMutationDict = BranchMutationTable.fromStrings(list(reconstruction.mutations.keys()), list(reconstruction.mutations.values()), positionTranslation)
 
     print("Alignment and tree imported. Reconstructing spectrum")
 
@@ -221,266 +426,229 @@ def muttui(args):
         if not args.gff:
             raise RuntimeError("GFF file needs to be provided with -g when using --strand_bias or --synonymous")
         else:
-            geneCoordinates, positionGene = convertGFF(args.gff.name)
+            with profileStage("gff"):
+                geneIndex = convertGFF(args.gff.name)
 
     #Label branches in the tree into categories, each category will have a separate spectrum
-    if args.labels:
-        ####The code in this if statement has not been altered with branch_mutations.txt
-        ####The elif and else sections have been altered
-        #Extract the labels to a dictionary and add taxa without a label
-        labelDict = getLabelDict(tree, args.labels)
-
-        #Write the labels to a csv that can be used by treetime mugration
-        writeLabels(labelDict, args.output_dir)
-
-        #Run treetime mugration to reconstruct the clade labels across the tree
-        run_treetime_mugration(args.output_dir + "annotated_tree.nexus", args.output_dir + "all_taxon_labels.csv", args.output_dir)
-
-        #Import the files from treetime mugration
-        mugrationTree = Phylo.read(args.output_dir + "mugration_out/annotated_tree.nexus", "nexus")
-        confidence = open(args.output_dir + "mugration_out/confidence.csv").readlines()
-        gtr = open(args.output_dir + "mugration_out/GTR.txt").readlines()
-
-        #Identify the root state and add it to the mugrationTree
-        mugrationTree = rootState(mugrationTree, confidence, gtr, args.root_state)
-
-        labelledTree, treeLabels = labelBranchesMugration(tree, mugrationTree)
-    #Label branches from the provided tree
-    elif args.labelled_tree:
-        labelledTree, treeLabels = getLabelledTreeLabels(tree, args.labelled_tree)
-    #Label branches with their branch name
-    elif args.branch_specific:
-        labelledTree, treeLabels = labelBranchesNames(tree)
-    #Label all branches with the same label
-    else:
-        labelledTree, treeLabels = labelAllBranches(tree)
+    with profileStage("labelling"):
+        if args.labels:
+            ####The code in this if statement has not been altered with branch_mutations.txt
+            ####The elif and else sections have been altered
+            #Extract the labels to a dictionary and add taxa without a label
+            labelDict = getLabelDict(tree, args.labels)
+
+            #Write the labels to a csv that can be used by treetime mugration
+            writeLabels(labelDict, args.output_dir)
+
+            #Run treetime mugration to reconstruct the clade labels across the tree
+            run_treetime_mugration(args.output_dir + "annotated_tree.nexus", args.output_dir + "all_taxon_labels.csv", args.output_dir)
+
+            #Import the files from treetime mugration
+            mugrationTree = readTree(args.output_dir + "mugration_out/annotated_tree.nexus", "nexus").toPhylo()
+            confidence = open(args.output_dir + "mugration_out/confidence.csv").readlines()
+            gtr = open(args.output_dir + "mugration_out/GTR.txt").readlines()
+
+            #Identify the root state and add it to the mugrationTree
+            mugrationTree = rootState(mugrationTree, confidence, gtr, args.root_state)
+
+            labelledTree, treeLabels = labelBranchesMugration(tree, mugrationTree)
+        #Label branches from the provided tree
+        elif args.labelled_tree:
+            labelledTree, treeLabels = getLabelledTreeLabels(tree, args.labelled_tree)
+        #Label branches with their branch name
+        elif args.branch_specific:
+            labelledTree, treeLabels = labelBranchesNames(tree)
+        #Label all branches with the same label
+        else:
+            labelledTree, treeLabels = labelAllBranches(tree)
     
     #Branch categories as keys, spectra as values
-    spectraDict = {}
-    doubleSpectraDict = {}
-    if args.strand_bias:
-        sbDict = {}
+    #With --branch_specific, the spectra of the branches are stored together in a sparse branches x channels matrix
+    #and branches are added to the matrix when they have enough mutations. If the labels are taken from -l or -lt,
+    #the spectra are of these labels and --branch_specific only excludes branches with fewer than -bm mutations
+    #sbDict contains the strand bias spectra and is None if --strand_bias is not specified
+    branchSpectra = args.branch_specific and not (args.labels or args.labelled_tree)
+    sbDict = None
+    if branchSpectra:
+        if args.rna:
+            spectraDict = BranchSpectra("RNA192")
+        else:
+            spectraDict = BranchSpectra("SBS96")
+        doubleSpectraDict = BranchSpectra("DBS78")
+        if args.strand_bias:
+            sbDict = BranchSpectra("SB192")
+    else:
+        spectraDict = {}
+        doubleSpectraDict = {}
+        if args.strand_bias:
+            sbDict = {}
     #Create empty spectrum for each branch category
     if args.rna:
         for label in treeLabels:
-            spectraDict[label] = getRNADict()
+            spectraDict[label] = Spectrum("RNA192")
     else:
         for label in treeLabels:
-            spectraDict[label] = getMutationDict()
-            doubleSpectraDict[label] = getDoubleSubstitutionDict()
+            spectraDict[label] = Spectrum("SBS96")
+            doubleSpectraDict[label] = Spectrum("DBS78")
             if args.strand_bias:
-                sbDict[label] = getStrandBiasDict()
-    
-    #The 4 nucleotides, used to check if mutated, upstream and downstream bases are nucleotides
-    nucleotides = ["A","C","G","T"]
-
-    #Convert the positions in the alignment to genome positions, if --all_sites specified the positions will be the same
-    if args.all_sites:
-        positionTranslation = allSitesTranslation(alignment)
-    else:
-        positionTranslation = convertTranslation(args.conversion)
+                sbDict[label] = Spectrum("SB192")
     
-    #Extracts mutations to a dictionary from the branch_mutations.txt file
-    if not args.start_from_treetime:
-        branchMutationDict = getBranchMutationNexusDict(args.output_dir + "annotated_tree.nexus", positionTranslation)
-    else:
-        branchMutationDict = getBranchMutationNexusDict(args.output_dir + "annotated_tree.nexus", positionTranslation)
-
     #Get the reference sequence, if -r specified this will be the provided genome, otherwise all sites in the alignment are assumed
     #and the root sequence from the ancestral reconstruction is used
-    referenceSequence = getReference(args.reference, args.all_sites, alignment, positionTranslation)
-    referenceLength = len(referenceSequence)
+    with profileStage("reference"):
+        referenceSequence = getReference(args.reference, args.all_sites, alignment, positionTranslation)
+        referenceLength = len(referenceSequence)
     
-    #Iterate through the branches, get the category of the branch, identify the contextual mutations, add to the corresponding spectrum
-    for clade in labelledTree.find_clades():
-        #Check if there are mutations along the current branch, only need to analyse branches with mutations
-        if clade.name in branchMutationDict:
-            #The label of the current branch, this will be None if the label changes along this branch
-            branchCategory = getBranchCategory(labelledTree, clade, args.include_all_branches)
-
-            #Extract the mutations along the branch. This will be None if there are no mutations but treetime has still added the mutation comment
-            branchMutations = branchMutationDict[clade.name]
-
-            #If using --branch_specific, check if the branch contains at least -bm mutations, if so
-            #add the branch to spectraDict. If not, set branchCategory to None so it won't be analysed
-            if args.branch_specific:
-                if len(branchMutations) >= minimumMutations:
-                    if args.rna:
-                        spectraDict[clade.name] = getRNADict()
-                    else:
-                        spectraDict[clade.name] = getMutationDict()
-                else:
-                    branchCategory = None
+    #Index the tree to look up the upstream clade and depth of each clade
+    with profileStage("branch_categories"):
+        treeIndex = TreeIndex(labelledTree)
+
+        #Get the category of each branch with mutations, this will be None if the branch will not be analysed
+        branchCategories = dict()
+        for clade in treeIndex.clades:
+            if clade.name in branchMutationDict:
+                #The label of the current branch, this will be None if the label changes along this branch
+                branchCategory = getBranchCategory(treeIndex, clade, args.include_all_branches)
+
+                #If using --branch_specific, check if the branch contains at least -bm mutations, if so
+                #add the branch to spectraDict. If not, set branchCategory to None so it won't be analysed
+                if args.branch_specific:
+                    if len(branchMutationDict[clade.name]) < minimumMutations:
+                        branchCategory = None
+                    elif branchSpectra:
+                        spectraDict.addBranch(clade.name)
+                        doubleSpectraDict.addBranch(clade.name)
+                        if args.strand_bias:
+                            sbDict.addBranch(clade.name)
             
-            #If --include_root_branches is not specified, check if the branch comes off the root, if so set the branchCategory
-            #to None so it won't be analysed
-            if not args.include_root_branches:
-                if len(labelledTree.get_path(clade)) == 1:
-                    branchCategory = None
-
-            #Check if the branch has a category, will be None if the branch is a transition between categories
-            #and option --include_all_branches is not specified
-            if branchCategory is not None:
-                #Extract double substitutions, remove mutations at the ends of the genome or not involving 2 nucleotides
-                branchMutations, doubleSubstitutions = filterMutations(branchMutations, clade, nucleotides, referenceLength, outMutationsNotUsed)
-                
-                #Update the reference sequence to get the current context
-                updatedReference = updateReference(tree, clade, branchMutationDict, referenceSequence)
-
-                #Check if only synonymous mutations should be included, if so filter the mutations
-                if args.synonymous:
-                    branchMutations = extractSynonymous(branchMutations, updatedReference, geneCoordinates, positionGene)
-                
-                for mutation in branchMutations:
-                    mutationContext = getContext(mutation, updatedReference)
-                    
-                    #Check if the upstream or downstream nucleotides are not A, C, G or T
-                    if (mutationContext[0] not in nucleotides) or (mutationContext[1] not in nucleotides):
-                        outMutationsNotUsed.write(mutation[0] + str(mutation[1]) + mutation[3] + "," + mutation[0] + str(mutation[2]) + mutation[3] + "," + clade.name + ",Surrounding_position_not_nucleotide\n")
-                    else:
-                        #This will be true for all RNA mutations and half of DNA mutations
-                        if (mutationContext[0] + mutation[0] + mutation[3] + mutationContext[1]) in spectraDict[branchCategory]:
-                            spectraDict[branchCategory][mutationContext[0] + mutation[0] + mutation[3] + mutationContext[1]] += 1
-                            outAllMutations.write(mutation[0] + str(mutation[1]) + mutation[3] + "," + mutation[0] + str(mutation[2]) + mutation[3] + "," + mutationContext[0] + "[" + mutation[0] + ">" + mutation[3] + "]" + mutationContext[1] + "," + clade.name + "\n")
-                        #Add to the corresponding complement
-                        else:
-                            spectraDict[branchCategory][complement(mutationContext[1]) + complement(mutation[0]) + complement(mutation[3]) + complement(mutationContext[0])] += 1
-                            outAllMutations.write(complement(mutation[0]) + str(mutation[1]) + complement(mutation[3]) + "," + complement(mutation[0]) + str(mutation[2]) + complement(mutation[3]) + "," + complement(mutationContext[1]) + "[" + complement(mutation[0]) + ">" + complement(mutation[3]) + "]" + complement(mutationContext[0]) + "," + clade.name + "\n")
-                    
-                        #If calculating strand bias, check if the mutation position is in a gene, if so extract its strand bias
-                        if (args.strand_bias) and (mutation[2] in positionGene):
-                            sb = getStrandBias(mutation, updatedReference, geneCoordinates, positionGene)
-                            #Exclude genes in multiple genes on different strands
-                            if sb is not None:
-                                #Add to the corresponding dictionary
-                                if (sb + mutationContext[0] + mutation[0] + mutation[3] + mutationContext[1]) in sbDict[branchCategory]:
-                                    sbDict[branchCategory][sb + mutationContext[0] + mutation[0] + mutation[3] + mutationContext[1]] += 1
-                                else:
-                                    sbDict[branchCategory][sb + complement(mutationContext[1]) + complement(mutation[0]) + complement(mutation[3]) + complement(mutationContext[0])] += 1
-
-                #Add double substitutions to the corresponding spectrum
-                ####No double substitution for RNA currently, will be updated
-                if (len(doubleSubstitutions) > 0) and (not args.rna):
-                    dsIter = iter(doubleSubstitutions)
-                    for s1, s2 in zip(dsIter, dsIter):
-                        #Check if both mutations involve nucleotides, if not write both to the unused file
-                        if (s1[0] not in nucleotides) or (s1[3] not in nucleotides) or (s2[0] not in nucleotides) or (s2[3] not in nucleotides):
-                            outMutationsNotUsed.write(s1[0] + str(s1[1]) + s1[3] + "," + s1[0] + str(s1[2]) + s1[3] + "," + clade.name + ",Double_substitution_does_not_involve_two_nucleotides\n")
-                            outMutationsNotUsed.write(s2[0] + str(s2[1]) + s2[3] + "," + s2[0] + str(s2[2]) + s2[3] + "," + clade.name + ",Double_substitution_does_not_involve_two_nucleotides\n")
-                        else:
-                            #This will be true for all RNA mutations and half of DNA mutations
-                            if (s1[0] + s2[0] + s1[3] + s2[3]) in doubleSpectraDict[branchCategory]:
-                                doubleSpectraDict[branchCategory][s1[0] + s2[0] + s1[3] + s2[3]] += 1
-                                outAllDouble.write(s1[0] + s2[0] + str(s1[1]) + s1[3] + s2[3] + "," + s1[0] + s2[0] + str(s1[2]) + s1[3] + s2[3] + "," + s1[0] + s2[0] + ">" + s1[3] + s2[3] + "," + clade.name + ",Forward\n")
-                            else:
-                                doubleSpectraDict[branchCategory][complement(s2[0]) + complement(s1[0]) + complement(s2[3]) + complement(s1[3])] += 1
-                                outAllDouble.write(complement(s2[0]) + complement(s1[0]) + str(s1[1]) + complement(s2[3]) + complement(s1[3]) + "," + complement(s2[0]) + complement(s1[0]) + str(s1[2]) + complement(s2[3]) + complement(s1[3]) + "," + complement(s2[0]) + complement(s1[0]) + ">" + complement(s2[3]) + complement(s1[3]) + "," + clade.name + ",Reverse\n")
-            #Write the mutations on the branch to the not used file
-            else:
-                for eM in branchMutations:
-                    outMutationsNotUsed.write(eM[0] + str(eM[1]) + eM[3] + "," + eM[0] + str(eM[2]) + eM[3] + "," + clade.name + ",Label_changes_on_branch\n")
+                #If --include_root_branches is not specified, check if the branch comes off the root, if so set the branchCategory
+                #to None so it won't be analysed
+                if not args.include_root_branches:
+                    if treeIndex.getDepth(clade) == 1:
+                        branchCategory = None
+            
+                branchCategories[clade.name] = branchCategory
+
+        if not (args.strand_bias or args.synonymous):
+            geneIndex = None
+
+    #With more than 1 worker, split the tree into subtrees of similar numbers of mutations, each subtree is reconstructed
+    #in a separate process from the reference at the start of its upstream branch
+    with profileStage("branch_loop"):
+        if args.workers > 1:
+            cladeWeights = [len(branchMutationDict.get(clade.name, [])) + 1 for clade in treeIndex.clades]
+            subtreeClades = {id(treeIndex.clades[i]) for i in treeIndex.splitSubtrees(cladeWeights, 4 * args.workers)}
+            executor = ProcessPoolExecutor(max_workers = args.workers)
+        else:
+            subtreeClades = set()
+
+        #Reconstructions of the subtrees and of the branches upstream of the subtrees, in the order of the tree
+        #These are added to the output files and spectra in order so the output is the same with any number of workers
+        reconstructions = deque()
+        reconstruction = BranchReconstruction(branchCategories, referenceLength, geneIndex, args.rna, args.synonymous, args.strand_bias)
+
+        #Iterate through the branches, identify the contextual mutations and add them to the spectrum of the branch category
+        #The reference sequence is updated with the mutations along the upstream branches as the tree is traversed
+        for clade, updatedReference in iterateBranchReferences(labelledTree, branchMutationDict, referenceSequence, stopClades = subtreeClades):
+            if id(clade) in subtreeClades:
+                #Keep the branches reconstructed before the subtree, then reconstruct the subtree in a separate process
+                reconstructions.append(reconstruction.getResults())
+                names, parents = treeIndex.getSubtreeArrays(clade)
+                subtreeMutations = {name: branchMutationDict[name] for name in names if name in branchMutationDict}
+                subtreeCategories = {name: branchCategories[name] for name in subtreeMutations}
+                reconstructions.append(executor.submit(reconstructSubtree, names, parents, updatedReference.copy(), subtreeMutations, subtreeCategories,
+                                                       referenceLength, geneIndex, args.rna, args.synonymous, args.strand_bias))
+            #Check if there are mutations along the current branch, only need to analyse branches with mutations
+            elif clade.name in branchMutationDict:
+                #Keep only the retained mutations, these are the mutations applied to the reference of the downstream branches
+                branchMutationDict[clade.name] = reconstruction.reconstructBranch(clade, branchMutationDict[clade.name], updatedReference)
+
+            #Add the completed reconstructions to the output
+            while reconstructions and ((not isinstance(reconstructions[0], Future)) or reconstructions[0].done()):
+                addReconstruction(reconstructions.popleft(), [outMutationsNotUsed, outAllMutations, outAllDouble], spectraDict, sbDict, doubleSpectraDict)
+    
+        reconstructions.append(reconstruction.getResults())
+        while reconstructions:
+            addReconstruction(reconstructions.popleft(), [outMutationsNotUsed, outAllMutations, outAllDouble], spectraDict, sbDict, doubleSpectraDict)
+        if args.workers > 1:
+            executor.shutdown()
+
+    #Count the branches and mutations processed if the run is being profiled
+    if isProfiling():
+        countOperations("branches_processed", len(branchCategories))
+        countOperations("branches_analysed", len([c for c in branchCategories.values() if c is not None]))
+        countOperations("mutations_read", len(branchMutationDict.table))
+        countOperations("mutations_included", outAllMutations.rows)
+        countOperations("double_substitutions_included", outAllDouble.rows)
+        countOperations("mutations_not_included", outMutationsNotUsed.rows)
     
     #Calculate contexts in the reference to enable rescaling
-    refContexts = calculateContexts(referenceSequence, args.rna)
+    with profileStage("reference_contexts"):
+        refContexts = calculateContexts(referenceSequence, args.rna)
     
-    #Write the spectra to separate files
-    for eachLabel in spectraDict:
-        outFile = open(args.output_dir + "mutational_spectrum_label_" + eachLabel + ".csv", "w")
-        outFile.write("Substitution,Number_of_mutations\n")
-        for eachMutation in spectraDict[eachLabel]:
-            outFile.write(eachMutation[0] + "[" + eachMutation[1] + ">" + eachMutation[2] + "]" + eachMutation[3] + "," + str(spectraDict[eachLabel][eachMutation]) + "\n")
-        outFile.close()
-
-        #Plot the spectrum
-        outSpectrum = open(args.output_dir + "mutational_spectrum_label_" + eachLabel + ".pdf", "w")
-        spectrumFormat = convertSpectrumFormat(spectraDict[eachLabel])
-        if not args.rna:
-            plotSpectrumFromDict(spectrumFormat, outSpectrum)
-        else:
-            plotRNA(spectrumFormat, False, outSpectrum)
-        outSpectrum.close()
-
-        #Rescale the spectrum
-        rescaledSpectrum = rescaleSBS(spectraDict[eachLabel], refContexts, 1000000, args.rna)
-        outRescaled = open(args.output_dir + "mutational_spectrum_label_" + eachLabel + "_rescaled.csv", "w")
-        outRescaled.write("Substitution,Number_of_mutations\n")
-        for eachMutation in rescaledSpectrum:
-            outRescaled.write(eachMutation[0] + "[" + eachMutation[1] + ">" + eachMutation[2] + "]" + eachMutation[3] + "," + str(rescaledSpectrum[eachMutation]) + "\n")
-        outRescaled.close()
-
-        #Plot the rescaled spectrum
-        outRSpectrum = open(args.output_dir + "mutational_spectrum_label_" + eachLabel + "_rescaled.pdf", "w")
-        spectrumFormat = convertSpectrumFormat(rescaledSpectrum)
-        if not args.rna:
-            plotSpectrumFromDict(spectrumFormat, outRSpectrum)
+    #Write and plot the spectra of each label, using a pool of processes if more than 1 worker is specified
+    #Each label writes its own files so the output files are the same with any number of workers
+    with profileStage("writing"):
+        labelSpectra = list()
+        if branchSpectra:
+            #Write the spectra of all branches to a single file
+            branchSpectraList = [spectraDict]
+            if not args.rna:
+                branchSpectraList.append(doubleSpectraDict)
+            if args.strand_bias:
+                branchSpectraList.append(sbDict)
+            writeBranchSpectra(args.output_dir + "branch_specific_spectra.npz", branchSpectraList)
+
+            #Write and plot the spectra of the branches with the most mutations, branches with the same number of mutations
+            #are in the order of the tree
+            outputBranches = [spectraDict.branches[i] for i in np.argsort(-spectraDict.getTotals(), kind = "stable")[:args.branch_outputs]]
+            for eachBranch in outputBranches:
+                if args.rna:
+                    doubleSpectrum = None
+                else:
+                    doubleSpectrum = doubleSpectraDict.getSpectrum(eachBranch)
+                if args.strand_bias:
+                    sbSpectrum = sbDict.getSpectrum(eachBranch)
+                else:
+                    sbSpectrum = None
+                labelSpectra.append((eachBranch, spectraDict.getSpectrum(eachBranch), doubleSpectrum, sbSpectrum, refContexts, args.output_dir, args.rna))
         else:
-            plotRNA(spectrumFormat, False, outRSpectrum)
-        outRSpectrum.close()
-
-        #Calculate the number of each type of mutation
-        mtCounts = mutationTypeCount(spectraDict[eachLabel], args.rna)
-        #Write the mutation type counts
-        outMT = open(args.output_dir + "mutation_types_label_" + eachLabel + ".csv", "w")
-        outMT.write("Mutation_type,Number_of_mutations\n")
-        for m in mtCounts:
-            outMT.write(m + "," + str(mtCounts[m]) + "\n")
-        outMT.close()
-
-        #Plot the mutation type counts
-        outMTSpectrum = open(args.output_dir + "mutation_types_label_" + eachLabel + ".pdf", "w")
-        if not args.rna:
-            plotMutationType(mtCounts, outMTSpectrum)
+            for eachLabel in spectraDict:
+                if args.rna:
+                    doubleSpectrum = None
+                else:
+                    doubleSpectrum = doubleSpectraDict[eachLabel]
+                if args.strand_bias:
+                    sbSpectrum = sbDict[eachLabel]
+                else:
+                    sbSpectrum = None
+                labelSpectra.append((eachLabel, spectraDict[eachLabel], doubleSpectrum, sbSpectrum, refContexts, args.output_dir, args.rna))
+
+        if (args.workers > 1) and (len(labelSpectra) > 1):
+            #Workers are not profiled so the plotting in the workers is timed in the parent as a single plotting stage
+            with profileStage("plotting"):
+                with ProcessPoolExecutor(max_workers = min(args.workers, len(labelSpectra))) as executor:
+                    for labelFuture in [executor.submit(writeLabelSpectra, *l) for l in labelSpectra]:
+                        labelFuture.result()
         else:
-            plotRNAMT(mtCounts, outMTSpectrum)
-        outMTSpectrum.close()
-
-        ####No double substitution for RNA currently, will be updated
-        if not args.rna:
-            #Write the double substitution spectrum
-            outDouble = open(args.output_dir + "DBS_label_" + eachLabel + ".csv", "w")
-            outDouble.write("Substitution,Number_of_mutations\n")
-            for eachMutation in doubleSpectraDict[eachLabel]:
-                outDouble.write(eachMutation[:2] + ">" + eachMutation[2:] + "," + str(doubleSpectraDict[eachLabel][eachMutation]) + "\n")
-        
-            #Plot the double substitution spectrum
-            outDoubleSpectrum = open(args.output_dir + "DBS_label_" + eachLabel + ".pdf", "w")
-            doubleFormat = convertSpectrumFormat(doubleSpectraDict[eachLabel])
-            plotDouble(doubleFormat, False, outDoubleSpectrum)
-            outDoubleSpectrum.close()
-
-        #Write the strand bias spectrum
-        if args.strand_bias:
-            outSB = open(args.output_dir + "strand_bias_label_" + eachLabel + ".csv", "w")
-            outSB.write("Strand,Substitution,Number_of_mutations\n")
-            for sbm in sbDict[eachLabel]:
-                outSB.write(sbm[0] + "," + sbm[1:] + "," + str(sbDict[eachLabel][sbm]) + "\n")
-            outSB.close()
-        
-            #Plot the strand bias spectrum
-            outSBP = open(args.output_dir + "strand_bias_label_" + eachLabel + ".pdf", "w")
-            plotSB(sbDict[eachLabel], False, outSBP)
-            outSBP.close()
+            for l in labelSpectra:
+                writeLabelSpectra(*l)
+        countOperations("labels_written", len(labelSpectra))
     
-    #Write the spectra to a combined catalog if there is more than 1 label
-    if len(spectraDict.keys()) > 1:
-        outCombined = open(args.output_dir + "combined_catalog.csv", "w")
-        outCombined.write("Substitution")
-        for eachLabel in spectraDict:
-            outCombined.write("," + eachLabel)
-        outCombined.write("\n")
-
-        for eachMutation in spectraDict[list(spectraDict.keys())[0]]:
-            outCombined.write(eachMutation)
-            for eachLabel in spectraDict:
-                outCombined.write("," + str(spectraDict[eachLabel][eachMutation]))
-            outCombined.write("\n")
-
-        outCombined.close()
-
-    #Close output files
-    outMutationsNotUsed.close()
-    outAllMutations.close()
-    outAllDouble.close()
+        #Write the spectra to a combined catalog if there is more than 1 label, with --branch_specific the catalog is only
+        #written if --branch_catalog is specified
+        if branchSpectra:
+            if args.branch_catalog and (len(spectraDict) > 1):
+                writeCombinedCatalog(args.output_dir + "combined_catalog.csv", spectraDict.channels, spectraDict.branches, spectraDict.toDense().T)
+        elif len(spectraDict.keys()) > 1:
+            #Counts of each mutation in each label
+            combinedCounts = np.column_stack([spectraDict[eachLabel].counts for eachLabel in spectraDict])
+            writeCombinedCatalog(args.output_dir + "combined_catalog.csv", spectraDict[list(spectraDict.keys())[0]].channels, list(spectraDict.keys()), combinedCounts)
+
+        #Close output files
+        outMutationsNotUsed.close()
+        outAllMutations.close()
+        outAllDouble.close()
 
     return
 
@@ -0,0 +1,76 @@
+#Buffered writing of the per-mutation output tables
+#Rows are added as columns, typically all of the rows of a branch at once, and are written to the table in large blocks
+#rather than with a write for each mutation. Tables can be gzip compressed, compressed tables end in .gz and can be read
+#with readTable or directly by pandas
+
+import gzip
+
+#Opens a table for writing, .gz is added to the file name if the table is compressed
+def openTable(fileName, compress = False):
+    if compress:
+        return(gzip.open(fileName + ".gz", "wt", compresslevel = 6))
+    else:
+        return(open(fileName, "w"))
+
+#Opens a table for reading, tables ending in .gz are decompressed
+def readTable(fileName):
+    if fileName.endswith(".gz"):
+        return(gzip.open(fileName, "rt"))
+    else:
+        return(open(fileName))
+
+class TableWriter:
+
+    #outFile is an open text file, header is a list of the column names, no header is written if header is None
+    #Rows are written to outFile once at least bufferRows rows have been added
+    def __init__(self, outFile, header, bufferRows = 100000):
+        self.outFile = outFile
+        self.bufferRows = bufferRows
+
+        #Blocks of rows that have not been written yet and the number of rows in them
+        self.blocks = list()
+        self.bufferedRows = 0
+        #Number of rows added to the table, not including the header
+        self.rows = 0
+
+        if header is not None:
+            self.outFile.write(",".join(header) + "\n")
+
+    #Adds rows to the table. Each column is a list of strings with a value for each row, or a single string
+    #that is used in every row
+    def addRows(self, *columns):
+        numberRows = min([len(c) for c in columns if not isinstance(c, str)])
+        if numberRows == 0:
+            return
+
+        columns = [[c] * numberRows if isinstance(c, str) else c for c in columns]
+        self.blocks.append("\n".join(map(",".join, zip(*columns))) + "\n")
+        self.bufferedRows += numberRows
+        self.rows += numberRows
+
+        if self.bufferedRows >= self.bufferRows:
+            self.flush()
+
+    #Adds rows that are already formatted as text, such as rows written to a table without a header in another process
+    def addText(self, text):
+        if text == "":
+            return
+
+        self.blocks.append(text)
+        numberRows = text.count("\n")
+        self.bufferedRows += numberRows
+        self.rows += numberRows
+
+        if self.bufferedRows >= self.bufferRows:
+            self.flush()
+
+    #Writes the buffered rows to the table
+    def flush(self):
+        if self.blocks:
+            self.outFile.write("".join(self.blocks))
+            self.blocks = list()
+            self.bufferedRows = 0
+
+    def close(self):
+        self.flush()
+        self.outFile.close()
@@ -7,6 +7,7 @@ import matplotlib
 matplotlib.use('AGG')
 import matplotlib.pyplot as plt
 from matplotlib.lines import Line2D
+from .profiling import profileCommand, profileStage
 
 
 
@@ -502,34 +503,43 @@ def plot_spectrum_parser(parser):
                         help = "Specify to plot the spectrum as proportion of mutations rather than number of mutations",
                         action = "store_true",
                         default = False)
+    parser.add_argument("--profile",
+                        dest = "profile",
+                        help = "Write the wall time, CPU time and peak memory of each stage to run_profile.json in the directory " +
+                        "of the output file",
+                        action = "store_true",
+                        default = False)
 
     parser.set_defaults(func = plot_spectrum)
 
     return(parser)
 
+@profileCommand("plot", lambda args: args.outFile)
 def plot_spectrum(args):
 
     #Extract the spectrum to a dictionary with mutations as keys and counts or proportions as values
-    if args.sb:
-        spectrum = convertSB(args.spectrum_file)
-    else:
-        if args.proportions:
-            spectrum = convertSpectrumDictProportions(args.spectrum_file)
+    with profileStage("spectrum_import"):
+        if args.sb:
+            spectrum = convertSB(args.spectrum_file)
         else:
-            spectrum = convertSpectrumDict(args.spectrum_file)
-
-    if args.types and not args.rna:
-        plotMutationType(spectrum, args.outFile)
-    elif args.types and args.rna:
-        plotRNAMT(spectrum, args.outFile)
-    elif args.double:
-        plotDouble(spectrum, args.plot_proportion, args.outFile)
-    elif args.sb:
-        plotSB(spectrum, args.plot_proportion, args.outFile)
-    elif args.rna:
-        plotRNA(spectrum, args.plot_proportion, args.outFile)
-    else:
-        plotSpectrumFromDict(spectrum, args.outFile)
+            if args.proportions:
+                spectrum = convertSpectrumDictProportions(args.spectrum_file)
+            else:
+                spectrum = convertSpectrumDict(args.spectrum_file)
+
+    with profileStage("plotting"):
+        if args.types and not args.rna:
+            plotMutationType(spectrum, args.outFile)
+        elif args.types and args.rna:
+            plotRNAMT(spectrum, args.outFile)
+        elif args.double:
+            plotDouble(spectrum, args.plot_proportion, args.outFile)
+        elif args.sb:
+            plotSB(spectrum, args.plot_proportion, args.outFile)
+        elif args.rna:
+            plotRNA(spectrum, args.plot_proportion, args.outFile)
+        else:
+            plotSpectrumFromDict(spectrum, args.outFile)
 
     return
 
@@ -5,9 +5,11 @@
 import argparse
 import pandas as pd
 import os
-from isvalid import *
-from reconstruct_spectrum import *
-from plot_spectrum import *
+from .isvalid import *
+from .reconstruct_spectrum import *
+from .plot_spectrum import *
+from .spectrum import Spectrum
+from .output_tables import readTable
 
 #Extracts the labels to a dictionary
 def getLabels(labelsFile):
@@ -29,26 +31,24 @@ def postProcessMutations(mutationsFile, labelsFile, rna, outdir):
     allMDict = dict()
     for label in set(labels.values()):
         if not rna:
-            spectraDict[label] = getMutationDict()
+            spectraDict[label] = Spectrum("SBS96")
         else:
-            spectraDict[label] = getRNADict()
+            spectraDict[label] = Spectrum("RNA192")
         allMDict[label] = list()
     
     #Iterate through the mutations and add to the respective spectrum
     mutations = pd.read_csv(mutationsFile.name)
-    for i in range(mutations.shape[0]):
-        branch = mutations["Branch"][i]
-        if branch in labels:
-            bL = labels[branch]
-            spectraDict[bL][mutations["Substitution"][i].replace("[", "").replace(">", "").replace("]", "")] += 1
-            allMDict[bL].append([mutations["Mutation_in_alignment"][i], mutations["Mutation_in_genome"][i], mutations["Substitution"][i], mutations["Branch"][i]])
+    mutations = mutations[mutations["Branch"].isin(labels.keys())].copy()
+    mutations.insert(0, "Label", mutations["Branch"].map(labels))
+    mutations.insert(0, "Channel", mutations["Substitution"].str.replace("[", "", regex = False).str.replace(">", "", regex = False).str.replace("]", "", regex = False))
+    for bL, labelMutations in mutations.groupby("Label", sort = False):
+        spectraDict[bL].addKeys(labelMutations["Channel"])
+        allMDict[bL] = labelMutations[["Mutation_in_alignment", "Mutation_in_genome", "Substitution", "Branch"]].values.tolist()
     
     #Write and plot the spectra
     for eachLabel in spectraDict:
         outFile = open(outdir + "mutational_spectrum_label_" + eachLabel + ".csv", "w")
-        outFile.write("Substitution,Number_of_mutations\n")
-        for eachMutation in spectraDict[eachLabel]:
-            outFile.write(eachMutation[0] + "[" + eachMutation[1] + ">" + eachMutation[2] + "]" + eachMutation[3] + "," + str(spectraDict[eachLabel][eachMutation]) + "\n")
+        spectraDict[eachLabel].writeSpectrum(outFile)
         outFile.close()
 
         #Plot the spectrum
@@ -84,7 +84,7 @@ def filterMutations(mutationsFile, nm, genome_pos, align_pos, rna, outdir):
 
     #Count occurrences of each mutation
     mutations = dict()
-    with open(mutationsFile.name) as f:
+    with readTable(mutationsFile.name) as f:
         next(f)
         for l in f:
             #Extract genome and alignment positions
@@ -99,24 +99,24 @@ def filterMutations(mutationsFile, nm, genome_pos, align_pos, rna, outdir):
     
     #Empty spectrum
     if rna:
-        spectrum = getRNADict()
+        spectrum = Spectrum("RNA192")
     else:
-        spectrum = getMutationDict()
+        spectrum = Spectrum("SBS96")
     
     #Filter mutations
-    with open(mutationsFile.name) as f:
+    keptMutations = list()
+    with readTable(mutationsFile.name) as f:
         next(f)
         for l in f:
             if l.strip().split(",")[0] in mutations:
                 if mutations[l.strip().split(",")[0]] <= mMut:
                     substitution = l.strip().split(",")[2]
-                    spectrum[substitution[0] + substitution[2] + substitution[4] + substitution[6]] += 1
+                    keptMutations.append(substitution[0] + substitution[2] + substitution[4] + substitution[6])
+    spectrum.addKeys(keptMutations)
     
     #Write spectrum
     outFile = open(outdir + "mutational_spectrum_filtered.csv", "w")
-    outFile.write("Substitution,Number_of_mutations\n")
-    for eachMutation in spectrum:
-        outFile.write(eachMutation[0] + "[" + eachMutation[1] + ">" + eachMutation[2] + "]" + eachMutation[3] + "," + str(spectrum[eachMutation]) + "\n")
+    spectrum.writeSpectrum(outFile)
     outFile.close()
 
     #Plot spectrum
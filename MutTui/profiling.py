@@ -0,0 +1,255 @@
+#Optional profiling of the MutTui commands, turned on with --profile
+#The wall time, CPU time and peak memory of each stage of a command and counts of the operations in the command are
+#written to run_profile.json in the output directory of the command. Stages are recorded with profileStage and operations
+#with countOperations, these do nothing when the command is not profiled so they can be left in the commands
+#Peak RSS is the peak memory of the whole process up to the end of a stage, as reported by the operating system.
+#The tracemalloc peak is the peak memory allocated by Python during a stage, tracing allocations slows down Python so
+#this is only done when profiling. Processes started by MutTui, such as treetime and workers, are included in the
+#children CPU time and children peak RSS once they have finished but are not traced by tracemalloc
+
+import os
+import sys
+import json
+import time
+import functools
+import contextlib
+import tracemalloc
+
+#resource is not available on Windows, peak RSS is not recorded there
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from .__init__ import __version__
+
+#Name of the profile written to the output directory
+profile_file = "run_profile.json"
+
+#Profiles of the commands being run, the last is the command currently running. A command run within another command,
+#e.g. a job run by MutTui batch, has its own profile
+active_profiles = list()
+
+#Processes forked from a profiled command, such as workers, are not profiled and do not trace allocations
+#Commands run within these processes, e.g. jobs run by MutTui batch with --workers, are profiled if they are run with --profile
+def stopForkedProfiles():
+    if active_profiles:
+        del active_profiles[:]
+        tracemalloc.stop()
+
+    return
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child = stopForkedProfiles)
+
+#Peak resident memory in MB of the process, or of its finished child processes if children is True
+def getPeakRSS(children = False):
+    if resource is None:
+        return(None)
+
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    #ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    if sys.platform == "darwin":
+        return(peak / 1e6)
+    else:
+        return(peak / 1e3)
+
+#CPU time used by the finished child processes of the process
+def getChildrenCPUTime():
+    times = os.times()
+    return(times.children_user + times.children_system)
+
+#Records the tracemalloc peak since the last call in every open stage and profile, then resets the peak
+#Python 3.8 cannot reset the peak so peaks are since the start of the profile
+def notePeak():
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    for profile in active_profiles:
+        profile.tracemallocPeak = max(profile.tracemallocPeak, peak)
+        for stage in profile.openStages:
+            stage["tracemalloc_peak_mb"] = max(stage["tracemalloc_peak_mb"], peak)
+    if hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+
+    return
+
+#Converts the value of a command option to a value that can be written to JSON, open files are given as their name
+def getOptionValue(value):
+    if isinstance(value, (str, int, float, bool)) or (value is None):
+        return(value)
+    elif isinstance(value, (list, tuple)):
+        return([getOptionValue(v) for v in value])
+    elif hasattr(value, "name"):
+        return(value.name)
+    else:
+        return(str(value))
+
+class RunProfile:
+
+    #outputDir is the directory run_profile.json is written to, files in this directory written during the command
+    #are counted in the bytes written by the command
+    def __init__(self, command, outputDir, options):
+        self.command = command
+        self.outputDir = outputDir
+        self.options = {option: getOptionValue(value) for option, value in options.items() if option != "func"}
+
+        #Stages by name in the order they are first started, a stage started more than once is added up across its runs
+        self.stages = dict()
+        #Stages that have started and not finished, the last is the current stage
+        self.openStages = list()
+        #Operation counts by name
+        self.counts = dict()
+
+        self.tracemallocPeak = 0.0
+        self.start = time.time()
+        self.startWall = time.perf_counter()
+        self.startCPU = time.process_time()
+        self.startChildrenCPU = getChildrenCPUTime()
+
+    def startStage(self, name):
+        notePeak()
+        if name not in self.stages:
+            self.stages[name] = {"name": name, "parent": self.openStages[-1]["name"] if self.openStages else None, "calls": 0,
+                                 "wall_time": 0.0, "cpu_time": 0.0, "children_cpu_time": 0.0, "peak_rss_mb": None,
+                                 "children_peak_rss_mb": None, "tracemalloc_peak_mb": 0.0}
+        stage = self.stages[name]
+        self.openStages.append(stage)
+
+        return((stage, time.perf_counter(), time.process_time(), getChildrenCPUTime()))
+
+    def finishStage(self, started):
+        stage, startWall, startCPU, startChildrenCPU = started
+        notePeak()
+        stage["calls"] += 1
+        stage["wall_time"] += time.perf_counter() - startWall
+        stage["cpu_time"] += time.process_time() - startCPU
+        stage["children_cpu_time"] += getChildrenCPUTime() - startChildrenCPU
+        stage["peak_rss_mb"] = getPeakRSS()
+        stage["children_peak_rss_mb"] = getPeakRSS(children = True)
+        self.openStages.remove(stage)
+
+        return
+
+    def count(self, name, count):
+        self.counts[name] = self.counts.get(name, 0) + count
+
+        return
+
+    #Counts the files in the output directory written since the start of the command and their size
+    #Subdirectories are only searched if they have been changed since the start of the command
+    def countOutputs(self):
+        files = 0
+        size = 0
+        toSearch = [self.outputDir]
+        while toSearch:
+            directory = toSearch.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if stat.st_mtime < self.start:
+                    continue
+                if entry.is_dir():
+                    toSearch.append(entry.path)
+                elif entry.name != profile_file:
+                    files += 1
+                    size += stat.st_size
+
+        return(files, size)
+
+    #Writes the profile to run_profile.json in the output directory, status is complete or failed
+    def write(self, status):
+        notePeak()
+        filesWritten, bytesWritten = self.countOutputs()
+        self.count("files_written", filesWritten)
+        self.count("bytes_written", bytesWritten)
+
+        profile = {"command": self.command,
+                   "version": __version__,
+                   "status": status,
+                   "start": self.start,
+                   "wall_time": time.perf_counter() - self.startWall,
+                   "cpu_time": time.process_time() - self.startCPU,
+                   "children_cpu_time": getChildrenCPUTime() - self.startChildrenCPU,
+                   "peak_rss_mb": getPeakRSS(),
+                   "children_peak_rss_mb": getPeakRSS(children = True),
+                   "tracemalloc_peak_mb": self.tracemallocPeak,
+                   "stages": list(self.stages.values()),
+                   "counts": self.counts,
+                   "options": self.options}
+
+        #The profile is moved into place so it is never partially written
+        with open(os.path.join(self.outputDir, profile_file + ".tmp"), "w") as outFile:
+            json.dump(profile, outFile, indent = 2)
+        os.replace(os.path.join(self.outputDir, profile_file + ".tmp"), os.path.join(self.outputDir, profile_file))
+
+        return
+
+#Returns True if a command is being profiled
+def isProfiling():
+    return(len(active_profiles) > 0)
+
+#Records the code run within the with statement as a stage of the command being profiled
+@contextlib.contextmanager
+def profileStage(name):
+    if not active_profiles:
+        yield
+        return
+
+    profile = active_profiles[-1]
+    started = profile.startStage(name)
+    try:
+        yield
+    finally:
+        profile.finishStage(started)
+
+#Adds count to the number of operations with the given name in the command being profiled
+def countOperations(name, count = 1):
+    if active_profiles:
+        active_profiles[-1].count(name, count)
+
+    return
+
+#Decorates the function of a command so the command is profiled when it is run with --profile
+#outputLocation is a function returning the output directory or output prefix of the command from its arguments
+def profileCommand(command, outputLocation):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(args):
+            if not getattr(args, "profile", False):
+                return(function(args))
+
+            #The profile is written to the output directory, or to the directory of the output prefix or file
+            location = outputLocation(args)
+            location = getattr(location, "name", location)
+            if not os.path.isdir(location):
+                location = os.path.dirname(location) or "."
+
+            #Trace allocations for this command, unless they are already traced by a command this is run within
+            startTracing = not tracemalloc.is_tracing()
+            if startTracing:
+                tracemalloc.start()
+
+            if active_profiles:
+                notePeak()
+            profile = RunProfile(command, location, vars(args))
+            active_profiles.append(profile)
+            status = "failed"
+            try:
+                result = function(args)
+                status = "complete"
+            finally:
+                profile.write(status)
+                active_profiles.remove(profile)
+                if startTracing:
+                    tracemalloc.stop()
+
+            return(result)
+
+        return(wrapper)
+
+    return(decorator)
@@ -1,13 +1,17 @@
 #Takes the alignment and tree output by treetime and reconstructs the mutational spectrum
 
-import argparse
 from Bio import AlignIO, Phylo
+from Bio.Align import MultipleSeqAlignment
 from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
 from collections import OrderedDict, defaultdict
 import numpy as np
-import array
+import mmap
 from treetime import *
 import re
+from .array_tree import readTree
+from .mutation_table import MutationTable, BranchMutationTable
+from .cache import hashContent, loadCachedArray, saveCachedArray, loadAdjacentArray, saveAdjacentArray, memoizeFile
 
 translation_table = np.array([[[b'K', b'N', b'K', b'N', b'X'],
                                [b'T', b'T', b'T', b'T', b'T'],
@@ -35,96 +39,108 @@ translation_table = np.array([[[b'K', b'N', b'K', b'N', b'X'],
                                [b'X', b'X', b'X', b'X', b'X'],
                                [b'X', b'X', b'X', b'X', b'X']]])
 
-reduce_array = np.full(200, 4)
+reduce_array = np.full(256, 4, dtype = np.uint8)
 reduce_array[[65, 97]] = 0
 reduce_array[[67, 99]] = 1
 reduce_array[[71, 103]] = 2
 reduce_array[[84, 116]] = 3
 
-#Converts the positional translation to a dictionary with alignment positions as keys and genome positions as values
-def convertTranslation(positionsFile):
-    #Import the translation file
-    positions = open(positionsFile.name).readlines()
+#Converts codes from reduce_array back to bases, any position that is not A, C, G or T is returned as N
+base_array = np.frombuffer(b"ACGTN", dtype = np.uint8)
 
-    conversion = {}
+#Complement of each base
+complement_dict = {"A": "T", "C": "G", "G": "C", "T": "A"}
 
-    for eachPosition in positions:
-        conversion[int(eachPosition.strip().split("\t")[0])] = int(eachPosition.strip().split("\t")[1])
-    
-    return(conversion)
+#Converts a sequence to a uint8 array of codes from reduce_array, A = 0, C = 1, G = 2, T = 3, other = 4
+def encodeSequence(sequence):
+    return(reduce_array[np.frombuffer(str(sequence).encode(), dtype = np.uint8)])
 
-#Creates a positional translation dictionary with alignment sites as keys and values
-#Used when --all_sites is specified so there is no need to convert the sites
-def allSitesTranslation(alignment):
-    conversion = {}
+#Converts an array of codes from reduce_array back to a sequence
+def decodeSequence(codes):
+    return(base_array[codes].tobytes().decode())
 
-    for eachPosition in range(len(alignment[0].seq)):
-        conversion[int(eachPosition) + 1] = int(eachPosition) + 1
-    
-    return(conversion)
+#Converts the positional translation to an array indexed by alignment position with genome positions as values
+#With --all_sites the positions are the same and no translation is used, this is given as None
+def convertTranslation(positionsFile):
+    #Use the translation saved by a previous run if the translation file has not changed since
+    conversion = loadAdjacentArray(positionsFile.name)
+    if conversion is not None:
+        return(conversion)
 
-#Extracts the mutations and positions along a given branch
-def getMutations(branch, translation):
-    mutations = []
-    for mutation in branch.split('="')[1].split('"')[0].split(","):
-        mutations.append([mutation[0], int(mutation[1:-1]), translation[int(mutation[1:-1])], mutation[-1]])
-
-    return(mutations)
-
-#Gets the name of the upstream clade
-def getParentName(tree, clade):
-    #Check if the clade is one downstream of the root
-    if len(tree.get_path(clade)) >= 2:
-        #Nodes with no mutations along the upstream branch have their IDs imported as name, nodes with mutations as confidence
-        if tree.get_path(clade)[-2].confidence:
-            node = tree.get_path(clade)[-2].confidence
-        else:
-            node = tree.get_path(clade)[-2].name
-    else:
-        node = str(tree.root)
-    return(node)
+    #Import the translation file in a single step, alignment positions are in column 1 and genome positions in column 2
+    positions = np.loadtxt(positionsFile.name, dtype = np.int64, delimiter = "\t", usecols = (0, 1), ndmin = 2)
 
-#Identifies the name of the branch
-def getBranchName(tree, clade):
-    parentNode = getParentName(tree, clade)
+    #Genome position at each alignment position, 0 at alignment positions that are not in the translation file
+    conversion = np.zeros(positions[:, 0].max() + 1 if len(positions) else 1, dtype = np.int32)
+    conversion[positions[:, 0]] = positions[:, 1]
 
-    if clade.is_terminal():
-        return(parentNode + "->" + clade.name)
-    elif clade.confidence:
-        return(parentNode + "->" + clade.confidence)
-    else:
-        return(parentNode + "->" + clade.name)
-
-#Extracts the mutations to a dictionary with branch names as keys and mutations as values
-def getBranchDict(tree, positionTranslation):
-    branchDict = {}
-
-    for clade in tree.find_clades():
-        #Do not analyse the root
-        if len(tree.get_path(clade)) != 0:
-            #Check if there are mutations along the branch
-            if (clade.comment) and (clade.comment != '[&mutations=""]'):
-                branchDict[getBranchName(tree, clade)] = getMutations(clade.comment, positionTranslation)
-            else:
-                branchDict[getBranchName(tree, clade)] = "None"
-    
-    return(branchDict)
+    saveAdjacentArray(conversion, positionsFile.name)
+
+    return(conversion)
 
 #Extracts the mutations in branch_mutations.txt to a dictionary with branch names as keys and mutations as values
 def getBranchMutationNexusDict(NexusFile, translation):
-    branchDict = defaultdict(list)
-
-    with open(NexusFile, 'r') as infile:
-        matches = re.findall("[^,\(\)]+:[.0-9]+\[\&mutations\=\"[,A-Z0-9]*", infile.read())
-        for m in matches:
-            bname = m.split(':')[0]
-            muts = m.split('="')[1].split(",")
-            if muts[0] == '': continue
-            for mut in muts:
-                branchDict[bname].append([mut[0], int(mut[1:-1]), translation[int(mut[1:-1])], mut[-1]])
-
-    return(branchDict)
-
+    return(readAnnotatedTree(NexusFile, translation)[1])
+
+#Mutations in a treetime branch comment
+nexus_mutations = re.compile(r'mutations="([^"]*)"')
+
+#Converts a comma separated string of treetime mutations, e.g. A12G,C15T, to a table of mutations
+def getMutationArray(mutations, translation):
+    return(MutationTable.fromStrings(mutations.split(","), translation))
+
+#Converts an array of mutations to a list of mutations, each a list of reference base, alignment position,
+#genome position and mutant base
+def getMutationList(branchMutations):
+    return([[chr(r), a, g, chr(m)] for r, a, g, m in branchMutations.tolist()])
+
+#Complement of each ASCII base, other characters are unchanged
+complement_ascii = np.arange(256, dtype = np.uint8)
+complement_ascii[[65, 67, 71, 84]] = [84, 71, 67, 65]
+
+#Converts an array of ASCII codes to a string with a character for each code
+def asciiToString(codes):
+    return(np.ascontiguousarray(codes, dtype = np.uint8).tobytes().decode())
+
+#Formats mutations as they are written in the output tables, e.g. A12G
+#refs and alts are strings or lists of strings with the bases of each mutation
+#Returns a list of the mutations in the alignment and a list of the mutations in the genome
+def formatMutations(refs, alignmentPositions, genomePositions, alts):
+    alignmentMutations = [r + str(p) + a for r, p, a in zip(refs, alignmentPositions.tolist(), alts)]
+    genomeMutations = [r + str(p) + a for r, p, a in zip(refs, genomePositions.tolist(), alts)]
+
+    return(alignmentMutations, genomeMutations)
+
+#Formats the mutations in an array of mutations as they are written in the output tables
+def formatMutationArray(branchMutations):
+    return(formatMutations(asciiToString(branchMutations["ref"]), branchMutations["alignment_position"], branchMutations["genome_position"], asciiToString(branchMutations["alt"])))
+
+#Converts a list of mutations back to a table of mutations
+def listToMutationArray(branchMutations):
+    return(MutationTable([ord(m[0]) for m in branchMutations], [m[1] for m in branchMutations], [m[2] for m in branchMutations],
+                         [ord(m[3]) for m in branchMutations]))
+
+#Reads the annotated_tree.nexus from treetime in chunks, extracting the tree and the mutations along each branch in a single pass
+#Returns the tree, with clades named as in treetime, and a BranchMutationTable, used as a dictionary with branch names as keys
+#and tables of mutations as values. Branches without mutations are not included
+#The mutations of all branches are read into a single table once the tree has been read
+def readAnnotatedTree(NexusFile, translation, chunkSize = 1048576):
+    arrayTree = readTree(NexusFile, "nexus", chunkSize)
+
+    #Names of the branches with mutations and the treetime mutations along each branch
+    branchNames = list()
+    branchMutations = list()
+    for name, comment in zip(arrayTree.names, arrayTree.comments):
+        if comment:
+            mutations = nexus_mutations.search(comment)
+            if (mutations) and (mutations.group(1) != ""):
+                branchNames.append(name)
+                branchMutations.append(mutations.group(1))
+
+    #The mutations are only kept in the BranchMutationTable
+    arrayTree.comments = [None] * len(arrayTree)
+
+    return(arrayTree.toPhylo(), BranchMutationTable.fromStrings(branchNames, branchMutations, translation))
 
 #Extracts the mutations in branch_mutations.txt to a dictionary with branch names as keys and mutations as values
 # def getBranchMutationDict(branchFile, translation):
@@ -146,95 +162,175 @@ def getBranchMutationNexusDict(NexusFile, translation):
 #     return(branchDict)
 
 
+#Reads the genome in a reference fasta file as uppercase bytes
+#Kept in memory so the reference is only read once by each process while it is unchanged
+@memoizeFile()
+def readReferenceGenome(referenceFile):
+    ref = AlignIO.read(referenceFile, "fasta")
+    return(bytes(ref[0].seq.upper()))
+
+#Reads a single record from a fasta file without reading the other records, used to read the root sequence from the
+#ancestral_sequences.fasta written by treetime, which contains a genome length sequence for every clade in the tree
+#The file is memory mapped if possible so only the pages containing the record headers and the record are read
+#Returns an alignment containing only the record
+def readFastaRecord(fastaFile, recordName = "NODE_0000000"):
+    header = b">" + recordName.encode()
+
+    with open(fastaFile, "rb") as inFile:
+        try:
+            data = mmap.mmap(inFile.fileno(), 0, access = mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            #Empty files and files that cannot be mapped are read into memory
+            data = inFile.read()
+
+        #Find the header of the record, it must be at the start of a line and followed by whitespace
+        position = data.find(header)
+        while position != -1:
+            end = position + len(header)
+            if ((position == 0) or (data[position - 1] == 10)) and ((end == len(data)) or (data[end] in b" \t\r\n")):
+                break
+            position = data.find(header, end)
+
+        if position == -1:
+            raise RuntimeError(recordName + " not found in " + fastaFile)
+
+        #The sequence runs from the line after the header to the next header
+        sequenceStart = data.find(b"\n", position)
+        if sequenceStart == -1:
+            sequence = b""
+        else:
+            sequenceEnd = data.find(b"\n>", sequenceStart)
+            if sequenceEnd == -1:
+                sequenceEnd = len(data)
+            sequence = data[(sequenceStart + 1):sequenceEnd].translate(None, b" \t\r\n")
+
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+    return(MultipleSeqAlignment([SeqRecord(Seq(sequence.decode()), id = recordName, name = recordName, description = "")]))
+
 #Get the reference sequence, if -r specified this will be the provided genome, otherwise all sites in the alignment are assumed
 #and the root sequence from the ancestral reconstruction is used
 def getReference(reference, all_sites, alignment, positionTranslation):
+    #Extract the root sequence from the reconstruction
+    for sequence in alignment:
+        if sequence.name == "NODE_0000000":
+            root_seq = sequence.seq
+
     if all_sites:
         #Get the reference as the root of the reconstruction
-        for sequence in alignment:
-            if sequence.name == "NODE_0000000":
-                referenceSequence = sequence.seq
+        referenceSequence = str(root_seq)
     
     #Use the provided reference as the reference sequence and substitute in the nucleotides in the inferred root
     #sequence at each variable position. This means the updateReference function uses the root sequence as a
     #starting sequence and updates based on this
     else:
-        ref = AlignIO.read(reference.name, "fasta")
-        #Extract the sequence of the reference and ensure it is uppercase
-        refSeq = ref[0].seq.upper()
-
-        #Reverse the position translation so genome positions are keys and alignment positions are values
-        #Can then iterate through the genome positions and check if they are in this
-        toChange = {j:i for i, j in positionTranslation.items()}
-
-        #Extract the root sequences from the reconstruction
-        for sequence in alignment:
-            if sequence.name == "NODE_0000000":
-                root_seq = sequence.seq
-        
-        #Will be the original reference with the root sequence base substituted at each reconstructed position
-        referenceSequence = ""
-
-        #Iterate through the length of the reference genome. If the position is in toChange, take the dictionary value position from
-        #the root sequence which only contains positions in the translate file. Otherwise, take the position from the reference
-        for pos in range(len(refSeq)):
-            #Check if the position is variable and needs to be taken from the root
-            if (pos + 1) in toChange:
-                referenceSequence += root_seq[toChange[pos + 1] - 1]
-            else:
-                referenceSequence += refSeq[pos]
-    
-    return(referenceSequence)
+        #Copy the reference genome to a byte array that can be updated
+        referenceArray = np.frombuffer(readReferenceGenome(reference.name), dtype = np.uint8).copy()
+        rootArray = np.frombuffer(bytes(root_seq), dtype = np.uint8)
 
-#Updates the original reference sequence so it includes the mutations acquired up to the given clade
-#Converts the reference to an array, iterates through the upstream branches and updates each of the positions
-#that mutated along an upstream branch to the mutated base
-#If a position has changed multiple times along the upstream branches, this keeps the most recent change as the
-#clades are iterated through from the root through to the most recent upstream branch
-####Used when reading in the annotated tree
-####def updateReference(tree, clade, branchMutationDict, refSeq):
-    ####Convert the reference sequence to an array
-    ####referenceArray = array.array("u", refSeq)
-
-    ####Iterate through the upstream branches leading to the node at the start of the current branch
-    ####for upstreamClade in tree.get_path(clade)[:-1]:
-        ####Check if there are any mutations along the current upstream branch
-        ####if branchMutationDict[getBranchName(tree, upstreamClade)] != "None":
-            ####Iterate through the previous mutations and update the reference sequence
-            ####for eachMutation in branchMutationDict[getBranchName(tree, upstreamClade)]:
-                ####referenceArray[eachMutation[2] - 1] = eachMutation[3]
+        #Alignment positions in the translation and the genome positions they translate to
+        #If multiple alignment positions translate to the same genome position, the last alignment position is used
+        alignmentPositions = np.flatnonzero(positionTranslation)
+        genomePositions = positionTranslation[alignmentPositions].astype(np.int64)
+
+        #Take the base at each variable position within the reference from the root sequence in a single step
+        inReference = (genomePositions >= 1) & (genomePositions <= len(referenceArray))
+        referenceArray[genomePositions[inReference] - 1] = rootArray[alignmentPositions[inReference] - 1]
+
+        referenceSequence = referenceArray.tobytes().decode()
     
-    ####return("".join(referenceArray))
+    return(referenceSequence)
 
 #Updates the original reference sequence so it includes the mutations acquired up to the given clade
 #Converts the reference to an array, iterates through the upstream branches and updates each of the positions
 #that mutated along an upstream branch to the mutated base
 #If a position has changed multiple times along the upstream branches, this keeps the most recent change as the
 #clades are iterated through from the root through to the most recent upstream branch
-def updateReference(tree, clade, branchMutationDict, refSeq):
-    #Convert the reference sequence to an array
-    referenceArray = array.array("u", refSeq)
+#Takes a TreeIndex of the tree and a dictionary of tables of mutations from readAnnotatedTree
+#This copies the reference for each clade, iterateBranchReferences is used when visiting every branch and is checked against this
+def updateReference(treeIndex, clade, branchMutationDict, refSeq):
+    #Convert the reference sequence to an array of ASCII codes
+    referenceArray = np.frombuffer(refSeq.encode(), dtype = np.uint8).copy()
 
     #Iterate through the upstream branches leading to the node at the start of the current branch
-    for upstreamClade in tree.get_path(clade)[:-1]:
+    for upstreamClade in treeIndex.getPath(clade)[:-1]:
         #Check if there are any mutations along the current upstream branch
         if upstreamClade.name in branchMutationDict:
-            #Iterate through the previous mutations and update the reference sequence
-            for eachMutation in branchMutationDict[upstreamClade.name]:
-                referenceArray[eachMutation[2] - 1] = eachMutation[3]
+            #Update the reference sequence with the mutated bases
+            branchMutations = branchMutationDict[upstreamClade.name]
+            referenceArray[branchMutations["genome_position"] - 1] = branchMutations["alt"]
     
-    return("".join(referenceArray))
+    return(asciiToString(referenceArray))
+
+#Iterates through the clades in the tree depth first, returning each clade along with the reference sequence at the
+#start of its branch, i.e. containing the mutations acquired along all of its upstream branches
+#A single reference array is kept. The mutations along a branch are applied on the way down the tree and reverted on
+#the way back up, so the context of each branch is obtained without copying the genome
+#Takes a dictionary of tables of mutations from readAnnotatedTree
+#The mutations along a branch are applied after its clade has been processed, so mutations removed from
+#branchMutationDict while processing the branch are not carried into the downstream branches, as with updateReference
+#The returned reference is updated in place so is only valid until the next clade is requested
+#If subtree is given only the clades in the subtree are visited and refSeq is the reference at the start of the branch
+#leading to the subtree, the subtree clade is a branch so its mutations are applied. tree is not used in this case
+#Clades in stopClades, a set of clade ids, are returned but their downstream clades are not visited
+def iterateBranchReferences(tree, branchMutationDict, refSeq, subtree = None, stopClades = frozenset()):
+    #Convert the reference sequence to an array of base codes that will be updated in place
+    #refSeq can also be an array of base codes, this is updated in place
+    if isinstance(refSeq, str):
+        referenceArray = encodeSequence(refSeq)
+    else:
+        referenceArray = refSeq
+
+    #The root is not a branch so its mutations are not applied
+    if subtree is None:
+        subtree = tree.root
+        root = tree.root
+    else:
+        root = None
+
+    #Clades still to be visited. The second element is None for clades that have not been processed and
+    #contains the positions and bases replaced along the branch once the clade has been processed
+    toVisit = [(subtree, None)]
+
+    while toVisit:
+        clade, replaced = toVisit.pop()
+
+        #All of the downstream branches have been visited, revert the mutations along the branch
+        if replaced is not None:
+            referenceArray[replaced[0]] = replaced[1]
+            continue
+
+        yield(clade, referenceArray)
+
+        if id(clade) in stopClades:
+            continue
+
+        #Apply the mutations along the branch
+        if (clade is not root) and (clade.name in branchMutationDict) and (len(branchMutationDict[clade.name]) > 0):
+            positions = branchMutationDict[clade.name]["genome_position"] - 1
+            replaced = (positions, referenceArray[positions])
+            referenceArray[positions] = reduce_array[branchMutationDict[clade.name]["alt"]]
+        else:
+            replaced = (np.array([], dtype = int), np.array([], dtype = np.uint8))
+
+        #Revisit the clade once its downstream clades have been visited, these are added in reverse
+        #so they are visited in the same order as find_clades
+        toVisit.append((clade, replaced))
+        for child in reversed(clade.clades):
+            toVisit.append((child, None))
 
 #Identifies the label category of a given branch
 #By default returns None if the branch is a transition between labels
 #If --include_all_branches is used, no branches are labelled None and transition branches are
 #labelled with the downstream node's label
-def getBranchCategory(tree, clade, include_all_branches):
+#Takes a TreeIndex of the tree
+def getBranchCategory(treeIndex, clade, include_all_branches):
     #Identify the label of the upstream node
     #Check if the upstream node is the root
-    if len(tree.get_path(clade)) >= 2:
+    if treeIndex.getDepth(clade) >= 2:
         #Check if the label of the upstream clade is the same as the clade
-        if clade.clade_label == tree.get_path(clade)[-2].clade_label:
+        if clade.clade_label == treeIndex.getParent(clade).clade_label:
             return(clade.clade_label)
         elif include_all_branches:
             return(clade.clade_label)
@@ -242,7 +338,7 @@ def getBranchCategory(tree, clade, include_all_branches):
             return(None)
     
     else:
-        if clade.clade_label == tree.root.clade_label:
+        if clade.clade_label == treeIndex.root.clade_label:
             return(clade.clade_label)
         elif include_all_branches:
             return(clade.clade_label)
@@ -250,204 +346,161 @@ def getBranchCategory(tree, clade, include_all_branches):
             return(None)
 
 #Removes mutations that are at the start or end of the genome or do not involve 2 nucleotides
-#Writes the removed mutations to outMutationsNotUsed
-#Splits double substitutions into a separate list
-#Returns the filtered mutations as a list
+#Writes the removed mutations to outMutationsNotUsed, a TableWriter
+#Splits double substitutions into a separate array
+#Takes an array of mutations from readAnnotatedTree
+#Returns the filtered mutations and the double substitutions, sorted by genome position, as arrays
+#Mutations at adjacent genome positions are identified by comparing each mutation with the following mutation on the branch
+#A run of 2 adjacent mutations is a double substitution, all mutations in a run of 3 or more are removed as a tract
 def filterMutations(branchMutations, clade, nucleotides, referenceLength, outMutationsNotUsed):
-    positionsToRemove = []
-    doubleSubstitutions = []
-    #Used to distinguish double substitutions from longer tracts of substitutions
-    #positionsToExclude = []
-    #doubleSubstitutionPositions = []
-
-    #print("LENGTH:", len(branchMutations))
-
-    #Check if there are double substitutions along the branch and remove these mutations
-    for mutation1 in range(len(branchMutations)):
-        #Check if the position is the last mutation, if so don't compare it to the next one. Needed
-        #so the final mutation on the branch can still be checked for being at the start or end of the genome
-        if (mutation1 + 1) != len(branchMutations):
-            #Check if the following mutation is at the adjacent genome position
-            if branchMutations[mutation1 + 1][2] == (branchMutations[mutation1][2] + 1):
-                if mutation1 in doubleSubstitutions:
-                    positionsToRemove.append(mutation1 - 1)
-                    positionsToRemove.append(mutation1)
-                    positionsToRemove.append(mutation1 + 1)
-                #positionsToRemove.append(mutation1)
-                #positionsToRemove.append(mutation1 + 1)
-                #doubleSubstitutions.append(branchMutations[mutation1])
-                #doubleSubstitutions.append(branchMutations[mutation1 + 1])
-                doubleSubstitutions.append(mutation1)
-                doubleSubstitutions.append(mutation1 + 1)
-        #Check if the position is at the start or end of the genome
-        if (branchMutations[mutation1][2] == 1) or (branchMutations[mutation1][2] == referenceLength):
-            positionsToRemove.append(mutation1)
-            #Write the mutation to the mutations not used file
-            outMutationsNotUsed.write(branchMutations[mutation1][0] + str(branchMutations[mutation1][1]) + branchMutations[mutation1][3] + "," + branchMutations[mutation1][0] + str(branchMutations[mutation1][2]) + branchMutations[mutation1][3] + "," + clade.name + ",End_of_genome\n")
-        #Check if the mutation does not involve 2 nucleotides
-        elif ((branchMutations[mutation1][0] not in nucleotides) or (branchMutations[mutation1][3] not in nucleotides)) and (mutation1 not in doubleSubstitutions):
-            positionsToRemove.append(mutation1)
-            outMutationsNotUsed.write(branchMutations[mutation1][0] + str(branchMutations[mutation1][1]) + branchMutations[mutation1][3] + "," + branchMutations[mutation1][0] + str(branchMutations[mutation1][2]) + branchMutations[mutation1][3] + "," + clade.name + ",Mutation_does_not_involve_two_nucleotides\n")
-    
-    #If there is a tract of 3 or more substitutions at adjacent positions, some of the mutations
-    #will be in doubleSubstitutions twice. Extract the unique double substitution positions
-    if len(doubleSubstitutions) != 0:
-        doubleSubstitutionPositions = [ position for position in doubleSubstitutions if position not in positionsToRemove ]
-        doubleSubstitutionMutations = [ branchMutations[i] for i in doubleSubstitutionPositions ]
-        #Ensure the double substitutions are sorted by genome position
-        doubleSubstitutionMutations.sort(key = lambda x: x[2])
-        #Write the positions in a 3 or more substitution tract
-        for s in set(doubleSubstitutions):
-            if s in positionsToRemove:
-                outMutationsNotUsed.write(branchMutations[s][0] + str(branchMutations[s][1]) + branchMutations[s][3] + "," + branchMutations[s][0] + str(branchMutations[s][2]) + branchMutations[s][3] + "," + clade.name + ",In_tract_of_three_or_more_substitutions\n")
-    else:
-        doubleSubstitutionMutations = []
-    
-    #uniqueDoubleSubstitutions = []
-    #if len(doubleSubstitutions) != 0:
-    #if len(doubleSubstitutionMutations) > 0:
-    #    dsSet = set()
-    #    for ds in doubleSubstitutions:
-    #        if tuple(ds) not in dsSet:
-    #            uniqueDoubleSubstitutions.append(ds)
-    #            dsSet.add(tuple(ds))
-    ####Write the double substitutions
-    ####Will be removed once double substitutions are incorporated
-    #for uds in uniqueDoubleSubstitutions:
-    #    outMutationsNotUsed.write(uds[0] + str(uds[1]) + uds[3] + "," + uds[0] + str(uds[2]) + uds[3] + "," + clade.name + ",Double_substitution\n")
-    
-    #Add the double substitutions into the positions to be removed from the single substitutions
-    for eachPosition in doubleSubstitutions:
-        if eachPosition not in positionsToRemove:
-            positionsToRemove.append(eachPosition)
-    positionsToRemove = set(positionsToRemove)
-
-    #Remove the positions that will not be included in the spectrum
-    if len(positionsToRemove) != 0:
-        #Identify the unique set of positions, if there are 3 or more consecutive positions to be removed,
-        #at least one of these positions will be in positionsToRemove more than once
-        uniquePositionsToRemove = list(set(positionsToRemove))
-        #Remove the positions from the mutations
-        for ele in sorted(uniquePositionsToRemove, reverse = True):
-            del branchMutations[ele]
-    
-    return(branchMutations, doubleSubstitutionMutations)
+    if len(branchMutations) == 0:
+        return(branchMutations, branchMutations)
 
-#Translates a given nucleotide sequence to protein
-def translateSequence(sequence, strand):
-    if strand == "+":
-        return(Seq("".join(sequence)).translate())
-    else:
-        return(Seq("".join(sequence)).reverse_complement().translate())
-
-#Identifies the amino acid position of a nucleotide within a gene
-#If the gene is on the positive strand, this is the nucleotide position divided by 3, rounded up
-#If the gene is on the negative strand, this is the nucleotide position from the end of the gene divided by 3, rounded up
-def extractPosition(geneCoordinates, positionInGene):
-    if geneCoordinates[2] == "+":
-        return(int(positionInGene/3) + (positionInGene % 3 > 0))
-    else:
-        reversePosition = geneCoordinates[1] - (geneCoordinates[0] + positionInGene) + 1
-        return(int(reversePosition/3) + (reversePosition % 3 > 0))
+    genomePositions = branchMutations["genome_position"]
+
+    #Identify the runs of mutations at adjacent positions, a new run starts at each mutation that does not follow
+    #on from the previous mutation. Each mutation is given the length of the run it is in
+    adjacent = genomePositions[1:] == (genomePositions[:-1] + 1)
+    runs = np.cumsum(np.concatenate(([True], ~adjacent))) - 1
+    runLengths = np.bincount(runs)[runs]
+
+    #Mutations at the start or end of the genome
+    endOfGenome = (genomePositions == 1) | (genomePositions == referenceLength)
+
+    #Single mutations that do not involve 2 nucleotides, mutations in double substitutions are checked when the
+    #double substitution is added to the spectrum
+    nucleotideCodes = np.frombuffer("".join(nucleotides).encode(), dtype = np.uint8)
+    notNucleotide = (~np.isin(branchMutations["ref"], nucleotideCodes) | ~np.isin(branchMutations["alt"], nucleotideCodes)) & (runLengths == 1) & (~endOfGenome)
+
+    #Write the removed single mutations to the mutations not used file
+    removed = np.nonzero(endOfGenome | notNucleotide)[0]
+    reasons = np.where(endOfGenome[removed], "End_of_genome", "Mutation_does_not_involve_two_nucleotides").tolist()
+    outMutationsNotUsed.addRows(*formatMutationArray(branchMutations[removed]), clade.name, reasons)
+
+    #Write the positions in a 3 or more substitution tract, also includes mutations in double substitutions at the end of the genome
+    #The mutations are written in the order of the set of the pairs of adjacent mutations
+    adjacentStarts = np.nonzero(adjacent)[0]
+    if len(adjacentStarts) != 0:
+        tract = [i for i in set(np.column_stack((adjacentStarts, adjacentStarts + 1)).ravel().tolist()) if (runLengths[i] >= 3) or (endOfGenome[i])]
+        outMutationsNotUsed.addRows(*formatMutationArray(branchMutations[tract]), clade.name, "In_tract_of_three_or_more_substitutions")
+
+    #Extract the double substitutions and ensure they are sorted by genome position
+    doubleSubstitutionPositions = np.nonzero((runLengths == 2) & (~endOfGenome))[0]
+    doubleSubstitutionPositions = doubleSubstitutionPositions[np.argsort(genomePositions[doubleSubstitutionPositions], kind = "stable")]
+
+    #Remove the mutations that will not be included in the spectrum of single substitutions
+    keep = (runLengths == 1) & (~endOfGenome) & (~notNucleotide)
+
+    return(branchMutations[keep], branchMutations[doubleSubstitutionPositions])
+
+#Codes from reduce_array of the complement of each base, other characters stay as 4
+complement_codes = np.array([3, 2, 1, 0, 4], dtype = np.uint8)
+
+#Returns the zero based genome positions of the codon containing each position, in the order of the codon on the
+#strand of the gene, and whether the codon is complete within the gene
+#Codons start at the gene start on the positive strand and at the gene end on the negative strand
+#starts, ends and geneStrands are the coordinates of the gene of each position
+def getCodonPositions(genomePositions, starts, ends, geneStrands):
+    forward = geneStrands == "+"
+
+    #Codon start of each position, counted along the gene on its strand
+    codonStarts = np.where(forward, genomePositions - ((genomePositions - starts) % 3), genomePositions + ((ends - genomePositions) % 3))
+    codonPositions = np.where(forward[:, None], codonStarts[:, None] + np.arange(3), codonStarts[:, None] - np.arange(3)) - 1
+
+    completeCodon = np.where(forward, codonStarts + 2 <= ends, codonStarts - 2 >= starts)
+
+    return(codonPositions, completeCodon)
+
+#Translates codons of base codes on the given strands to amino acids with translation_table
+def translateCodons(codons, forward):
+    codons = np.where(forward[:, None], codons, complement_codes[codons])
+    return(translation_table[codons[:, 0], codons[:, 1], codons[:, 2]])
 
 #Extracts synonymous mutations along a given branch
 #Used when --synonymous is specified
-def extractSynonymous(branchMutations, updatedReference, geneCoordinates, positionGene):
-    #Gene sequences at the upstream node
-    upstreamGenes = dict()
-    #Gene sequences containing mutations along the branch
-    downstreamGenes = dict()
-
-    positionsToRemove = []
-
-    #Iterate through the mutations to create dictionaries of each gene that mutates along the branch
-    #with their nucleotide sequences pre and post mutations
-    for mutation in branchMutations:
-        #Check if the mutation is in a gene, if the position isn't in positionGene, the position is intergenic
-        if mutation[2] not in positionGene:
-            continue
-        #Iterate through the genes the position is in, check if they are already present, mutate if so, if not
-        #add to dictionaries and mutate
-        for geneName in positionGene[mutation[2]].split("____"):
-            #Position of the mutation in the gene, zero based
-            positionInGene = mutation[2] - geneCoordinates[geneName][0]
-            if geneName in downstreamGenes:
-                downstreamGenes[geneName][positionInGene] = mutation[3]
-            else:
-                upstreamGenes[geneName] = array.array("u", updatedReference[(geneCoordinates[geneName][0] - 1):geneCoordinates[geneName][1]])
-                downstreamGenes[geneName] = array.array("u", updatedReference[(geneCoordinates[geneName][0] - 1):geneCoordinates[geneName][1]])
-                #Mutate the position in the downstream gene
-                downstreamGenes[geneName][positionInGene] = mutation[3]
-    
-    #Iterate through the mutations again, check if the translated position of the mutation changes along the branch
-    #Second iteration needed because 1st and 3rd codon positions may both change along a branch
-    for i, mutation in enumerate(branchMutations):
-        #Check if the mutation is in a gene, if the position isn't in positionGene, the position is intergenic
-        if mutation[2] not in positionGene:
-            continue
-        #Will change to False if the amino acid of the mutation has changed in any gene it is present in
-        synonymous = True
-        #Iterate through the genes the position is in, check if the position's amino acid changes, if so change synonymous to False
-        for geneName in positionGene[mutation[2]].split("____"):
-            #Position of the mutation in the gene, zero based
-            positionInGene = mutation[2] - geneCoordinates[geneName][0]
-            upstreamAA = translateSequence(upstreamGenes[geneName], geneCoordinates[geneName][2])
-            downstreamAA = translateSequence(downstreamGenes[geneName], geneCoordinates[geneName][2])
-            aaPosition = extractPosition(geneCoordinates[geneName], positionInGene) - 1
-
-            if upstreamAA[aaPosition] != downstreamAA[aaPosition]:
-                synonymous = False
-        
-        #If the mutation is nonsynonymous within any gene, remove it
-        if synonymous == False:
-            positionsToRemove.append(i)
+#Takes an array of mutations and returns the array of synonymous mutations
+#Each mutation is compared with the codon it is in, in each gene it is in. The downstream codon includes all mutations
+#along the branch so multiple mutations in the same codon are translated together
+#Mutations in an incomplete codon at the end of a gene are not compared
+def extractSynonymous(branchMutations, updatedReference, geneIndex):
+    genomePositions = branchMutations["genome_position"]
+
+    #Each pair of a mutation and a gene it is in, intergenic mutations are not in any pair
+    mutationIndices, geneIndices = geneIndex.getGenes(genomePositions)
     
-    #Remove the positions that will not be included in the spectrum
-    if len(positionsToRemove) != 0:
-        #Identify the unique set of positions
-        uniquePositionsToRemove = list(set(positionsToRemove))
-        #Remove the positions from the mutations
-        for ele in sorted(uniquePositionsToRemove, reverse = True):
-            del branchMutations[ele]
-    
-    return(branchMutations)
+    if len(mutationIndices) == 0:
+        return(branchMutations)
+
+    starts = geneIndex.starts[geneIndices]
+    ends = geneIndex.ends[geneIndices]
+    geneStrands = geneIndex.strands[geneIndices]
+
+    codonPositions, completeCodon = getCodonPositions(genomePositions[mutationIndices], starts, ends, geneStrands)
+
+    #Codons at the upstream node
+    upstreamCodons = updatedReference[codonPositions]
 
-#Identifies the strand bias of each mutation
-def getStrandBias(mutation, updatedReference, geneCoordinates, positionGene):
-    #print(mutation)
-    #Strands of the genes the mutation is in, used to exclude mutations in multiple genes on opposing strands
-    ss = set()
+    #Codons including the mutations along the branch. If a position mutates more than once, the last mutation is used
+    mutatedBases = dict(zip((genomePositions - 1).tolist(), reduce_array[branchMutations["alt"]].tolist()))
+    mutatedPositions = np.array(list(mutatedBases.keys()), dtype = np.int64)
+    mutatedCodes = np.array(list(mutatedBases.values()), dtype = np.uint8)
+    order = np.argsort(mutatedPositions)
+    mutatedPositions = mutatedPositions[order]
+    mutatedCodes = mutatedCodes[order]
 
-    #Get the strand of each gene the mutation is in and add to ss
-    for g in positionGene[mutation[2]].split("____"):
-        ss.add(geneCoordinates[g][2])
+    mutationMatch = np.minimum(np.searchsorted(mutatedPositions, codonPositions), len(mutatedPositions) - 1)
+    downstreamCodons = np.where(mutatedPositions[mutationMatch] == codonPositions, mutatedCodes[mutationMatch], upstreamCodons)
+
+    #If the mutation is nonsynonymous within any gene, remove it
+    forward = geneStrands == "+"
+    nonsynonymous = (translateCodons(upstreamCodons, forward) != translateCodons(downstreamCodons, forward)) & completeCodon
+
+    keep = np.ones(len(branchMutations), dtype = bool)
+    keep[mutationIndices[nonsynonymous]] = False
     
+    return(branchMutations[keep])
+
+#Identifies the strand bias of each mutation in an array of mutations
+#Returns an array with t for transcribed and u for untranscribed mutations, mutations that are intergenic or in
+#multiple genes on different strands are excluded and have an empty string
+def getStrandBias(branchMutations, geneIndex):
+    mutationIndices, geneIndices = geneIndex.getGenes(branchMutations["genome_position"])
+
+    #Number of genes on each strand containing each mutation
+    geneStrands = geneIndex.strands[geneIndices]
+    positiveGenes = np.bincount(mutationIndices[geneStrands == "+"], minlength = len(branchMutations))
+    negativeGenes = np.bincount(mutationIndices[geneStrands == "-"], minlength = len(branchMutations))
+    otherGenes = np.bincount(mutationIndices[(geneStrands != "+") & (geneStrands != "-")], minlength = len(branchMutations))
+
     #Transition mutations
-    transitions = ["C", "T"]
-    
+    transitions = np.isin(branchMutations["ref"], np.frombuffer(b"CT", dtype = np.uint8))
+
+    strandBias = np.full(len(branchMutations), "", dtype = "U1")
+
     #Check if the mutation is in multiple genes on different strands, if so exclude
-    if len(ss) == 1:
-        if (("+" in ss) and (mutation[0] in transitions)) or (("-" in ss) and (mutation[0] not in transitions)):
-            return("t")
-        else:
-            return("u")
-    else:
-        return(None)
+    singleStrand = ((positiveGenes > 0).astype(int) + (negativeGenes > 0) + (otherGenes > 0)) == 1
+    strandBias[singleStrand] = "u"
+    strandBias[singleStrand & (((positiveGenes > 0) & transitions) | ((negativeGenes > 0) & ~transitions))] = "t"
+
+    return(strandBias)
 
 #Identifies the context of a mutation
 def getContext(mutation, updatedReference):
     return(updatedReference[mutation[2] - 2], updatedReference[mutation[2]])
 
+#Identifies the contexts of all mutations in an array of mutations along a branch from the reference array of base codes
+#Returns the upstream and downstream base codes of each mutation and whether both of these are A, C, G or T
+def getBranchContexts(branchMutations, updatedReference):
+    positions = branchMutations["genome_position"]
+    upstream = updatedReference[positions - 2]
+    downstream = updatedReference[positions]
+    nucleotideContext = (upstream < 4) & (downstream < 4)
+
+    return(upstream, downstream, nucleotideContext)
+
 #Takes a base and returns the complement base
 def complement(base):
-    if base == "A":
-        return "T"
-    elif base == "C":
-        return "G"
-    elif base == "G":
-        return "C"
-    elif base == "T":
-        return "A"
+    return(complement_dict.get(base))
 
 #Creates an empty mutational spectrum dictionary for DNA datasets, i.e. combining symmetric mutations
 def getMutationDict():
@@ -1156,22 +1209,53 @@ def getRNATripletDict():
 
     return(tripletDict)
 
+#Codes of the uppercase bases A = 0, C = 1, G = 2, T = 3, all other characters including lowercase bases are 4
+#Used when counting triplets as only uppercase bases are counted as nucleotides
+uppercase_array = np.full(256, 4, dtype = np.uint8)
+uppercase_array[[65, 67, 71, 84]] = [0, 1, 2, 3]
+
+#Position of a triplet of bases in the array of triplet counts
+def getTripletIndex(triplet):
+    return(16 * "ACGT".index(triplet[0]) + 4 * "ACGT".index(triplet[1]) + "ACGT".index(triplet[2]))
+
+#Counts the triplets in a sequence that contain only A, C, G and T on the given strand
+#Returns an array of 64 counts, each triplet is at the position from getTripletIndex
+def countTriplets(sequence):
+    codes = uppercase_array[np.frombuffer(str(sequence).encode(), dtype = np.uint8)]
+    if len(codes) < 3:
+        return(np.zeros(64, dtype = np.int64))
+
+    nucleotideTriplet = (codes[:-2] < 4) & (codes[1:-1] < 4) & (codes[2:] < 4)
+    triplets = 16 * codes[:-2].astype(np.int64) + 4 * codes[1:-1] + codes[2:]
+
+    return(np.bincount(triplets[nucleotideTriplet], minlength = 64).astype(np.int64))
+
+#Triplet counts of a sequence, reused from the cache if the same sequence has been counted before
+def getTripletCounts(sequence, cacheDir = None):
+    key = hashContent(str(sequence))
+
+    tripletCounts = loadCachedArray("triplets", key, cacheDir)
+    if (tripletCounts is None) or (tripletCounts.shape != (64,)):
+        tripletCounts = countTriplets(sequence)
+        saveCachedArray(tripletCounts, "triplets", key, cacheDir)
+
+    return(tripletCounts)
+
 #Calculates the number of each triplet in a given sequence
-def calculateContexts(sequence, rna):
+#Triplets that are not in the triplet dictionary are added to their reverse complement
+def calculateContexts(sequence, rna, cacheDir = None):
     if not rna:
         tripletDict = getTripletDict()
     else:
         tripletDict = getRNATripletDict()
 
-    nucleotides = ["A", "C", "G", "T"]
+    tripletCounts = getTripletCounts(sequence, cacheDir)
 
-    for i in range(len(sequence) - 2):
-        t = sequence[i:(i+3)]
-        if (t[0] in nucleotides) and (t[1] in nucleotides) and (t[2] in nucleotides):
-            if t in tripletDict:
-                tripletDict[t] += 1
-            else:
-                tripletDict[complement(t[2]) + complement(t[1]) + complement(t[0])] += 1
+    for t in tripletDict:
+        tripletDict[t] = int(tripletCounts[getTripletIndex(t)])
+        reverseComplement = complement(t[2]) + complement(t[1]) + complement(t[0])
+        if reverseComplement not in tripletDict:
+            tripletDict[t] += int(tripletCounts[getTripletIndex(reverseComplement)])
     
     #Add the reverse complement contexts from the reverse strand if the sequence is DNA
     if not rna:
@@ -1182,116 +1266,9 @@ def calculateContexts(sequence, rna):
 
 #Rescales a SBS spectrum by the triplet availability in a provided reference genome
 #Uses code from rescale_spectrum.py but differs as this function doesn't update spectrum keys
+#Takes a Spectrum and returns the rescaled Spectrum
 def rescaleSBS(spectrum, contexts, scalar, rna):
-    #Will be filled with the rescaled spectrum
-    if rna:
-        rescaledSpectrum = getRNADict()
-    else:
-        rescaledSpectrum = getMutationDict()
-    
-    #Iterate through the contextual mutations, scale their counts and add to rescaledSpectrum
-    for m in spectrum:
-        rescaledSpectrum[m] = round((spectrum[m]/contexts[m[0] + m[1] + m[3]]) * scalar)
-
-    return(rescaledSpectrum)
-
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument("-a", help = "ancestral_sequences.fasta from treetime")
-    parser.add_argument("-t", help = "annotated_tree.nexus from treetime")
-    parser.add_argument("-r", help = "Reference genome in fasta format")
-    parser.add_argument("-p", help = "Translation of alignment positions to genome positions, tab separated, no header, alignment positions in column 1, genome positions in column 2")
-    parser.add_argument("-o", help = "Output file prefix, default reconstructions if none given", default = "reconstructions")
-    args = parser.parse_args()
-
-    #Import the ancestral sequence alignment
-    alignment = AlignIO.read(args.a, "fasta")
-
-    #Import the annotated tree
-    tree = Phylo.read(args.t, "nexus")
-
-    #Import the reference genome sequence
-    reference = AlignIO.read(args.r, "fasta")
-    referenceLength = len(reference[0])
-    referenceSequence = str(reference[0].seq)
-
-    #Import the translation file
-    alignmentGenome = open(args.p).readlines()
-
-    #Will contain the number of each contextual mutation
-    outMutations = open(args.o + "_mutational_spectrum.txt", "w")
-    outMutations.write("Mutation_with_context,Number_of_mutations\n")
-
-    #Will contain the mutations that were not included in the contextual spectrum due to lack of surrounding context, includes mutations next to gaps and mutations at the end of the sequence
-    outMutationsNotUsed = open(args.o + "_mutations_not_included.txt", "w")
-    outMutationsNotUsed.write("Mutation,Branch,Reason_not_included\n")
-    
-    #Convert the translation file to a dictionary
-    positionTranslation = convertTranslation(alignmentGenome)
-
-    #Identify the variable positions in the genome
-    variablePositions = getVariablePositions(positionTranslation)
-
-    #Extract the mutations in each branch into a dictionary
-    branchMutationDict = getBranchDict(tree, positionTranslation)
-
-    #Create an empty mutational spectrum
-    spectrum = getMutationDict()
-
-    #The 4 nucleotides, used to check if upstream and downstream bases are nucleotides
-    nucleotides = ["A","C","G","T"]
-
-    #Iterate through the branches, extract the mutations, get their context and add to mutationSpectrum
-    for clade in tree.find_clades():
-        #Do not analyse the root
-        if len(tree.get_path(clade)) != 0:
-            #Identify the name of the branch for saving mutations
-            branchName = getBranchName(tree, clade)
-            #Check if there are mutations along the branch, the .comment is only added to the clade if there are
-            if clade.comment:
-                branchMutations = getMutations(clade.comment, positionTranslation)
-
-                #Check if there are double substitutions along the branch and remove these mutations
-                if len(branchMutations) > 1:
-                    positionsToRemove = []
-                    for mutation1 in range(0, (len(branchMutations) - 1)):
-                        for mutation2 in range((mutation1 + 1), len(branchMutations)):
-                            if branchMutations[mutation2][2] == (branchMutations[mutation1][2] + 1):
-                                positionsToRemove.append(mutation1)
-                                positionsToRemove.append(mutation2)
-                    if len(positionsToRemove) != 0:
-                        #Write the positions to the mutations not analysed file
-                        for removePosition in positionsToRemove:
-                            outMutationsNotUsed.write(branchMutations[removePosition][0] + str(branchMutations[removePosition][1]) + branchMutations[removePosition][3] + "," + branchName + ",Double_substitution\n")
-                        #Remove the positions from the mutations
-                        for ele in sorted(positionsToRemove, reverse = True):
-                            del branchMutations[ele]
-
-                #Update the reference sequence to get the current context
-                updatedReference = updateReference(tree, clade, branchMutationDict, referenceSequence)
-
-                for mutation in branchMutations:
-                    #Check if the mutation is at the end of the genome, if it is it does not have context so cannt be analysed
-                    if (mutation[2] == 1) or (mutation[2] == referenceLength):
-                        outMutationsNotUsed.write(mutation[0] + str(mutation[1]) + mutation[3] + "," + branchName + ",End_of_genome\n")
-                    #Check if the mutation does not involve 2 nucleotides
-                    elif (mutation[0] not in nucleotides) or (mutation[3] not in nucleotides):
-                        outMutationsNotUsed.write(mutation[0] + str(mutation[1]) + mutation[3] + "," + branchName + ",Mutation_does_not_involve_two_nucleotides\n")
-                    else:
-                        mutationContext = getContext(mutation, updatedReference)
-
-                        #Check if the upstream or downstream nucleotides are not A, C, G or T
-                        if (mutationContext[0] not in nucleotides) or (mutationContext[1] not in nucleotides):
-                            outMutationsNotUsed.write(mutation[0] + str(mutation[1]) + mutation[3] + "," + branchName + ",Surrounding_position_not_nucleotide\n")
-                        else:
-                            if (mutationContext[0] + mutation[0] + mutation[3] + mutationContext[1]) in spectrum:
-                                spectrum[mutationContext[0] + mutation[0] + mutation[3] + mutationContext[1]] += 1
-                            else:
-                                spectrum[complement(mutationContext[0]) + complement(mutation[0]) + complement(mutation[3]) + complement(mutationContext[1])] += 1
-    
-    #Write the mutational spectrum
-    for eachSpectrum in spectrum:
-        outMutations.write(eachSpectrum + "," + str(spectrum[eachSpectrum]) + "\n")
+    #Number of available triplets of each contextual mutation
+    channelContexts = np.array([contexts[m[0] + m[1] + m[3]] for m in spectrum])
 
-    outMutations.close()
-    outMutationsNotUsed.close()
\ No newline at end of file
+    return(spectrum.rescale(channelContexts, scalar))
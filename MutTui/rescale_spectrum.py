@@ -2,10 +2,12 @@
 #The relative height of each peak in the spectrum will be scaled by the proportion of the context in the given file
 
 import argparse
+import numpy as np
 from collections import OrderedDict, Counter
 from Bio import SeqIO
-from plot_spectrum import convertSpectrumDict
-from reconstruct_spectrum import getMutationDict, getRNADict, getDoubleSubstitutionDict, complement
+from .plot_spectrum import convertSpectrumDict
+from .reconstruct_spectrum import complement, calculateContexts
+from .spectrum import spectrumFromDict
 
 #Removes the brackets and > from spectrum keys
 def convertSpectrumKeys(spectrum):
@@ -25,114 +27,6 @@ def convertDoubleKeys(spectrum):
     
     return(s)
 
-#Creates an empty dictionary of triplets
-def getTripletDict():
-    tripletDict = OrderedDict()
-    tripletDict["ACA"] = 0
-    tripletDict["ACC"] = 0
-    tripletDict["ACG"] = 0
-    tripletDict["ACT"] = 0
-    tripletDict["CCA"] = 0
-    tripletDict["CCC"] = 0
-    tripletDict["CCG"] = 0
-    tripletDict["CCT"] = 0
-    tripletDict["GCA"] = 0
-    tripletDict["GCC"] = 0
-    tripletDict["GCG"] = 0
-    tripletDict["GCT"] = 0
-    tripletDict["TCA"] = 0
-    tripletDict["TCC"] = 0
-    tripletDict["TCG"] = 0
-    tripletDict["TCT"] = 0
-    tripletDict["ATA"] = 0
-    tripletDict["ATC"] = 0
-    tripletDict["ATG"] = 0
-    tripletDict["ATT"] = 0
-    tripletDict["CTA"] = 0
-    tripletDict["CTC"] = 0
-    tripletDict["CTG"] = 0
-    tripletDict["CTT"] = 0
-    tripletDict["GTA"] = 0
-    tripletDict["GTC"] = 0
-    tripletDict["GTG"] = 0
-    tripletDict["GTT"] = 0
-    tripletDict["TTA"] = 0
-    tripletDict["TTC"] = 0
-    tripletDict["TTG"] = 0
-    tripletDict["TTT"] = 0
-
-    return(tripletDict)
-
-#Creates an empty dictionary of RNA triplets
-def getRNATripletDict():
-    tripletDict = OrderedDict()
-    tripletDict["ACA"] = 0
-    tripletDict["ACC"] = 0
-    tripletDict["ACG"] = 0
-    tripletDict["ACT"] = 0
-    tripletDict["CCA"] = 0
-    tripletDict["CCC"] = 0
-    tripletDict["CCG"] = 0
-    tripletDict["CCT"] = 0
-    tripletDict["GCA"] = 0
-    tripletDict["GCC"] = 0
-    tripletDict["GCG"] = 0
-    tripletDict["GCT"] = 0
-    tripletDict["TCA"] = 0
-    tripletDict["TCC"] = 0
-    tripletDict["TCG"] = 0
-    tripletDict["TCT"] = 0
-    tripletDict["ATA"] = 0
-    tripletDict["ATC"] = 0
-    tripletDict["ATG"] = 0
-    tripletDict["ATT"] = 0
-    tripletDict["CTA"] = 0
-    tripletDict["CTC"] = 0
-    tripletDict["CTG"] = 0
-    tripletDict["CTT"] = 0
-    tripletDict["GTA"] = 0
-    tripletDict["GTC"] = 0
-    tripletDict["GTG"] = 0
-    tripletDict["GTT"] = 0
-    tripletDict["TTA"] = 0
-    tripletDict["TTC"] = 0
-    tripletDict["TTG"] = 0
-    tripletDict["TTT"] = 0
-    tripletDict["AAA"] = 0
-    tripletDict["AAC"] = 0
-    tripletDict["AAG"] = 0
-    tripletDict["AAT"] = 0
-    tripletDict["CAA"] = 0
-    tripletDict["CAC"] = 0
-    tripletDict["CAG"] = 0
-    tripletDict["CAT"] = 0
-    tripletDict["GAA"] = 0
-    tripletDict["GAC"] = 0
-    tripletDict["GAG"] = 0
-    tripletDict["GAT"] = 0
-    tripletDict["TAA"] = 0
-    tripletDict["TAC"] = 0
-    tripletDict["TAG"] = 0
-    tripletDict["TAT"] = 0
-    tripletDict["AGA"] = 0
-    tripletDict["AGC"] = 0
-    tripletDict["AGG"] = 0
-    tripletDict["AGT"] = 0
-    tripletDict["CGA"] = 0
-    tripletDict["CGC"] = 0
-    tripletDict["CGG"] = 0
-    tripletDict["CGT"] = 0
-    tripletDict["GGA"] = 0
-    tripletDict["GGC"] = 0
-    tripletDict["GGG"] = 0
-    tripletDict["GGT"] = 0
-    tripletDict["TGA"] = 0
-    tripletDict["TGC"] = 0
-    tripletDict["TGG"] = 0
-    tripletDict["TGT"] = 0
-
-    return(tripletDict)
-
 #Creates an empty dictionary of dinucleotides
 def getDinucleotideDict():
     dnDict = OrderedDict()
@@ -149,30 +43,6 @@ def getDinucleotideDict():
 
     return(dnDict)
 
-#Calculates the number of each triplet in a given sequence
-def calculateContexts(sequence, rna):
-    if not rna:
-        tripletDict = getTripletDict()
-    else:
-        tripletDict = getRNATripletDict()
-
-    nucleotides = ["A", "C", "G", "T"]
-
-    for i in range(len(sequence) - 2):
-        t = sequence[i:(i+3)]
-        if (t[0] in nucleotides) and (t[1] in nucleotides) and (t[2] in nucleotides):
-            if t in tripletDict:
-                tripletDict[t] += 1
-            else:
-                tripletDict[complement(t[2]) + complement(t[1]) + complement(t[0])] += 1
-    
-    #Add the reverse complement contexts from the reverse strand if the sequence is DNA
-    if not rna:
-        for c in tripletDict:
-            tripletDict[c] = tripletDict[c] * 2
-    
-    return(tripletDict)
-
 #Calculates the number of each dinucleotide in a given sequence
 def calculateDinucleotides(sequence, rna):
     dnDict = getDinucleotideDict()
@@ -195,21 +65,19 @@ def rescaleSBS(spectrum, reference, scalar, rna):
     #Update spectrum keys
     spectrum = convertSpectrumKeys(spectrum)
 
-    #Extract all triplet contexts from the reference
+    #Extract all triplet contexts from the reference, if the reference contains multiple sequences the last sequence is used
     for record in SeqIO.parse(reference, "fasta"):
-        contexts = calculateContexts(record.seq.upper(), rna)
+        referenceSequence = record.seq
+    contexts = calculateContexts(str(referenceSequence).upper(), rna)
     
-    #Will be filled with the rescaled spectrum
-    if args.rna:
-        rescaledSpectrum = getRNADict()
+    #Convert to a Spectrum
+    if rna:
+        spectrum = spectrumFromDict(spectrum, "RNA192")
     else:
-        rescaledSpectrum = getMutationDict()
+        spectrum = spectrumFromDict(spectrum, "SBS96")
     
-    #Iterate through the contextual mutations, scale their counts and add to rescaledSpectrum
-    for m in spectrum:
-        rescaledSpectrum[m] = round((spectrum[m]/contexts[m[0] + m[1] + m[3]]) * scalar)
-
-    return(rescaledSpectrum)
+    #Scale the count of each contextual mutation by the number of its triplet in the reference
+    return(spectrum.rescale(np.array([contexts[m[0] + m[1] + m[3]] for m in spectrum]), scalar))
 
 #Rescales a mutation type spectrum
 def rescaleMT(spectrum, reference, scalar, rna):
@@ -250,14 +118,11 @@ def rescaleDouble(spectrum, reference, scalar, rna):
     for sequence in SeqIO.parse(reference, "fasta"):
         dn = calculateDinucleotides(sequence.seq, rna)
 
-    #Empty DBS dict
-    rescaledSpectrum = getDoubleSubstitutionDict()
+    #Convert to a Spectrum
+    spectrum = spectrumFromDict(spectrum, "DBS78")
 
-    #Iterate through the mutations and rescale by their starting context availability
-    for m in spectrum:
-        rescaledSpectrum[m] = round((spectrum[m]/dn[m[0] + m[1]]) * scalar)
-    
-    return(rescaledSpectrum)
+    #Rescale the mutations by their starting context availability
+    return(spectrum.rescale(np.array([dn[m[0] + m[1]] for m in spectrum]), scalar))
 
 if __name__ == "__main__":
     description = "Rescales a mutational spectrum based on triplet availability in a given reference"
@@ -312,22 +177,20 @@ if __name__ == "__main__":
     scalar = float(args.scale_factor)
 
     outFile = open(args.outFile, "w")
-    outFile.write("Substitution,Number_of_mutations\n")
 
     #Rescale DNA or RNA mutation type spectrum
     if args.mt:
         rescaledSpectrum = rescaleMT(spectrum, args.reference, scalar, args.rna)
+        outFile.write("Substitution,Number_of_mutations\n")
         for eachMutation in rescaledSpectrum:
             outFile.write(eachMutation + "," + str(rescaledSpectrum[eachMutation]) + "\n")
     #Rescale DNA double substitution spectrum
     elif args.double:
         rescaledSpectrum = rescaleDouble(spectrum, args.reference, scalar, args.rna)
-        for eachMutation in rescaledSpectrum:
-            outFile.write(eachMutation[:2] + ">" + eachMutation[2:] + "," + str(rescaledSpectrum[eachMutation]) + "\n")
+        rescaledSpectrum.writeSpectrum(outFile)
     #Rescale DNA SBS spectrum
     else:
         rescaledSpectrum = rescaleSBS(spectrum, args.reference, scalar, args.rna)
-        for eachMutation in rescaledSpectrum:
-            outFile.write(eachMutation[0] + "[" + eachMutation[1] + ">" + eachMutation[2] + "]" + eachMutation[3] + "," + str(rescaledSpectrum[eachMutation]) + "\n")
+        rescaledSpectrum.writeSpectrum(outFile)
 
     outFile.close()
\ No newline at end of file
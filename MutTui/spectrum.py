@@ -0,0 +1,325 @@
+#Mutational spectra stored as an array of counts with a fixed channel for each mutation
+#The channels of each layout are in the same order as the empty spectrum dictionaries in reconstruct_spectrum.py
+#Layouts:
+#SBS96 - single base substitutions in their trinucleotide context, combining symmetric mutations (DNA)
+#RNA192 - single base substitutions in their trinucleotide context without combining symmetric mutations (RNA)
+#SB192 - SBS96 split by transcribed (t) and untranscribed (u) strand
+#DBS78 - double base substitutions, combining symmetric mutations
+
+import itertools
+import numpy as np
+from .reconstruct_spectrum import getMutationDict, getRNADict, getStrandBiasDict, getDoubleSubstitutionDict, complement
+
+#Channels of each layout
+layoutChannels = {"SBS96": list(getMutationDict()),
+                  "RNA192": list(getRNADict()),
+                  "SB192": list(getStrandBiasDict()),
+                  "DBS78": list(getDoubleSubstitutionDict())}
+
+#Header of the output csv file of each layout
+layoutHeaders = {"SBS96": "Substitution,Number_of_mutations\n",
+                 "RNA192": "Substitution,Number_of_mutations\n",
+                 "SB192": "Strand,Substitution,Number_of_mutations\n",
+                 "DBS78": "Substitution,Number_of_mutations\n"}
+
+#Bases and strands in the order of their codes
+bases = ["A", "C", "G", "T"]
+strands = ["t", "u"]
+
+#Converts a channel to the format written to output csv files
+def getChannelLabel(channel, layout):
+    if layout == "SB192":
+        return(channel[0] + "," + channel[1:])
+    elif layout == "DBS78":
+        return(channel[:2] + ">" + channel[2:])
+    else:
+        return(channel[0] + "[" + channel[1] + ">" + channel[2] + "]" + channel[3])
+
+#Converts a channel to the channel of the same mutation on the opposite strand
+def reverseComplementChannel(channel, layout):
+    if layout == "SB192":
+        return(channel[0] + reverseComplementChannel(channel[1:], "SBS96"))
+    elif layout == "DBS78":
+        return(complement(channel[1]) + complement(channel[0]) + complement(channel[3]) + complement(channel[2]))
+    else:
+        return(complement(channel[3]) + complement(channel[1]) + complement(channel[2]) + complement(channel[0]))
+
+#Creates the arrays used to convert base codes from reduce_array to channels in a layout
+#Single base substitutions are indexed by upstream, reference, mutant and downstream base, with the strand code as
+#the first index in SB192. Double substitutions are indexed by the 2 reference bases followed by the 2 mutant bases
+#Mutations not in the layout are converted to the channel of their reverse complement. The channel is -1 if neither
+#are in the layout, which includes all mutations involving bases that are not A, C, G or T
+def getChannelLookup(layout):
+    channelIndex = {c: i for i, c in enumerate(layoutChannels[layout])}
+
+    if layout == "SB192":
+        strandPrefixes = strands
+    else:
+        strandPrefixes = [""]
+
+    lookup = np.full((len(strandPrefixes), 5, 5, 5, 5), -1, dtype = np.int64)
+    forward = np.zeros((len(strandPrefixes), 5, 5, 5, 5), dtype = bool)
+
+    for s, prefix in enumerate(strandPrefixes):
+        for codes in itertools.product(range(4), repeat = 4):
+            channel = prefix + "".join([bases[c] for c in codes])
+            if channel in channelIndex:
+                lookup[(s,) + codes] = channelIndex[channel]
+                forward[(s,) + codes] = True
+            elif reverseComplementChannel(channel, layout) in channelIndex:
+                lookup[(s,) + codes] = channelIndex[reverseComplementChannel(channel, layout)]
+
+    #Remove the strand index from layouts without strands
+    if layout != "SB192":
+        lookup = lookup[0]
+        forward = forward[0]
+
+    return(channelIndex, lookup, forward)
+
+#Channel index, channel lookup and forward orientation lookup of each layout
+layoutLookups = {layout: getChannelLookup(layout) for layout in layoutChannels}
+
+#Output labels of the channels in each layout
+layoutLabels = {layout: [getChannelLabel(c, layout) for c in layoutChannels[layout]] for layout in layoutChannels}
+
+#A mutational spectrum with a count for each channel in the given layout
+#Can be used in the same way as the spectrum dictionaries, with channels as keys and counts as values
+class Spectrum:
+
+    def __init__(self, layout, counts = None):
+        self.layout = layout
+        self.channels = layoutChannels[layout]
+        self.channelIndex, self.lookup, self.forward = layoutLookups[layout]
+
+        if counts is None:
+            self.counts = np.zeros(len(self.channels), dtype = np.int64)
+        else:
+            self.counts = np.array(counts)
+
+    #Only the layout and counts are pickled, e.g. when sending the spectrum to another process
+    def __reduce__(self):
+        return(Spectrum, (self.layout, self.counts))
+
+    def __iter__(self):
+        return(iter(self.channels))
+
+    def __len__(self):
+        return(len(self.channels))
+
+    def __contains__(self, channel):
+        return(channel in self.channelIndex)
+
+    def __getitem__(self, channel):
+        return(self.counts[self.channelIndex[channel]].item())
+
+    def __setitem__(self, channel, count):
+        self.counts[self.channelIndex[channel]] = count
+
+    def __add__(self, other):
+        return(Spectrum(self.layout, self.counts + other.counts))
+
+    def keys(self):
+        return(list(self.channels))
+
+    def values(self):
+        return(self.counts.tolist())
+
+    def items(self):
+        return(list(zip(self.channels, self.counts.tolist())))
+
+    def copy(self):
+        return(Spectrum(self.layout, self.counts))
+
+    #Converts arrays of base codes to channels, see getChannelLookup for the order of the arrays
+    #Returns the channel of each mutation and whether the mutation is in the orientation of its channel,
+    #i.e. False if the mutation was converted to its reverse complement
+    def getChannels(self, *codes):
+        return(self.lookup[codes], self.forward[codes])
+
+    #Adds mutations to the spectrum from an array of their channels
+    def addChannels(self, channels):
+        if np.any(channels < 0):
+            raise KeyError("Mutation is not in the " + self.layout + " spectrum")
+
+        self.counts += np.bincount(channels, minlength = len(self.channels))
+
+    #Adds mutations to the spectrum from a list of their channel names
+    def addKeys(self, keys):
+        self.addChannels(np.array([self.channelIndex[k] for k in keys], dtype = np.int64))
+
+    #Rescales the spectrum by the number of available contexts of each channel
+    #Channels with no available contexts, e.g. triplets that are not in a short reference, are set to 0 rather than
+    #stopping the rescaling. Mutations in these channels are not in the rescaled spectrum so the channels are reported
+    def rescale(self, contexts, scalar):
+        contexts = np.asarray(contexts)
+        missing = (contexts == 0) & (self.counts > 0)
+        if missing.any():
+            print("Warning: " + ",".join([label for label, m in zip(layoutLabels[self.layout], missing) if m]) + " have mutations but no " +
+                  "available contexts, these are set to 0 in the rescaled spectrum")
+        rescaledCounts = np.divide(self.counts, contexts, out = np.zeros(len(self.channels)), where = contexts != 0)
+
+        return(Spectrum(self.layout, np.round(rescaledCounts * scalar).astype(np.int64)))
+
+    #Writes the spectrum to an open csv file
+    def writeSpectrum(self, outFile):
+        outFile.write(layoutHeaders[self.layout])
+        outFile.write("".join([label + "," + str(count) + "\n" for label, count in zip(layoutLabels[self.layout], self.counts.tolist())]))
+
+#Creates a spectrum from a dictionary with channels as keys and counts as values
+def spectrumFromDict(spectrumDict, layout):
+    spectrum = Spectrum(layout)
+    for channel in spectrumDict:
+        spectrum[channel] = spectrumDict[channel]
+
+    return(spectrum)
+
+#The spectra of individual branches, used with --branch_specific
+#Stored as a sparse branches x channels matrix with a row for each branch in the order the branches are added
+#Only the channels with mutations on each branch are stored
+class BranchSpectra:
+
+    def __init__(self, layout):
+        self.layout = layout
+        self.channels = layoutChannels[layout]
+
+        #Branch names in the order of their rows and the row of each branch
+        self.branches = list()
+        self.branchIndex = dict()
+
+        #Rows, channels and counts of the mutations added to the matrix, combined when the matrix is created
+        self.rows = list()
+        self.channelCounts = list()
+        self.counts = list()
+        #The compressed sparse row matrix, None if mutations have been added since it was created
+        self.matrix = None
+
+    def __iter__(self):
+        return(iter(self.branches))
+
+    def __len__(self):
+        return(len(self.branches))
+
+    def __contains__(self, branch):
+        return(branch in self.branchIndex)
+
+    #Returns a BranchSpectrum used to add mutations to the row of the branch
+    def __getitem__(self, branch):
+        return(BranchSpectrum(self, self.branchIndex[branch]))
+
+    #Adds a branch with no mutations to the matrix if it is not already present, returns the row of the branch
+    def addBranch(self, branch):
+        if branch not in self.branchIndex:
+            self.branchIndex[branch] = len(self.branches)
+            self.branches.append(branch)
+            self.matrix = None
+
+        return(self.branchIndex[branch])
+
+    #Adds mutations to the row of a branch from an array of their channels
+    def addChannels(self, row, channels):
+        if np.any(channels < 0):
+            raise KeyError("Mutation is not in the " + self.layout + " spectrum")
+
+        channelCounts, counts = np.unique(channels, return_counts = True)
+        self.matrix = None
+        self.rows.append(np.full(len(channelCounts), row, dtype = np.int64))
+        self.channelCounts.append(channelCounts.astype(np.int64))
+        self.counts.append(counts.astype(np.int64))
+
+    #Returns the matrix in compressed sparse row format: the channels and counts of the mutations on the branch in
+    #row i are indices[indptr[i]:indptr[i + 1]] and data[indptr[i]:indptr[i + 1]]
+    def getMatrix(self):
+        if self.matrix is None:
+            if self.rows:
+                keys = np.concatenate(self.rows) * len(self.channels) + np.concatenate(self.channelCounts)
+                keys, keyPositions = np.unique(keys, return_inverse = True)
+                data = np.bincount(keyPositions, weights = np.concatenate(self.counts)).astype(np.int64)
+            else:
+                keys = np.zeros(0, dtype = np.int64)
+                data = np.zeros(0, dtype = np.int64)
+
+            #Replace the added mutations with the combined counts
+            self.rows = [keys // len(self.channels)]
+            self.channelCounts = [keys % len(self.channels)]
+            self.counts = [data]
+
+            indptr = np.concatenate(([0], np.cumsum(np.bincount(self.rows[0], minlength = len(self.branches)))))
+            self.matrix = (indptr, self.channelCounts[0], data)
+
+        return(self.matrix)
+
+    #Returns a dense branches x channels array of counts
+    def toDense(self):
+        indptr, indices, data = self.getMatrix()
+        dense = np.zeros((len(self.branches), len(self.channels)), dtype = np.int64)
+        dense[np.repeat(np.arange(len(self.branches)), np.diff(indptr)), indices] = data
+
+        return(dense)
+
+    #Number of mutations on each branch
+    def getTotals(self):
+        indptr, indices, data = self.getMatrix()
+        return(np.bincount(np.repeat(np.arange(len(self.branches)), np.diff(indptr)), weights = data, minlength = len(self.branches)).astype(np.int64))
+
+    #Returns the spectrum of a branch as a Spectrum
+    def getSpectrum(self, branch):
+        indptr, indices, data = self.getMatrix()
+        row = self.branchIndex[branch]
+        spectrum = Spectrum(self.layout)
+        spectrum.counts[indices[indptr[row]:indptr[row + 1]]] = data[indptr[row]:indptr[row + 1]]
+
+        return(spectrum)
+
+    #Creates the spectra from a compressed sparse row matrix
+    @classmethod
+    def fromMatrix(cls, layout, branches, indptr, indices, data):
+        branchSpectra = cls(layout)
+        for branch in branches:
+            branchSpectra.addBranch(branch)
+        branchSpectra.rows.append(np.repeat(np.arange(len(branches)), np.diff(indptr)))
+        branchSpectra.channelCounts.append(np.asarray(indices, dtype = np.int64))
+        branchSpectra.counts.append(np.asarray(data, dtype = np.int64))
+
+        return(branchSpectra)
+
+#A branch in BranchSpectra, has the same methods as Spectrum to add mutations
+class BranchSpectrum:
+
+    def __init__(self, branchSpectra, row):
+        self.branchSpectra = branchSpectra
+        self.row = row
+        self.channelIndex, self.lookup, self.forward = layoutLookups[branchSpectra.layout]
+
+    #Converts arrays of base codes to channels in the same way as Spectrum.getChannels
+    def getChannels(self, *codes):
+        return(self.lookup[codes], self.forward[codes])
+
+    #Adds mutations to the branch from an array of their channels
+    def addChannels(self, channels):
+        self.branchSpectra.addChannels(self.row, channels)
+
+#Writes branch spectra to a single compressed numpy file
+#All spectra should contain the same branches in the same order, the branches are saved once with the name branches
+#The matrix of each layout is saved as layout_indptr, layout_indices and layout_data, see BranchSpectra.getMatrix
+def writeBranchSpectra(fileName, branchSpectraList):
+    arrays = {"branches": np.array(branchSpectraList[0].branches, dtype = str)}
+    for branchSpectra in branchSpectraList:
+        indptr, indices, data = branchSpectra.getMatrix()
+        arrays[branchSpectra.layout + "_indptr"] = indptr
+        arrays[branchSpectra.layout + "_indices"] = indices
+        arrays[branchSpectra.layout + "_data"] = data
+        arrays[branchSpectra.layout + "_channels"] = np.array(layoutLabels[branchSpectra.layout], dtype = str)
+
+    with open(fileName, "wb") as outFile:
+        np.savez_compressed(outFile, **arrays)
+
+#Reads the branch spectra written by writeBranchSpectra, returns a dictionary with layouts as keys and BranchSpectra as values
+def readBranchSpectra(fileName):
+    branchSpectra = dict()
+    with np.load(fileName, allow_pickle = False) as arrays:
+        branches = arrays["branches"].tolist()
+        for layout in layoutChannels:
+            if (layout + "_indptr") in arrays.files:
+                branchSpectra[layout] = BranchSpectra.fromMatrix(layout, branches, arrays[layout + "_indptr"], arrays[layout + "_indices"], arrays[layout + "_data"])
+
+    return(branchSpectra)
@@ -7,6 +7,7 @@
 import argparse
 from Bio import Phylo
 import os
+import gzip
 
 #Extracts depths from a tree, returns a dictionary with clade names as keys and depths as values
 def extractDepths(tree):
@@ -48,7 +49,7 @@ def convertTreeMutations(tree, bM, bMT):
     for clade in tree.find_clades():
         #print(clade.name, depths[clade])
         #Do not analyse the root
-        if len(tree.get_path(clade)) != 0:
+        if clade is not tree.root:
 
             if clade.name:
                 cladeName = clade.name
@@ -168,7 +169,7 @@ if __name__ == "__main__":
     parser.add_argument("-m",
                         dest = "mutations",
                         required = True,
-                        help = "all_included_mutations.csv from MutTui",
+                        help = "all_included_mutations.csv from MutTui, can be gzip compressed",
                         type = argparse.FileType("r"))
     parser.add_argument("-t",
                         dest = "tree",
@@ -206,7 +207,12 @@ if __name__ == "__main__":
     transversions = ["C>A", "C>G", "T>A", "T>G"]
 
     #Iterate through the mutations and add to bM and bMT
-    with open(args.mutations.name) as fileobject:
+    #The mutations may be gzip compressed if MutTui was run with --compress_tables
+    if args.mutations.name.endswith(".gz"):
+        mutationsFile = gzip.open(args.mutations.name, "rt")
+    else:
+        mutationsFile = open(args.mutations.name)
+    with mutationsFile as fileobject:
         next(fileobject)
         for line in fileobject:
 
@@ -0,0 +1,157 @@
+#Index of a phylogenetic tree used to look up the parent, depth and path of clades without searching the tree
+#Built in a single pass through the tree. The topology of the tree should not be changed after the index is created
+
+import numpy as np
+from Bio import Phylo
+
+class TreeIndex:
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.root = tree.root
+
+        #Clades in preorder, the same order as tree.find_clades()
+        self.clades = list()
+        #Position of each clade in self.clades, keyed by the id of the clade
+        self.positions = dict()
+
+        parents = list()
+        depths = list()
+
+        #Clades still to be visited with the position of their parent and their depth, the root has a parent of -1
+        toVisit = [(tree.root, -1, 0)]
+        while toVisit:
+            clade, parent, depth = toVisit.pop()
+            self.positions[id(clade)] = len(self.clades)
+            self.clades.append(clade)
+            parents.append(parent)
+            depths.append(depth)
+
+            #Children are added in reverse so they are visited in the same order as find_clades
+            for child in reversed(clade.clades):
+                toVisit.append((child, len(self.clades) - 1, depth + 1))
+
+        #Position of the parent of each clade, depth of each clade as the number of branches from the root
+        self.parent = np.array(parents, dtype = np.int64)
+        self.depth = np.array(depths, dtype = np.int64)
+
+        #Positions of the clades in preorder and postorder, downstream clades are before their parents in postorder
+        self.preorder = np.arange(len(self.clades), dtype = np.int64)
+        self.postorder = self.getPostorder()
+
+        #The clades below each clade are consecutive in preorder, the clades below clade i, including clade i, are clades i
+        #to subtreeEnd[i] - 1. Sizes are added to the parent of each clade from the last clade in preorder
+        sizes = [1] * len(self.clades)
+        for i in range(len(sizes) - 1, 0, -1):
+            sizes[parents[i]] += sizes[i]
+        self.subtreeEnd = self.preorder + np.array(sizes, dtype = np.int64)
+        self.terminal = np.array([len(clade.clades) == 0 for clade in self.clades], dtype = bool)
+
+        #Clade names as keys, clades as values
+        self.names = {clade.name: clade for clade in self.clades if clade.name is not None}
+
+    #Orders the clades so each clade is after all of its downstream clades, visiting children in the same order as the tree
+    def getPostorder(self):
+        postorder = list()
+
+        #Clades still to be visited, the second element is True once the downstream clades have been added
+        toVisit = [(0, False)]
+        while toVisit:
+            position, expanded = toVisit.pop()
+            if expanded:
+                postorder.append(position)
+            else:
+                toVisit.append((position, True))
+                for child in reversed(self.clades[position].clades):
+                    toVisit.append((self.positions[id(child)], False))
+
+        return(np.array(postorder, dtype = np.int64))
+
+    #Position of a clade in preorder
+    def getPosition(self, clade):
+        return(self.positions[id(clade)])
+
+    #Returns the clade directly upstream of the given clade, None for the root
+    def getParent(self, clade):
+        parent = self.parent[self.positions[id(clade)]]
+        if parent == -1:
+            return(None)
+        else:
+            return(self.clades[parent])
+
+    #Number of branches between the root and the given clade
+    def getDepth(self, clade):
+        return(int(self.depth[self.positions[id(clade)]]))
+
+    #Returns the clades from the root to the given clade in the same format as tree.get_path
+    #Includes the given clade but not the root
+    def getPath(self, clade):
+        path = list()
+        position = self.positions[id(clade)]
+        while self.parent[position] != -1:
+            path.append(self.clades[position])
+            position = self.parent[position]
+
+        return(path[::-1])
+
+    #Returns the clade with the given name
+    def getClade(self, name):
+        return(self.names[name])
+
+    #Returns the tips below the given clade, or all tips if no clade is given, in the same order as get_terminals
+    def getTerminals(self, clade = None):
+        if clade is None:
+            position = 0
+        else:
+            position = self.positions[id(clade)]
+
+        return([self.clades[i] for i in (np.nonzero(self.terminal[position:self.subtreeEnd[position]])[0] + position).tolist()])
+
+    #Sums the weights of the clades in the subtree below each clade, including the clade itself
+    #weights contains the weight of each clade in preorder
+    def getSubtreeWeights(self, weights):
+        #The clades in a subtree are consecutive in preorder so their weights are a range of the cumulative weights
+        cumulativeWeights = np.concatenate(([0], np.cumsum(np.asarray(weights, dtype = np.int64))))
+
+        return(cumulativeWeights[self.subtreeEnd] - cumulativeWeights[:-1])
+
+    #Splits the tree into subtrees that can be processed separately, weights contains the weight of each clade in preorder
+    #Clades are split until their subtrees weigh at most 1 / numberSubtrees of the tree. Subtrees weighing less than
+    #a quarter of this are not returned and are left with the clades upstream of the subtrees
+    #Returns the positions of the clades at the root of each subtree in preorder
+    def splitSubtrees(self, weights, numberSubtrees):
+        subtreeWeights = self.getSubtreeWeights(weights)
+        maximumWeight = subtreeWeights[0] / numberSubtrees
+        minimumWeight = maximumWeight / 4
+
+        leaves = self.terminal
+        parentWeights = subtreeWeights[np.maximum(self.parent, 0)]
+
+        #The upstream clades of a subtree all weigh more than the maximum so are split
+        subtreeRoots = (self.parent >= 0) & (parentWeights > maximumWeight) & ((subtreeWeights <= maximumWeight) | leaves) & \
+            (subtreeWeights >= minimumWeight)
+
+        return(np.nonzero(subtreeRoots)[0])
+
+    #Returns the names of the clades in the subtree below a clade, in preorder, and the position of the parent of each
+    #clade within the subtree, -1 for the clade at the root of the subtree
+    #Used to copy a subtree to another process without copying the clades
+    def getSubtreeArrays(self, clade):
+        position = self.positions[id(clade)]
+        end = int(self.subtreeEnd[position])
+
+        names = [c.name for c in self.clades[position:end]]
+        parents = self.parent[position:end] - position
+        parents[0] = -1
+
+        return(names, parents)
+
+#Creates the clades of a subtree from the arrays returned by TreeIndex.getSubtreeArrays, returns the root of the subtree
+def buildSubtree(names, parents):
+    clades = list()
+    for name, parent in zip(names, parents.tolist()):
+        clades.append(Phylo.Newick.Clade(name = name))
+        if parent >= 0:
+            clades[parent].clades.append(clades[-1])
+
+    return(clades[0])
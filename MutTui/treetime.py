@@ -1,28 +1,91 @@
 #Runs treetime ancestral reconstruction on an alignment and tree
 
+import io
 import os
+import sys
+import shlex
 import subprocess
-from Bio import AlignIO
+from collections import namedtuple
+from Bio import AlignIO, Phylo
+from Bio.Align import MultipleSeqAlignment
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+from treetime import version as treetime_version
+from .reconstruct_spectrum import nexus_mutations
+from .cache import hashContent, hashChunks, readChunks, loadCachedFiles, saveCachedFiles, evictCache
 
-#Runs treetime ancestral reconstruction
-def run_treetime(alignment, tree, output_dir, add_treetime_cmds):
-    cmd = "treetime ancestral "
+#Files produced by treetime ancestral reconstruction that are written to the output directory, these are stored in the cache
+treetime_files = ["ancestral_sequences.fasta", "annotated_tree.nexus", "sequence_evolution_model.txt", "branch_mutations.txt", "auspice_tree.json"]
+
+#Versions of treetime whose ancestral command run_treetime_api follows, as given by major.minor version. The treetime
+#command is run with other versions
+treetime_api_versions = ["0.12"]
+
+#treetime ancestral reconstruction run in this process. tree is the reconstructed tree with clades named as in
+#annotated_tree.nexus, rootAlignment is an alignment containing the root sequence and mutations contains the treetime
+#mutations along each branch with mutations as a comma separated string, e.g. A12G,C15T, as in annotated_tree.nexus
+TreetimeReconstruction = namedtuple("TreetimeReconstruction", ["tree", "rootAlignment", "mutations"])
+
+#Returns stream if the treetime command can write to it, otherwise None so the command writes to the output of MutTui
+#sys.stdout and sys.stderr are passed to the treetime command so its output is written to the files they are redirected to,
+#e.g. muttui.log for jobs run by MutTui batch. They are flushed so the output is written in order
+def getCommandOutput(stream):
+    try:
+        stream.flush()
+        stream.fileno()
+    except (AttributeError, OSError, ValueError):
+        return(None)
+
+    return(stream)
 
+#Runs treetime ancestral reconstruction
+#The reconstruction is cached using a hash of the alignment with gaps converted to Ns, the tree, the treetime options and the
+#treetime version. If the same reconstruction has already been run, the files are copied from the cache instead of running treetime
+#The cached reconstructions are reduced to at most cacheSize bytes, see cache.py for the location of the cache
+#With backend api, treetime is run in this process and the reconstruction is returned as a TreetimeReconstruction.
+#treetime uses alignmentRecords if the alignment has already been read, otherwise it reads the alignment file. The treetime command is run if the treetime Python interface
+#cannot be used. Returns None if the reconstruction is only in the output files
+#If convertGaps is True, the alignment file still contains gaps. treetime is then given the alignment with gaps converted to Ns,
+#read with read_gaps_to_Ns if alignmentRecords is not given, and gaps_to_N_alignment.fasta is written if the treetime command is run
+def run_treetime(alignment, tree, output_dir, add_treetime_cmds, cacheDir = None, cacheSize = None, backend = "subprocess", alignmentRecords = None,
+                 convertGaps = False):
     #Check if a model has been specified, if not use --gtr infer
     if add_treetime_cmds == None:
-        cmd += "--gtr infer"
+        options = "--gtr infer"
     elif "--gtr" not in add_treetime_cmds:
-        cmd += "--gtr infer " + add_treetime_cmds 
+        options = "--gtr infer " + add_treetime_cmds 
     else:
-        cmd += add_treetime_cmds
-    
-    cmd += " --aln " + alignment.name
-    cmd += " --tree " + tree.name
-    cmd += " --outdir " + output_dir
+        options = add_treetime_cmds
+
+    #The converted alignment is hashed so the key is the same whether or not gaps_to_N_alignment.fasta was written
+    #The cached files are part of the key so reconstructions cached without some of the files are not used
+    cacheKey = hashContent(hashChunks(readGapsToNs(alignment.name), readChunks(tree.name)), options, treetime_version, ",".join(treetime_files))
+    if loadCachedFiles(treetime_files, output_dir, "treetime", cacheKey, cacheDir):
+        print("Using cached treetime reconstruction " + cacheKey)
+        return
+
+    reconstruction = None
+    if backend == "api":
+        if convertGaps and (alignmentRecords is None):
+            alignmentRecords = read_gaps_to_Ns(alignment)
+        reconstruction = run_treetime_api(alignment, tree, output_dir, options, alignmentRecords)
+
+    if reconstruction is None:
+        #The treetime command reads the alignment from a file so the alignment with gaps converted to Ns is written
+        if convertGaps:
+            change_gaps_to_Ns(alignment, output_dir)
+            alignmentName = output_dir + "gaps_to_N_alignment.fasta"
+        else:
+            alignmentName = alignment.name
+
+        cmd = "treetime ancestral " + options
+        cmd += " --aln " + alignmentName
+        cmd += " --tree " + tree.name
+        cmd += " --outdir " + output_dir
 
-    print('running cmd: ' + cmd)
+        print('running cmd: ' + cmd)
 
-    subprocess.run(cmd, shell = True, check = True)
+        subprocess.run(cmd, shell = True, check = True, stdout = getCommandOutput(sys.stdout), stderr = getCommandOutput(sys.stderr))
 
     # Deal with old version of treetime
     if os.path.isfile(output_dir + "ancestral_sequences{}.fasta"):
@@ -33,6 +96,84 @@ def run_treetime(alignment, tree, output_dir, add_treetime_cmds):
     if (os.stat(output_dir + "ancestral_sequences.fasta").st_size == 0) or (os.stat(output_dir + "annotated_tree.nexus") == 0):
         raise Exception("treetime did not complete successfully")
 
+    saveCachedFiles(treetime_files, output_dir, "treetime", cacheKey, cacheDir)
+    if cacheSize is not None:
+        evictCache("treetime", cacheSize, cacheDir)
+
+    return(reconstruction)
+
+#Runs treetime ancestral reconstruction in this process with the same steps as the treetime ancestral command
+#The output files are written as by the treetime command, the reconstruction is also returned as a TreetimeReconstruction
+#so the files do not need to be read again. Returns None if the treetime Python interface cannot be used with the options
+#This uses functions from the treetime command that are not part of the documented treetime interface, so it is only run
+#with the versions of treetime in treetime_api_versions and returns None if these functions cannot be called as expected
+def run_treetime_api(alignment, tree, output_dir, options, alignmentRecords):
+    if ".".join(treetime_version.split(".")[:2]) not in treetime_api_versions:
+        print("treetime version " + treetime_version + " is not supported by the api backend, running treetime as a separate process")
+        return(None)
+
+    try:
+        from treetime import TreeAnc
+        from treetime.argument_parser import make_parser
+        from treetime.wrappers import create_gtr
+        from treetime.CLI_io import get_outdir, get_basename, export_sequences_and_tree
+    except ImportError:
+        print("treetime Python interface not available, running treetime as a separate process")
+        return(None)
+
+    try:
+        #Read the options in the same way as the treetime command
+        params = make_parser().parse_args(["ancestral"] + shlex.split(options) + ["--aln", alignment.name, "--tree", tree.name, "--outdir", output_dir])
+
+        #VCF input is only supported by the treetime command
+        if params.vcf_reference is not None:
+            return(None)
+
+        print("running treetime ancestral " + options + " in MutTui")
+
+        outdir = get_outdir(params, "_ancestral")
+        basename = get_basename(params, outdir)
+
+        if alignmentRecords is None:
+            alignmentRecords = alignment.name
+
+        treeanc = TreeAnc(params.tree, aln = alignmentRecords, gtr = create_gtr(params), verbose = 1,
+                          fill_overhangs = not params.keep_overhangs, rng_seed = params.rng_seed)
+        treeanc.infer_ancestral_sequences("ml", infer_gtr = params.gtr == "infer", marginal = params.marginal,
+                                          reconstruct_tip_states = params.reconstruct_tip_states)
+
+        if params.gtr == "infer":
+            with open(outdir + "sequence_evolution_model.txt", "w", encoding = "utf-8") as outFile:
+                outFile.write(str(treeanc.gtr) + "\n")
+
+        #Write the output files, this adds the mutations to the comments of the clades in the same format as annotated_tree.nexus
+        export_sequences_and_tree(treeanc, basename, False, params.zero_based, report_ambiguous = params.report_ambiguous,
+                                  reconstruct_tip_states = params.reconstruct_tip_states)
+    except (TypeError, AttributeError) as e:
+        #The functions of the treetime command have changed, the files written so far are replaced by the treetime command
+        print("treetime Python interface could not be used (" + repr(e) + "), running treetime as a separate process")
+        return(None)
+
+    #Copy the tree without the treetime attributes of the clades so the reconstruction can be freed
+    root = Phylo.Newick.Clade(name = treeanc.tree.root.name, branch_length = treeanc.tree.root.branch_length)
+    mutations = dict()
+    toVisit = [(treeanc.tree.root, root)]
+    while toVisit:
+        clade, cladeCopy = toVisit.pop()
+        branchMutations = nexus_mutations.search(clade.comment)
+        if (branchMutations) and (branchMutations.group(1) != ""):
+            mutations[clade.name] = branchMutations.group(1)
+
+        for child in clade.clades:
+            childCopy = Phylo.Newick.Clade(name = child.name, branch_length = child.branch_length)
+            cladeCopy.clades.append(childCopy)
+            toVisit.append((child, childCopy))
+
+    rootSequence = treeanc.sequence(treeanc.tree.root, reconstructed = params.reconstruct_tip_states, as_string = True)
+    rootAlignment = MultipleSeqAlignment([SeqRecord(Seq(rootSequence), id = root.name, name = root.name, description = "")])
+
+    return(TreetimeReconstruction(Phylo.Newick.Tree(root = root, rooted = False), rootAlignment, mutations))
+
 #Runs treetime mugration
 def run_treetime_mugration(tree, labels, output_dir):
     cmd = "treetime mugration --tree "
@@ -41,19 +182,108 @@ def run_treetime_mugration(tree, labels, output_dir):
     cmd += " --states " + labels
     cmd += " --attribute group --confidence --outdir " + output_dir + "/mugration_out"
 
-    subprocess.run(cmd, shell = True, check = True)
+    subprocess.run(cmd, shell = True, check = True, stdout = getCommandOutput(sys.stdout), stderr = getCommandOutput(sys.stderr))
+
+#Converts gaps to Ns in the sequences, used with bytes.translate
+gaps_to_Ns_table = bytes.maketrans(b"-", b"N")
+
+#Converts gaps to Ns in a fasta alignment read from a binary file, yielding the converted alignment in chunks
+#The alignment is read in chunks of chunkSize bytes so only one chunk is in memory at a time
+#Each sequence is written on a single line after a header containing the sequence id, as written by AlignIO
+def iterateGapsToNs(inFile, chunkSize = 1048576):
+    #Whether the current position is in a header, the header read so far and the number of headers read
+    inHeader = False
+    header = b""
+    records = 0
+
+    for chunk in iter(lambda: inFile.read(chunkSize), b""):
+        converted = list()
+        position = 0
+        while position < len(chunk):
+            if inHeader:
+                headerEnd = chunk.find(b"\n", position)
+                if headerEnd == -1:
+                    header += chunk[position:]
+                    break
+                header += chunk[position:headerEnd]
+                position = headerEnd + 1
+
+                #Sequences are separated by a new line, the sequence id is the header up to the first whitespace
+                if records > 0:
+                    converted.append(b"\n")
+                converted.append(b">" + (header.split() or [b""])[0] + b"\n")
+                records += 1
+                inHeader = False
+            else:
+                headerStart = chunk.find(b">", position)
+                if headerStart == -1:
+                    headerStart = len(chunk)
+                else:
+                    inHeader = True
+                    header = b""
+
+                #Text before the first header is not part of the alignment
+                if records > 0:
+                    converted.append(chunk[position:headerStart].translate(gaps_to_Ns_table, b" \r\n"))
+                position = headerStart + 1
+
+        yield(b"".join(converted))
+
+    if inHeader:
+        if records > 0:
+            yield(b"\n")
+        yield(b">" + (header.split() or [b""])[0] + b"\n")
+        records += 1
+    if records > 0:
+        yield(b"\n")
+
+#Reads a fasta alignment file with gaps converted to Ns in chunks, as they are written by change_gaps_to_Ns
+def readGapsToNs(fileName, chunkSize = 1048576):
+    with open(fileName, "rb") as inFile:
+        for chunk in iterateGapsToNs(inFile, chunkSize):
+            yield(chunk)
+
+#Reads the converted alignment from iterateGapsToNs as a binary file
+class GapsToNsReader(io.RawIOBase):
+
+    def __init__(self, inFile, chunkSize = 1048576):
+        self.chunks = iterateGapsToNs(inFile, chunkSize)
+        #The current converted chunk and the position in the chunk that has been read up to
+        self.chunk = b""
+        self.position = 0
+
+    def readable(self):
+        return(True)
+
+    def readinto(self, buffer):
+        while self.position == len(self.chunk):
+            self.chunk = next(self.chunks, None)
+            self.position = 0
+            if self.chunk is None:
+                self.chunk = b""
+                return(0)
+
+        size = min(len(buffer), len(self.chunk) - self.position)
+        buffer[:size] = self.chunk[self.position:(self.position + size)]
+        self.position += size
+
+        return(size)
 
 #treetime reconstructs mutations at gap sites, which are later removed by MutTui
 #Ns are not reconstructed by treetime. This function replaces gaps with Ns in the alignment
 #so they will not be reconstructed. As gaps and Ns are both treated as missing data
 #in phylogenetic methods, this will not alter any inferences but will remove large numbers
 #of gaps from the infered mutations
+#The alignment is converted in chunks without reading the whole alignment into memory
 def change_gaps_to_Ns(alignmentFile, output_dir):
-    alignment = AlignIO.read(alignmentFile.name, "fasta")
+    with open(alignmentFile.name, "rb") as inFile, open(output_dir + "gaps_to_N_alignment.fasta", "wb") as new_a:
+        for chunk in iterateGapsToNs(inFile):
+            new_a.write(chunk)
 
-    new_a = open(output_dir + "gaps_to_N_alignment.fasta", "w")
+#Reads the alignment with gaps converted to Ns without writing the converted alignment to a file, used to pass the
+#alignment directly to treetime with the api backend
+def read_gaps_to_Ns(alignmentFile):
+    with open(alignmentFile.name, "rb") as inFile:
+        alignment = AlignIO.read(io.TextIOWrapper(io.BufferedReader(GapsToNsReader(inFile))), "fasta")
 
-    for seq in alignment:
-        new_a.write(">" + seq.id + "\n" + str(seq.seq).replace("-", "N") + "\n")
-    
-    new_a.close()
\ No newline at end of file
+    return(alignment)
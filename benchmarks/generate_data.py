@@ -0,0 +1,246 @@
+#Generates synthetic datasets for benchmarking MutTui
+#A random rooted tree is generated and mutations are planted along its branches at random genome positions. The
+#dataset contains the files needed to run each MutTui command:
+#tree.nwk - the tree without internal node names
+#alignment.fasta - the sequences of the tips at the variable sites
+#conversion.txt - the genome position of each alignment position
+#reference.fasta - the reference genome, the root sequence at the variable sites is taken from the reference
+#annotated_tree.nexus and ancestral_sequences.fasta - the reconstruction in the same format as treetime with the
+#planted mutations, used with MutTui run --start_from_treetime. Only the root sequence is written to ancestral_sequences.fasta
+#variants.csv - the planted mutations as a korimuto variant file
+#dataset.json - the parameters of the dataset and the numbers of mutations and variable sites
+#The same seed and parameters generate the same dataset
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+
+#Run from the source tree, the MutTui being benchmarked is the one in this repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MutTui.array_tree import ArrayTree, writeNewick
+from MutTui.spectrum import Spectrum
+
+#Bases in the order of their codes in the generated sequences
+bases = np.frombuffer(b"ACGT", dtype = np.uint8)
+
+#Generates a random rooted binary tree with the given number of tips, returns the parent of each clade in preorder
+#Each clade is split into two clades with a uniformly distributed number of tips, the tree is built in preorder from
+#a stack of clades so large trees do not need recursion
+def generateTree(tips, rng):
+    parents = list()
+    #Clades still to be added, as their number of tips and the position of their parent
+    toAdd = [(tips, -1)]
+    while toAdd:
+        size, parent = toAdd.pop()
+        parents.append(parent)
+        if size > 1:
+            left = int(rng.integers(1, size))
+            #The left clade is added first so is pushed last
+            toAdd.append((size - left, len(parents) - 1))
+            toAdd.append((left, len(parents) - 1))
+
+    return(np.array(parents, dtype = np.int64))
+
+#Plants mutations along the branches of a tree, the number of mutations on each branch is Poisson distributed with mean
+#density. A proportion of mutations, doubleFraction, also mutate the next genome position to give double substitutions
+#Returns the branch and genome position of each mutation, sorted by branch then position, without repeated positions on a branch
+def plantMutations(numberClades, genomeLength, density, doubleFraction, rng):
+    counts = rng.poisson(density, numberClades)
+    #The root does not have a branch
+    counts[0] = 0
+    branches = np.repeat(np.arange(numberClades, dtype = np.int64), counts)
+    positions = rng.integers(0, genomeLength, len(branches))
+
+    doubles = (rng.random(len(branches)) < doubleFraction) & (positions + 1 < genomeLength)
+    branches = np.concatenate((branches, branches[doubles]))
+    positions = np.concatenate((positions, positions[doubles] + 1))
+
+    keys = np.unique(branches * genomeLength + positions)
+
+    return(keys // genomeLength, keys % genomeLength)
+
+#Writes a fasta file with a single sequence, given as a bytes string, in lines of the given width
+def writeFasta(fileName, name, sequence, width = 80):
+    with open(fileName, "w") as outFile:
+        outFile.write(">" + name + "\n")
+        outFile.write("\n".join([sequence[i:i + width].decode() for i in range(0, len(sequence), width)]) + "\n")
+
+    return
+
+#Generates random SBS96 and DBS78 spectra, written to sbs_spectrum_N.csv and dbs_spectrum_N.csv in outputDir
+#Each spectrum is a mixture of 3 random signatures with the given number of mutations
+def generateSpectra(outputDir, numberSpectra, mutations, seed):
+    rng = np.random.default_rng(seed)
+    os.makedirs(outputDir, exist_ok = True)
+
+    for layout, prefix in [("SBS96", "sbs"), ("DBS78", "dbs")]:
+        signatures = rng.dirichlet(np.full(len(Spectrum(layout)), 0.5), 3)
+        for i in range(numberSpectra):
+            probabilities = rng.dirichlet(np.ones(3)) @ signatures
+            spectrum = Spectrum(layout, rng.multinomial(mutations, probabilities / probabilities.sum()))
+            with open(os.path.join(outputDir, prefix + "_spectrum_" + str(i + 1) + ".csv"), "w") as outFile:
+                spectrum.writeSpectrum(outFile)
+
+    return
+
+#Generates a dataset in outputDir, returns the dataset description written to dataset.json
+def generateDataset(outputDir, tips, genomeLength, density, seed, doubleFraction = 0.05):
+    rng = np.random.default_rng(seed)
+    os.makedirs(outputDir, exist_ok = True)
+
+    #Tree with tips named T1, T2... and internal nodes named as in treetime
+    parents = generateTree(tips, rng)
+    branchLengths = rng.exponential(0.01, len(parents))
+    branchLengths[0] = np.nan
+    tree = ArrayTree([None] * len(parents), parents, branchLengths)
+    tipNames = ["T" + str(i + 1) for i in range(tips)]
+    for name, position in zip(tipNames, np.nonzero(tree.terminal)[0].tolist()):
+        tree.names[position] = name
+    writeNewick(tree, os.path.join(outputDir, "tree.nwk"))
+    tree.nameTreetimeNodes()
+
+    #Random reference genome and the planted mutations, the alignment contains the positions with mutations
+    reference = rng.integers(0, 4, genomeLength).astype(np.uint8)
+    writeFasta(os.path.join(outputDir, "reference.fasta"), "reference", bases[reference].tobytes())
+
+    mutationBranches, mutationPositions = plantMutations(len(tree), genomeLength, density, doubleFraction, rng)
+    variableSites = np.unique(mutationPositions)
+    mutationSites = np.searchsorted(variableSites, mutationPositions)
+    #Each mutation changes its base to one of the 3 other bases
+    mutationShifts = rng.integers(1, 4, len(mutationPositions)).astype(np.uint8)
+    branchOffsets = np.searchsorted(mutationBranches, np.arange(len(tree) + 1))
+
+    with open(os.path.join(outputDir, "conversion.txt"), "w") as outFile:
+        outFile.write("".join([str(i + 1) + "\t" + str(p + 1) + "\n" for i, p in enumerate(variableSites.tolist())]))
+
+    rootSequence = reference[variableSites]
+    writeFasta(os.path.join(outputDir, "ancestral_sequences.fasta"), tree.names[0], bases[rootSequence].tobytes())
+
+    #Apply the mutations along the tree in preorder, keeping the sequence of each internal node until all of its children
+    #have been visited. The tip sequences are written to the alignment as they are reached
+    sequences = {0: rootSequence}
+    remainingChildren = np.diff(tree.childOffsets).tolist()
+    parentList = tree.parent.tolist()
+    terminal = tree.terminal.tolist()
+    variants = list()
+    with open(os.path.join(outputDir, "alignment.fasta"), "w") as alignmentFile:
+        for i in range(1, len(tree)):
+            parent = parentList[i]
+            sequence = sequences[parent].copy()
+            remainingChildren[parent] -= 1
+            if remainingChildren[parent] == 0:
+                del sequences[parent]
+
+            sites = mutationSites[branchOffsets[i]:branchOffsets[i + 1]]
+            if len(sites) > 0:
+                ancestral = sequence[sites]
+                sequence[sites] = (ancestral + mutationShifts[branchOffsets[i]:branchOffsets[i + 1]]) % 4
+                tree.comments[i] = '&mutations="' + ",".join([chr(a) + str(s + 1) + chr(d) for a, s, d in
+                                                            zip(bases[ancestral].tolist(), sites.tolist(), bases[sequence[sites]].tolist())]) + '"'
+                variants.append((mutationPositions[branchOffsets[i]:branchOffsets[i + 1]], ancestral, sequence[sites]))
+
+            if terminal[i]:
+                alignmentFile.write(">" + tree.names[i] + "\n" + bases[sequence].tobytes().decode() + "\n")
+            else:
+                sequences[i] = sequence
+
+    with open(os.path.join(outputDir, "annotated_tree.nexus"), "w") as outFile:
+        outFile.write("#NEXUS\nBegin Taxa;\n Dimensions NTax=" + str(tips) + ";\n TaxLabels " + " ".join(tipNames) + ";\nEnd;\n")
+        outFile.write("Begin Trees;\n Tree tree1=" + tree.toNewick() + "\nEnd;\n")
+
+    #The planted mutations as a korimuto variant file with genome positions
+    with open(os.path.join(outputDir, "variants.csv"), "w") as outFile:
+        outFile.write("position,reference,variant\n")
+        for positions, ancestral, derived in variants:
+            outFile.write("".join([str(p + 1) + "," + chr(a) + "," + chr(d) + "\n" for p, a, d in
+                                   zip(positions.tolist(), bases[ancestral].tolist(), bases[derived].tolist())]))
+
+    dataset = {"tips": tips,
+               "genome_length": genomeLength,
+               "mutation_density": density,
+               "double_fraction": doubleFraction,
+               "seed": seed,
+               "clades": len(tree),
+               "mutations": len(mutationPositions),
+               "variable_sites": len(variableSites)}
+    with open(os.path.join(outputDir, "dataset.json"), "w") as outFile:
+        json.dump(dataset, outFile, indent = 2, sort_keys = True)
+
+    return(dataset)
+
+
+
+def generate_data_parser(parser):
+
+    parser.description = "Generates a synthetic dataset for benchmarking MutTui"
+
+    parser.add_argument("-o",
+                        "--out_dir",
+                        dest = "output_dir",
+                        required = True,
+                        help = "Output directory, created if it does not exist")
+    parser.add_argument("--tips",
+                        dest = "tips",
+                        help = "Number of tips in the tree. Default = 100",
+                        type = int,
+                        default = 100)
+    parser.add_argument("--genome_length",
+                        dest = "genome_length",
+                        help = "Length of the reference genome. Default = 100000",
+                        type = int,
+                        default = 100000)
+    parser.add_argument("--mutation_density",
+                        dest = "mutation_density",
+                        help = "Mean number of mutations planted on each branch. Default = 5",
+                        type = float,
+                        default = 5)
+    parser.add_argument("--double_fraction",
+                        dest = "double_fraction",
+                        help = "Proportion of mutations that also mutate the next genome position. Default = 0.05",
+                        type = float,
+                        default = 0.05)
+    parser.add_argument("--spectra",
+                        dest = "spectra",
+                        help = "Also write this number of random SBS and DBS spectra to the spectra directory within the output " +
+                        "directory. Default = 0",
+                        type = int,
+                        default = 0)
+    parser.add_argument("--seed",
+                        dest = "seed",
+                        help = "Random seed. Default = 1",
+                        type = int,
+                        default = 1)
+
+    parser.set_defaults(func = generate_data)
+
+    return(parser)
+
+def generate_data(args):
+
+    dataset = generateDataset(args.output_dir, args.tips, args.genome_length, args.mutation_density, args.seed, args.double_fraction)
+    if args.spectra > 0:
+        generateSpectra(os.path.join(args.output_dir, "spectra"), args.spectra, 1000, args.seed)
+
+    print("Generated " + str(dataset["tips"]) + " tips with " + str(dataset["mutations"]) + " mutations at " +
+          str(dataset["variable_sites"]) + " variable sites")
+
+    return
+
+
+
+def main():
+    # set up and parse arguments
+    parser = argparse.ArgumentParser()
+    parser = generate_data_parser(parser)
+    args = parser.parse_args()
+
+    # generate the dataset
+    args.func(args)
+
+    return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+#Runs the MutTui benchmarks on synthetic datasets and writes the results to a JSON file
+#A dataset is generated with generate_data.py for each combination of tip count, genome length and mutation density.
+#MutTui run --start_from_treetime and korimuto are timed on each dataset, cluster and catalogue are timed on sets of
+#random spectra of each size and the rescalers in rescale_spectrum.py are timed on the reference of each genome length
+#The MutTui commands are run in a new process each time, their wall time includes starting Python and importing MutTui,
+#the time taken to start MutTui without running a command is recorded as startup_time. The rescalers are timed within
+#this process. With --stages the commands are run with --profile and the time of each stage is also recorded, tracing
+#memory allocations slows down the commands so the times with --stages should only be compared with other runs with --stages
+#Results are written in a stable format, sorted by benchmark and parameters, so results from different commits can be
+#compared with --compare
+
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timezone
+
+#Run from the source tree, the MutTui being benchmarked is the one in this repository
+repository_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repository_dir)
+
+from generate_data import generateDataset, generateSpectra
+from MutTui.rescale_spectrum import rescaleSBS, rescaleMT, rescaleDouble
+from MutTui.plot_spectrum import convertSpectrumDict
+from MutTui.__init__ import __version__
+
+#Version of the results format, increased if the format changes
+benchmark_format = 1
+
+#Benchmarks that can be run
+benchmark_names = ["run", "korimuto", "cluster", "catalogue", "rescale"]
+
+
+
+#Name of the directory of a dataset
+def getDatasetName(tips, genomeLength, density):
+    return("tips_" + str(tips) + "_genome_" + str(genomeLength) + "_density_" + str(density))
+
+#Commit of the repository being benchmarked, None if this is not a git repository
+def getCommit():
+    try:
+        return(subprocess.run(["git", "rev-parse", "HEAD"], cwd = repository_dir, capture_output = True, text = True,
+                              check = True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return(None)
+
+#Runs a MutTui command in a new process, returns the wall time, CPU time and peak memory of the process
+#The output of the command is written to logFile. If profileDir is given, the command is run with --profile
+#and the stages and counts in run_profile.json in profileDir are added to the result
+def runCommand(arguments, workDir, logFile, profileDir = None):
+    if profileDir is not None:
+        arguments = arguments + ["--profile"]
+
+    #MutTui is imported from this repository
+    environment = dict(os.environ)
+    environment["PYTHONPATH"] = repository_dir + os.pathsep + environment.get("PYTHONPATH", "")
+
+    with open(logFile, "w") as log:
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, "-m", "MutTui"] + arguments, cwd = workDir, env = environment,
+                                   stdout = log, stderr = subprocess.STDOUT)
+        #wait4 gives the CPU time and peak memory of the process, it is not available on Windows
+        if hasattr(os, "wait4"):
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+        else:
+            process.wait()
+            usage = None
+        wallTime = time.perf_counter() - start
+
+    result = {"wall_time": wallTime, "cpu_time": None, "peak_rss_mb": None}
+    if usage is not None:
+        result["cpu_time"] = usage.ru_utime + usage.ru_stime
+        #ru_maxrss is in bytes on macOS and in kilobytes on Linux
+        result["peak_rss_mb"] = usage.ru_maxrss / 1e6 if sys.platform == "darwin" else usage.ru_maxrss / 1e3
+
+    if process.returncode != 0:
+        with open(logFile) as log:
+            lines = [line.rstrip() for line in log if line.strip()]
+        result["error"] = lines[-1] if lines else "Exit code " + str(process.returncode)
+    elif profileDir is not None:
+        with open(os.path.join(profileDir, "run_profile.json")) as profileFile:
+            profile = json.load(profileFile)
+        result["stages"] = {stage["name"]: stage["wall_time"] for stage in profile["stages"]}
+        result["counts"] = profile["counts"]
+
+    return(result)
+
+#Times a function run within this process
+def timeFunction(function, *arguments):
+    start = time.perf_counter()
+    startCPU = time.process_time()
+    function(*arguments)
+
+    return({"wall_time": time.perf_counter() - start, "cpu_time": time.process_time() - startCPU, "peak_rss_mb": None})
+
+#Combines the repeats of a benchmark into its result, times are the median of the repeats and memory the maximum
+#A benchmark fails if any repeat fails
+def summariseRepeats(benchmark, parameters, repeats, dataset = None):
+    result = {"benchmark": benchmark, "parameters": parameters, "repeats": repeats}
+    if dataset is not None:
+        result["dataset"] = {key: dataset[key] for key in ["clades", "mutations", "variable_sites"]}
+
+    errors = [r["error"] for r in repeats if "error" in r]
+    if errors:
+        result["status"] = "failed"
+        result["error"] = errors[0]
+        return(result)
+
+    result["status"] = "complete"
+    for metric in ["wall_time", "cpu_time"]:
+        values = [r[metric] for r in repeats if r[metric] is not None]
+        result[metric] = statistics.median(values) if values else None
+    memory = [r["peak_rss_mb"] for r in repeats if r["peak_rss_mb"] is not None]
+    result["peak_rss_mb"] = max(memory) if memory else None
+    #Stages and counts are from the last repeat
+    for key in ["stages", "counts"]:
+        if key in repeats[-1]:
+            result[key] = repeats[-1][key]
+
+    return(result)
+
+#Key identifying a benchmark and its parameters, used to sort and compare results
+def getResultKey(result):
+    return((result["benchmark"], json.dumps(result["parameters"], sort_keys = True)))
+
+#Runs MutTui run --start_from_treetime on a dataset, the treetime output files are copied to the output directory
+#before each repeat as MutTui reads them from there
+def benchmarkRun(datasetDir, workDir, repeats, stages):
+    results = list()
+    for repeat in range(repeats):
+        outputDir = os.path.join(workDir, "run")
+        shutil.rmtree(outputDir, ignore_errors = True)
+        os.makedirs(outputDir)
+        for fileName in ["annotated_tree.nexus", "ancestral_sequences.fasta"]:
+            shutil.copy(os.path.join(datasetDir, fileName), outputDir)
+
+        arguments = ["run", "-a", os.path.join(datasetDir, "alignment.fasta"), "-t", os.path.join(datasetDir, "tree.nwk"),
+                     "-r", os.path.join(datasetDir, "reference.fasta"), "-c", os.path.join(datasetDir, "conversion.txt"),
+                     "--start_from_treetime", "-to", datasetDir, "-o", outputDir, "--cache_dir", ""]
+        results.append(runCommand(arguments, workDir, os.path.join(workDir, "run.log"), outputDir if stages else None))
+
+    return(results)
+
+#Runs korimuto on the planted mutations of a dataset
+def benchmarkKorimuto(datasetDir, workDir, repeats, stages):
+    results = list()
+    for repeat in range(repeats):
+        outputDir = os.path.join(workDir, "korimuto")
+        shutil.rmtree(outputDir, ignore_errors = True)
+        os.makedirs(outputDir)
+
+        arguments = ["korimuto", "-v", os.path.join(datasetDir, "variants.csv"), "--variant", "-r", os.path.join(datasetDir, "reference.fasta"),
+                     "-o", os.path.join(outputDir, "korimuto")]
+        results.append(runCommand(arguments, workDir, os.path.join(workDir, "korimuto.log"), outputDir if stages else None))
+
+    return(results)
+
+#Runs cluster or catalogue on a set of spectra
+#catalogue writes sample_in_catalog_to_file_conversion.csv to the working directory so is run within its output directory
+def benchmarkSpectra(command, spectraFiles, workDir, repeats, stages):
+    results = list()
+    for repeat in range(repeats):
+        outputDir = os.path.join(workDir, command)
+        shutil.rmtree(outputDir, ignore_errors = True)
+        os.makedirs(outputDir)
+
+        if command == "cluster":
+            arguments = ["cluster", "-s"] + spectraFiles + ["-o", outputDir]
+        else:
+            arguments = ["catalogue", "-s"] + spectraFiles + ["-o", os.path.join(outputDir, "catalogue")]
+        results.append(runCommand(arguments, outputDir, os.path.join(workDir, command + ".log"), outputDir if stages else None))
+
+    return(results)
+
+#Times rescaling an SBS, mutation type and double substitution spectrum with the reference of a dataset
+#Returns the results of each rescaler
+def benchmarkRescalers(datasetDir, spectraDir, repeats):
+    with open(os.path.join(spectraDir, "sbs_spectrum_1.csv")) as spectrumFile:
+        sbsSpectrum = convertSpectrumDict(spectrumFile)
+    with open(os.path.join(spectraDir, "dbs_spectrum_1.csv")) as spectrumFile:
+        dbsSpectrum = convertSpectrumDict(spectrumFile)
+    #Mutation type counts of the SBS spectrum, named as the ancestral and mutant base
+    mtSpectrum = dict()
+    for mutation, count in sbsSpectrum.items():
+        mtSpectrum[mutation[2] + mutation[4]] = mtSpectrum.get(mutation[2] + mutation[4], 0) + count
+
+    reference = os.path.join(datasetDir, "reference.fasta")
+    results = dict()
+    for rescaler, function, spectrum in [("rescale_sbs", rescaleSBS, sbsSpectrum), ("rescale_mt", rescaleMT, mtSpectrum),
+                                         ("rescale_dbs", rescaleDouble, dbsSpectrum)]:
+        results[rescaler] = [timeFunction(function, spectrum, reference, 1000000, False) for repeat in range(repeats)]
+
+    return(results)
+
+#Compares two sets of results, returns a row for each benchmark in both with its parameters, wall times and their ratio
+def compareResults(previous, current):
+    previousResults = {getResultKey(r): r for r in previous["results"] if r["status"] == "complete"}
+    rows = list()
+    for result in current["results"]:
+        key = getResultKey(result)
+        if (result["status"] == "complete") and (key in previousResults):
+            previousTime = previousResults[key]["wall_time"]
+            rows.append([result["benchmark"], key[1], previousTime, result["wall_time"], result["wall_time"] / previousTime])
+
+    return(rows)
+
+
+
+def run_benchmarks_parser(parser):
+
+    parser.description = "Runs the MutTui benchmarks on synthetic datasets and writes the results to a JSON file"
+
+    parser.add_argument("-o",
+                        "--out_dir",
+                        dest = "output_dir",
+                        required = True,
+                        help = "Directory the datasets and command outputs are written to, created if it does not exist")
+    parser.add_argument("--results",
+                        dest = "results",
+                        help = "JSON file the results are written to. Default = benchmark_results.json in the output directory",
+                        default = None)
+    parser.add_argument("--benchmarks",
+                        dest = "benchmarks",
+                        nargs = "+",
+                        choices = benchmark_names,
+                        help = "Benchmarks to run. Default = all benchmarks",
+                        default = benchmark_names)
+    parser.add_argument("--tips",
+                        dest = "tips",
+                        nargs = "+",
+                        type = int,
+                        help = "Numbers of tips in the generated trees. Default = 100 1000",
+                        default = [100, 1000])
+    parser.add_argument("--genome_lengths",
+                        dest = "genome_lengths",
+                        nargs = "+",
+                        type = int,
+                        help = "Lengths of the generated reference genomes. Default = 100000 1000000",
+                        default = [100000, 1000000])
+    parser.add_argument("--mutation_densities",
+                        dest = "mutation_densities",
+                        nargs = "+",
+                        type = float,
+                        help = "Mean numbers of mutations planted on each branch. Default = 1 5",
+                        default = [1.0, 5.0])
+    parser.add_argument("--spectra",
+                        dest = "spectra",
+                        nargs = "+",
+                        type = int,
+                        help = "Numbers of spectra clustered and combined into a catalogue. Default = 10 50",
+                        default = [10, 50])
+    parser.add_argument("--repeats",
+                        dest = "repeats",
+                        type = int,
+                        help = "Number of times each benchmark is run, the median time is reported. Default = 1",
+                        default = 1)
+    parser.add_argument("--seed",
+                        dest = "seed",
+                        type = int,
+                        help = "Random seed of the generated datasets. Default = 1",
+                        default = 1)
+    parser.add_argument("--stages",
+                        dest = "stages",
+                        help = "Run the MutTui commands with --profile and also record the time of each stage. This slows down " +
+                        "the commands so times are only comparable with other runs with --stages",
+                        action = "store_true",
+                        default = False)
+    parser.add_argument("--compare",
+                        dest = "compare",
+                        help = "Results of a previous run to compare with, the ratio of the wall time of each benchmark to its " +
+                        "previous wall time is printed",
+                        type = argparse.FileType("r"),
+                        default = None)
+
+    parser.set_defaults(func = run_benchmarks)
+
+    return(parser)
+
+def run_benchmarks(args):
+
+    os.makedirs(args.output_dir, exist_ok = True)
+    if args.results is None:
+        args.results = os.path.join(args.output_dir, "benchmark_results.json")
+
+    results = list()
+
+    #Time taken to start MutTui, included in the wall time of each command
+    startup = runCommand(["--version"], args.output_dir, os.path.join(args.output_dir, "startup.log"))
+
+    #Random spectra of each size, used by cluster, catalogue and the rescalers
+    spectraDirs = dict()
+    for numberSpectra in sorted(set(args.spectra + [1])):
+        spectraDirs[numberSpectra] = os.path.join(args.output_dir, "spectra_" + str(numberSpectra))
+        generateSpectra(spectraDirs[numberSpectra], numberSpectra, 1000, args.seed)
+
+    for numberSpectra in args.spectra:
+        spectraFiles = [os.path.join(spectraDirs[numberSpectra], "sbs_spectrum_" + str(i + 1) + ".csv") for i in range(numberSpectra)]
+        for command in ["cluster", "catalogue"]:
+            if command in args.benchmarks:
+                print("Running " + command + " with " + str(numberSpectra) + " spectra")
+                repeats = benchmarkSpectra(command, spectraFiles, spectraDirs[numberSpectra], args.repeats, args.stages)
+                results.append(summariseRepeats(command, {"spectra": numberSpectra}, repeats))
+
+    for genomeLength in args.genome_lengths:
+        for tips in args.tips:
+            for density in args.mutation_densities:
+                if not set(["run", "korimuto", "rescale"]) & set(args.benchmarks):
+                    continue
+                datasetDir = os.path.join(args.output_dir, getDatasetName(tips, genomeLength, density))
+                print("Generating " + str(tips) + " tips, genome length " + str(genomeLength) + ", mutation density " + str(density))
+                dataset = generateDataset(datasetDir, tips, genomeLength, density, args.seed)
+                parameters = {"tips": tips, "genome_length": genomeLength, "mutation_density": density}
+
+                if "run" in args.benchmarks:
+                    print("Running run")
+                    results.append(summariseRepeats("run", parameters, benchmarkRun(datasetDir, datasetDir, args.repeats, args.stages), dataset))
+                if "korimuto" in args.benchmarks:
+                    print("Running korimuto")
+                    results.append(summariseRepeats("korimuto", parameters, benchmarkKorimuto(datasetDir, datasetDir, args.repeats, args.stages), dataset))
+
+        #The rescalers only depend on the genome length, they are run on the reference of the last dataset of this length
+        if "rescale" in args.benchmarks:
+            print("Running the rescalers with genome length " + str(genomeLength))
+            for rescaler, repeats in benchmarkRescalers(datasetDir, spectraDirs[1], args.repeats).items():
+                results.append(summariseRepeats(rescaler, {"genome_length": genomeLength}, repeats))
+
+    output = {"format_version": benchmark_format,
+              "muttui_version": __version__,
+              "commit": getCommit(),
+              "created": datetime.now(timezone.utc).isoformat(timespec = "seconds"),
+              "python_version": platform.python_version(),
+              "platform": platform.platform(),
+              "cpu_count": os.cpu_count(),
+              "startup_time": startup["wall_time"],
+              "settings": {"tips": args.tips, "genome_lengths": args.genome_lengths, "mutation_densities": args.mutation_densities,
+                           "spectra": args.spectra, "repeats": args.repeats, "seed": args.seed, "stages": args.stages},
+              "results": sorted(results, key = getResultKey)}
+
+    with open(args.results, "w") as outFile:
+        json.dump(output, outFile, indent = 2, sort_keys = True)
+        outFile.write("\n")
+
+    failed = [r["benchmark"] + " " + getResultKey(r)[1] for r in results if r["status"] != "complete"]
+    for f in failed:
+        print("Failed: " + f)
+
+    #Print the change in wall time of each benchmark from the previous results
+    if args.compare is not None:
+        previous = json.load(args.compare)
+        if previous["settings"]["stages"] != args.stages:
+            print("Warning: only one of the runs used --stages, the times are not comparable")
+        print("Benchmark\tParameters\tPrevious_wall_time\tWall_time\tRatio")
+        for row in compareResults(previous, output):
+            print(row[0] + "\t" + row[1] + "\t" + "%.3f" % row[2] + "\t" + "%.3f" % row[3] + "\t" + "%.2f" % row[4])
+
+    return
+
+
+
+def main():
+    # set up and parse arguments
+    parser = argparse.ArgumentParser()
+    parser = run_benchmarks_parser(parser)
+    args = parser.parse_args()
+
+    # run the benchmarks
+    args.func(args)
+
+    return
+
+if __name__ == "__main__":
+    main()
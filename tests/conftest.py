@@ -1,3 +1,7 @@
+import os
+import pytest
+
+
 def pytest_addoption(parser):
     parser.addoption(
         "--datafolder",
@@ -11,3 +15,31 @@ def pytest_generate_tests(metafunc):
     if "datafolder" in metafunc.fixturenames:
         metafunc.parametrize("datafolder",
                              metafunc.config.getoption("datafolder"))
+
+
+# keep the results cached by each test in a temporary directory instead of ~/.cache/muttui
+@pytest.fixture(autouse=True)
+def muttui_cache_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv("MUTTUI_CACHE_DIR", str(tmp_path / "muttui_cache"))
+    return str(tmp_path / "muttui_cache")
+
+# a small alignment of 4 taxa and its tree, with the treetime reconstruction in the treetime directory so runs can use
+# --start_from_treetime -to <directory>treetime/ after copying annotated_tree.nexus to their output directory
+@pytest.fixture
+def small_dataset(tmp_path):
+    directory = str(tmp_path / "dataset") + "/"
+    os.makedirs(directory + "treetime")
+
+    with open(directory + "alignment.fasta", "w") as outfile:
+        outfile.write(">A\nACGTACGTAC\n>B\nACGAACGTAC\n>C\nTCGTACGGA-\n>D\nTCGTACGGAC\n")
+    with open(directory + "tree.nwk", "w") as outfile:
+        outfile.write("((A:0.1,B:0.1):0.1,(C:0.1,D:0.1):0.1);\n")
+    with open(directory + "treetime/annotated_tree.nexus", "w") as outfile:
+        outfile.write("#NEXUS\nBegin Taxa;\n Dimensions NTax=4;\n TaxLabels A B C D;\nEnd;\nBegin Trees;\n" +
+                      ' Tree tree1=((A:0.1000000,B:0.1000000[&mutations="T4A"])NODE_0000001:0.1000000[&mutations="G8T"],' +
+                      '(C:0.1000000[&mutations=""],D:0.1000000)NODE_0000002:0.1000000[&mutations="A1T"])NODE_0000000:0.0010000;\nEnd;\n')
+    with open(directory + "treetime/ancestral_sequences.fasta", "w") as outfile:
+        outfile.write(">NODE_0000000\nACGTACGGAC\n>NODE_0000001\nACGTACGTAC\n>A\nACGTACGTAC\n>B\nACGAACGTAC\n" +
+                      ">NODE_0000002\nTCGTACGGAC\n>C\nTCGTACGGAN\n>D\nTCGTACGGAC\n")
+
+    return directory
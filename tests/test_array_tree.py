@@ -0,0 +1,46 @@
+# test array_tree
+from MutTui.array_tree import *
+from MutTui.branch_labelling import labelBranchesTreetime
+from io import StringIO
+import os
+import tempfile
+
+def test_read_tree():
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        treeFile = os.path.join(tmpdirname, "tree.nwk")
+
+        # names, quoted names, confidence values, comments and branch lengths are read as in Bio.Phylo
+        with open(treeFile, "w") as outfile:
+            outfile.write("((A:1,'B c':2)95:0.5,(C,(D:1,E:1)NODE_0000001:1[&x=1])N2:1,F:0.1)root;\n")
+        for chunkSize in [1, 4, 1048576]:
+            tree = readTree(treeFile, chunkSize = chunkSize)
+            bioTree = StringIO()
+            Phylo.write(Phylo.read(treeFile, "newick"), bioTree, "newick")
+            assert tree.toNewick() + "\n" == bioTree.getvalue()
+
+        assert tree.names == ["root", None, "A", "B c", "N2", "C", "NODE_0000001", "D", "E", "F"]
+        assert tree.confidences[1] == 95
+        assert list(tree.parent) == [-1, 0, 1, 1, 0, 4, 4, 6, 6, 0]
+        assert [tree.names[i] for i in tree.getTerminals(4)] == ["C", "D", "E"]
+        assert list(tree.countTerminals()) == [6, 2, 1, 1, 3, 1, 2, 1, 1, 1]
+
+        # clades are ladderized and named as in treetime, NODE_0000001 is already used so is skipped
+        tree.names[0] = None
+        tree.names[4] = None
+        bioTree = tree.toPhylo()
+        bioTree.ladderize()
+        labelBranchesTreetime(bioTree)
+        ladderized = tree.ladderize().nameTreetimeNodes()
+        assert ladderized.names == [clade.name for clade in bioTree.find_clades()]
+        assert ladderized.names == ["NODE_0000000", "F", "NODE_0000002", "A", "B c", "NODE_0000003", "C", "NODE_0000001", "D", "E"]
+
+        # deep trees are read and written without recursion
+        with open(treeFile, "w") as outfile:
+            outfile.write("(" * 5000 + "T0" + "".join([",T" + str(i) + ")" for i in range(1, 5001)]) + ";")
+        tree = readTree(treeFile)
+        assert len(tree) == 10001
+        assert tree.getDepths().max() == 5000
+        assert tree.ladderize().toNewick().startswith("(T5000:0.00000,(T4999:0.00000,")
+
+    return
@@ -0,0 +1,112 @@
+# test batch
+from MutTui.batch import *
+import json
+import os
+import shutil
+
+def test_batch(small_dataset, tmp_path):
+
+    tmpdirname = str(tmp_path) + "/"
+    os.makedirs(tmpdirname + "out")
+
+    # a job with all sites in the alignment and a job with a tree that does not exist
+    jobs = [{"name": "all", "alignment": small_dataset + "alignment.fasta", "tree": small_dataset + "tree.nwk", "all_sites": True},
+            {"name": "missing", "alignment": small_dataset + "alignment.fasta", "tree": tmpdirname + "missing.nwk", "all_sites": "true", "rna": False}]
+    with open(tmpdirname + "manifest.json", "w") as outfile:
+        json.dump(jobs, outfile)
+
+    parser = batch_parser(argparse.ArgumentParser())
+    args = parser.parse_args(["-m", tmpdirname + "manifest.json", "-o", tmpdirname + "out", "--run_options", "--cache_dir ''"])
+    args.func(args)
+
+    # each job has its own output directory and status record
+    assert readStatus(tmpdirname + "out/all")["status"] == "complete"
+    assert os.path.isfile(tmpdirname + "out/all/mutational_spectrum_label_A.csv")
+    assert readStatus(tmpdirname + "out/missing")["status"] == "failed"
+    assert "--all_sites" in readStatus(tmpdirname + "out/all")["arguments"]
+    assert "--rna" not in readStatus(tmpdirname + "out/missing")["arguments"]
+
+    # completed jobs are not rerun, failed jobs are retried
+    completed = readStatus(tmpdirname + "out/all")["end"]
+    shutil.copy(small_dataset + "tree.nwk", tmpdirname + "missing.nwk")
+    args = parser.parse_args(["-m", tmpdirname + "manifest.json", "-o", tmpdirname + "out", "--run_options", "--cache_dir ''"])
+    args.func(args)
+    assert readStatus(tmpdirname + "out/all")["end"] == completed
+    assert readStatus(tmpdirname + "out/missing")["status"] == "complete"
+    assert open(tmpdirname + "out/batch_status.csv").read() == "Job,Status,Output_directory\nall,complete," + tmpdirname + "out/all\n" + \
+        "missing,complete," + tmpdirname + "out/missing\n"
+
+    return
+
+def test_batch_workers(small_dataset, tmp_path):
+
+    tmpdirname = str(tmp_path) + "/"
+
+    # jobs run in batch worker processes are run with a single worker
+    jobs = [{"name": "job" + str(i), "alignment": small_dataset + "alignment.fasta", "tree": small_dataset + "tree.nwk", "all_sites": True,
+             "start_from_treetime": True, "treetime_out": small_dataset + "treetime", "workers": 2} for i in range(2)]
+    with open(tmpdirname + "manifest.json", "w") as outfile:
+        json.dump(jobs, outfile)
+    for job in jobs:
+        os.makedirs(tmpdirname + "out/" + job["name"])
+        shutil.copy(small_dataset + "treetime/annotated_tree.nexus", tmpdirname + "out/" + job["name"])
+
+    parser = batch_parser(argparse.ArgumentParser())
+    args = parser.parse_args(["-m", tmpdirname + "manifest.json", "-o", tmpdirname + "out", "--workers", "2"])
+    args.func(args)
+
+    for job in jobs:
+        assert readStatus(tmpdirname + "out/" + job["name"])["status"] == "complete"
+        assert "Running with 1 worker rather than 2" in open(tmpdirname + "out/" + job["name"] + "/muttui.log").read()
+
+    return
+
+def test_batch_broken_workers(small_dataset, tmp_path, monkeypatch):
+
+    tmpdirname = str(tmp_path) + "/"
+    os.makedirs(tmpdirname + "out")
+
+    jobs = [{"name": "job" + str(i), "alignment": small_dataset + "alignment.fasta", "tree": small_dataset + "tree.nwk"} for i in range(2)]
+    with open(tmpdirname + "manifest.json", "w") as outfile:
+        json.dump(jobs, outfile)
+
+    # the worker processes stop while running their jobs
+    batchPid = os.getpid()
+    def stopWorker():
+        if os.getpid() != batchPid:
+            os._exit(1)
+        return(muttui_parser(argparse.ArgumentParser(prog = "MutTui run")))
+    monkeypatch.setattr("MutTui.batch.getRunParser", stopWorker)
+
+    parser = batch_parser(argparse.ArgumentParser())
+    args = parser.parse_args(["-m", tmpdirname + "manifest.json", "-o", tmpdirname + "out", "--workers", "2"])
+    args.func(args)
+
+    # the jobs are recorded as failed and the status of the batch is written
+    for job in jobs:
+        assert readStatus(tmpdirname + "out/" + job["name"])["status"] == "failed"
+    assert open(tmpdirname + "out/batch_status.csv").read() == "Job,Status,Output_directory\n" + \
+        "".join([job["name"] + ",failed," + tmpdirname + "out/" + job["name"] + "\n" for job in jobs])
+
+    return
+
+def test_batch_treetime_log(small_dataset, tmp_path):
+
+    tmpdirname = str(tmp_path) + "/"
+    os.makedirs(tmpdirname + "out")
+
+    with open(tmpdirname + "manifest.json", "w") as outfile:
+        json.dump([{"name": "all", "alignment": small_dataset + "alignment.fasta", "tree": small_dataset + "tree.nwk", "all_sites": True,
+                    "treetime_backend": "subprocess"}], outfile)
+
+    parser = batch_parser(argparse.ArgumentParser())
+    args = parser.parse_args(["-m", tmpdirname + "manifest.json", "-o", tmpdirname + "out"])
+    args.func(args)
+
+    # the output of the treetime command is written to the log of the job after the command is printed
+    assert readStatus(tmpdirname + "out/all")["status"] == "complete"
+    log = open(tmpdirname + "out/all/muttui.log").read()
+    assert "running cmd: treetime ancestral" in log
+    assert log.index("running cmd: treetime ancestral") < log.index("Inferred sequence evolution model")
+
+    return
@@ -0,0 +1,26 @@
+# test branch_labelling
+from MutTui.branch_labelling import *
+from MutTui.tree_index import TreeIndex
+from io import StringIO
+import os
+import tempfile
+
+def test_get_labelled_tree_labels():
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+
+        # labelled tree from label_tree.py with the label changing to Y along Node3
+        with open(os.path.join(tmpdirname, "labelled_tree.nwk"), "w") as outfile:
+            outfile.write("(((A____Y:1,B____Y:1)Y:1,C____X:1)X:1,(D____X:1,(E____X:1,F____X:1)X:1)X:1)X;\n")
+
+        # the same tree ordered and named as in treetime
+        tree = Phylo.read(StringIO("(((F:1,E:1)NODE_0000002:1,D:1)NODE_0000001:1,(C:1,(B:1,A:1)NODE_0000004:1)NODE_0000003:1)NODE_0000000;"), "newick")
+
+        with open(os.path.join(tmpdirname, "labelled_tree.nwk")) as treeFile:
+            tree, treeLabels = getLabelledTreeLabels(tree, treeFile)
+
+    assert treeLabels == ["X", "Y"]
+    assert {clade.name: clade.clade_label for clade in TreeIndex(tree).clades} == {"NODE_0000000": "X", "NODE_0000001": "X",
+        "NODE_0000002": "X", "F": "X", "E": "X", "D": "X", "NODE_0000003": "X", "C": "X", "NODE_0000004": "Y", "B": "Y", "A": "Y"}
+
+    return
@@ -0,0 +1,57 @@
+# test cache
+from MutTui.cache import *
+import os
+import tempfile
+import numpy as np
+
+def test_cached_files():
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        cacheDir = os.path.join(tmpdirname, "cache")
+        outputDir = os.path.join(tmpdirname, "output")
+        os.makedirs(outputDir)
+
+        with open(os.path.join(tmpdirname, "a.txt"), "w") as outfile:
+            outfile.write("ACGT\n")
+        with open(os.path.join(tmpdirname, "b.txt"), "w") as outfile:
+            outfile.write("TGCA\n")
+
+        # files are not loaded before they are saved
+        key = hashContent(hashFiles(os.path.join(tmpdirname, "a.txt")), "options")
+        assert not loadCachedFiles(["a.txt", "b.txt"], outputDir, "files", key, cacheDir)
+
+        saveCachedFiles(["a.txt", "b.txt"], tmpdirname, "files", key, cacheDir)
+        assert loadCachedFiles(["a.txt", "b.txt"], outputDir, "files", key, cacheDir)
+        assert open(os.path.join(outputDir, "b.txt")).read() == "TGCA\n"
+
+        # an empty cache directory turns off the cache
+        assert not loadCachedFiles(["a.txt", "b.txt"], outputDir, "files", key, "")
+
+        # the least recently used results are removed first
+        saveCachedFiles(["a.txt"], tmpdirname, "files", "older", cacheDir)
+        os.utime(os.path.join(cacheDir, "files", "older"), (0, 0))
+        evictCache("files", 10, cacheDir)
+        assert sorted(os.listdir(os.path.join(cacheDir, "files"))) == [key]
+        evictCache("files", 0, cacheDir)
+        assert os.listdir(os.path.join(cacheDir, "files")) == []
+
+    return
+
+def test_cached_arrays():
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        cacheDir = os.path.join(tmpdirname, "cache")
+
+        saveCachedArray(np.arange(3), "arrays", "key", cacheDir)
+        assert list(loadCachedArray("arrays", "key", cacheDir)) == [0, 1, 2]
+        saveCachedArrays({"a": np.arange(2)}, "arrays", "key", cacheDir)
+        assert list(loadCachedArrays("arrays", "key", cacheDir)["a"]) == [0, 1]
+
+        # the temporary file is removed if the array cannot be moved into place
+        os.makedirs(os.path.join(cacheDir, "arrays", "other.npy"))
+        os.makedirs(os.path.join(cacheDir, "arrays", "other.npz"))
+        saveCachedArray(np.arange(3), "arrays", "other", cacheDir)
+        saveCachedArrays({"a": np.arange(2)}, "arrays", "other", cacheDir)
+        assert sorted(os.listdir(os.path.join(cacheDir, "arrays"))) == ["key.npy", "key.npz", "other.npy", "other.npz"]
+
+    return
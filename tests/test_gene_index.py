@@ -0,0 +1,27 @@
+# test gene_index
+from MutTui.gene_index import GeneIndex
+import numpy as np
+
+def test_gene_index():
+
+    # overlapping genes, a gene within another gene and a gene of a single base
+    names = ["g1", "g2", "g3", "g4", "g5"]
+    starts = [5, 10, 12, 30, 40]
+    ends = [15, 20, 14, 35, 40]
+    geneIndex = GeneIndex(names, starts, ends, ["+", "-", "+", "-", "+"])
+
+    # the genes of each position match the genes in the GFF containing the position, in the order of the GFF
+    positions = np.arange(0, 50)
+    positionIndices, geneIndices = geneIndex.getGenes(positions)
+    for p in positions:
+        expected = [n for n, s, e in zip(names, starts, ends) if s <= p <= e]
+        assert geneIndex.names[geneIndices[positionIndices == p]].tolist() == expected
+        assert geneIndex.getGeneNames(p) == expected
+
+    assert list(geneIndex.inGene([4, 5, 21, 40, 41])) == [False, True, False, True, False]
+
+    # the index is the same after being saved to arrays
+    copiedIndex = GeneIndex.fromArrays(geneIndex.toArrays())
+    assert np.array_equal(copiedIndex.getGenes(positions)[1], geneIndices)
+
+    return
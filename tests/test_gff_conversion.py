@@ -0,0 +1,28 @@
+# test gff_conversion
+from MutTui.gff_conversion import *
+import os
+import tempfile
+
+def test_convert_gff(muttui_cache_dir):
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+
+        # a gene feature that is not a CDS, CDS with and without IDs and attributes containing commas
+        with open(os.path.join(tmpdirname, "annotation.gff"), "w") as outfile:
+            outfile.write("##gff-version 3\n##sequence-region ref 1 100\n" +
+                          "ref\tprokka\tgene\t1\t30\t.\t+\t.\tID=gene1\n" +
+                          "ref\tprokka\tCDS\t1\t30\t.\t+\t0\tID=cds1;product=a,b\n" +
+                          "ref\tprokka\tCDS\t25\t60\t.\t-\t0\tproduct=c\n" +
+                          "ref\tprokka\tCDS\t70\t90\t.\t-\t0\tName=d\n" +
+                          "##FASTA\n>ref\nACGT\n")
+
+        # the second conversion reads the gene coordinates from the cache
+        for i in range(2):
+            geneIndex = convertGFF.__wrapped__(os.path.join(tmpdirname, "annotation.gff"))
+            assert geneIndex.names.tolist() == ["cds1", "CDS_1", "CDS_2"]
+            assert geneIndex.starts.tolist() == [1, 25, 70]
+            assert geneIndex.ends.tolist() == [30, 60, 90]
+            assert geneIndex.strands.tolist() == ["+", "-", "-"]
+            assert len(os.listdir(os.path.join(muttui_cache_dir, "gff"))) == 1
+
+    return
@@ -0,0 +1,32 @@
+# test mutation_table
+from MutTui.mutation_table import *
+import numpy as np
+import pytest
+
+def test_branch_mutation_table():
+
+    translation = np.arange(20, dtype = np.int32) + 100
+    branchMutations = BranchMutationTable.fromStrings(["A", "NODE_0000001", "C"], ["T2A,A9N", "C2T", "G3A,C4T,A5G"], translation)
+
+    # the mutations of all branches are in a single table with the rows of each branch in order
+    assert len(branchMutations.table) == 6
+    assert list(branchMutations.offsets) == [0, 2, 3, 6]
+    assert list(branchMutations.getBranchIds()) == [0, 0, 1, 2, 2, 2]
+    assert branchMutations["A"].tolist() == [(ord("T"), 2, 102, ord("A")), (ord("A"), 9, 109, ord("N"))]
+    assert list(branchMutations["C"]["genome_position"]) == [103, 104, 105]
+
+    # branch slices share the arrays of the table
+    assert np.shares_memory(branchMutations["C"]["alt"], branchMutations.table["alt"])
+
+    # filtered mutations replace the rows of the branch
+    branchMutations["C"] = branchMutations["C"][branchMutations["C"]["ref"] != ord("C")]
+    assert list(branchMutations["C"]["alignment_position"]) == [3, 5]
+    assert sorted(branchMutations) == ["A", "C", "NODE_0000001"]
+    assert "B" not in branchMutations
+
+    # alignment positions missing from the translation are an error, there is no translation with --all_sites
+    with pytest.raises(KeyError):
+        BranchMutationTable.fromStrings(["A"], ["T2A,A25N"], translation)
+    assert list(BranchMutationTable.fromStrings(["A"], ["T2A,A25N"], None)["A"]["genome_position"]) == [2, 25]
+
+    return
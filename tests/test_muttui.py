@@ -3,6 +3,7 @@ from MutTui.muttui import main
 import sys
 import os
 import tempfile
+import shutil
 
 
 def compare_files(file1, file2):
@@ -71,3 +72,63 @@ def test_add_tree_node_labels(datafolder):
 
     return
 
+
+
+def test_branch_specific_labelled_tree(small_dataset):
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        tmpdirname += '/'
+        shutil.copy(small_dataset + "treetime/annotated_tree.nexus", tmpdirname)
+
+        # the labels change from X to Y along the branch to B
+        with open(small_dataset + "labelled_tree.nwk", "w") as outfile:
+            outfile.write("((A____X:0.1,B____Y:0.1)X:0.1,(C____X:0.1,D____X:0.1)X:0.1)X;\n")
+
+        # with a labelled tree, --branch_specific calculates the spectra of the labels from branches with at least -bm mutations
+        sys.argv = [
+            "run",
+            "-a", small_dataset + "alignment.fasta",
+            "-t", small_dataset + "tree.nwk",
+            "-lt", small_dataset + "labelled_tree.nwk",
+            "--all_sites",
+            "--include_root_branches",
+            "--branch_specific",
+            "-bm", "1",
+            "--start_from_treetime",
+            "-to", small_dataset + "treetime/",
+            "-o", tmpdirname
+        ]
+        main()
+
+        assert not os.path.isfile(tmpdirname + "branch_specific_spectra.npz")
+        with open(tmpdirname + "mutational_spectrum_label_X.csv") as infile:
+            assert [line.strip() for line in infile if not line.strip().endswith(",0")][1:] == ["T[C>A]C,1"]
+        with open(tmpdirname + "mutational_spectrum_label_Y.csv") as infile:
+            assert [line.strip() for line in infile if not line.strip().endswith(",0")][1:] == ["G[T>A]A,1"]
+        assert os.path.isfile(tmpdirname + "DBS_label_Y.csv")
+        assert open(tmpdirname + "combined_catalog.csv").readline().strip() == "Substitution,X,Y"
+
+    return
+
+def test_cached_treetime_outputs(small_dataset, tmp_path):
+
+    # the second run uses the cached treetime reconstruction and writes the same files as the first
+    outputs = list()
+    for run in ["first", "second"]:
+        os.makedirs(str(tmp_path / run))
+        sys.argv = [
+            "run",
+            "-a", small_dataset + "alignment.fasta",
+            "-t", small_dataset + "tree.nwk",
+            "--all_sites",
+            "-o", str(tmp_path / run)
+        ]
+        main()
+        outputs.append(sorted(os.listdir(str(tmp_path / run))))
+
+    assert "branch_mutations.txt" in outputs[0]
+    assert "auspice_tree.json" in outputs[0]
+    assert outputs[0] == outputs[1]
+    compare_files(str(tmp_path / "first" / "branch_mutations.txt"), str(tmp_path / "second" / "branch_mutations.txt"))
+
+    return
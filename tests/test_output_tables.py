@@ -0,0 +1,28 @@
+# test output_tables
+from MutTui.output_tables import TableWriter, openTable, readTable
+import os
+import tempfile
+
+def test_table_writer():
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        for compress in [False, True]:
+            fileName = os.path.join(tmpdirname, "all_included_mutations.csv")
+
+            # rows are buffered until bufferRows rows have been added, single strings are used in every row
+            outTable = TableWriter(openTable(fileName, compress), ["Mutation_in_alignment", "Mutation_in_genome", "Branch"], bufferRows = 3)
+            outTable.addRows(["A1G", "C5T"], ["A10G", "C50T"], "branch1")
+            assert outTable.bufferedRows == 2
+            outTable.addRows([], [], "branch2")
+            outTable.addRows(["T8A", "G9C"], ["T80A", "G90C"], "branch3")
+            assert outTable.bufferedRows == 0
+            outTable.addRows(["G2A"], ["G20A"], "branch4")
+            outTable.close()
+
+            if compress:
+                fileName += ".gz"
+            with readTable(fileName) as f:
+                assert f.read() == "Mutation_in_alignment,Mutation_in_genome,Branch\nA1G,A10G,branch1\nC5T,C50T,branch1\n" + \
+                "T8A,T80A,branch3\nG9C,G90C,branch3\nG2A,G20A,branch4\n"
+
+    return
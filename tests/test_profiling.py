@@ -0,0 +1,97 @@
+# test profiling
+from MutTui.profiling import *
+from MutTui.batch import batch_parser
+from MutTui.muttui import main
+import argparse
+import json
+import os
+import shutil
+import sys
+
+def test_profile_command(small_dataset, tmp_path):
+
+    tmpdirname = str(tmp_path) + "/"
+    os.makedirs(tmpdirname + "out/all")
+    shutil.copy(small_dataset + "treetime/annotated_tree.nexus", tmpdirname + "out/all")
+
+    with open(tmpdirname + "manifest.json", "w") as outfile:
+        json.dump([{"name": "all", "alignment": small_dataset + "alignment.fasta", "tree": small_dataset + "tree.nwk", "all_sites": True,
+                    "include_root_branches": True, "start_from_treetime": True, "treetime_out": small_dataset + "treetime"}], outfile)
+
+    # profile the batch and the MutTui run of its job
+    parser = batch_parser(argparse.ArgumentParser())
+    args = parser.parse_args(["-m", tmpdirname + "manifest.json", "-o", tmpdirname + "out", "--run_options=--profile", "--profile"])
+    args.func(args)
+    assert not isProfiling()
+
+    with open(tmpdirname + "out/run_profile.json") as infile:
+        batchProfile = json.load(infile)
+    with open(tmpdirname + "out/all/run_profile.json") as infile:
+        runProfile = json.load(infile)
+
+    assert batchProfile["command"] == "batch"
+    assert batchProfile["status"] == "complete"
+    assert [stage["name"] for stage in batchProfile["stages"]] == ["jobs"]
+    assert batchProfile["counts"]["jobs_run"] == 1
+    # the outputs of the job are written within the output directory of the batch
+    assert batchProfile["counts"]["bytes_written"] > runProfile["counts"]["bytes_written"] > 0
+
+    assert runProfile["command"] == "run"
+    assert runProfile["options"]["alignment"] == small_dataset + "alignment.fasta"
+    stages = {stage["name"]: stage for stage in runProfile["stages"]}
+    assert list(stages) == ["alignment_import", "position_translation", "tree_import", "labelling", "reference",
+                            "branch_categories", "branch_loop", "reference_contexts", "writing", "plotting"]
+    assert stages["plotting"]["parent"] == "writing"
+    assert stages["plotting"]["calls"] == 4
+    assert stages["writing"]["wall_time"] >= stages["plotting"]["wall_time"]
+    for stage in stages.values():
+        assert stage["wall_time"] >= 0
+        assert stage["tracemalloc_peak_mb"] > 0
+    assert runProfile["wall_time"] >= sum([stage["wall_time"] for stage in stages.values() if stage["parent"] is None])
+
+    # 3 branches with mutations, 2 mutations are included and 1 is at the end of the genome
+    assert runProfile["counts"]["branches_processed"] == 3
+    assert runProfile["counts"]["mutations_read"] == 3
+    assert runProfile["counts"]["mutations_included"] == 2
+    assert runProfile["counts"]["double_substitutions_included"] == 0
+    assert runProfile["counts"]["mutations_not_included"] == 1
+    assert runProfile["counts"]["labels_written"] == 1
+    # the log and status record of the job are written by the batch, annotated_tree.nexus was copied before the run
+    assert runProfile["counts"]["bytes_written"] == sum([os.path.getsize(os.path.join(root, f)) for root, dirs, files in os.walk(tmpdirname + "out/all")
+                                                         for f in files if f not in [profile_file, "muttui.log", "muttui_status.json", "annotated_tree.nexus"]])
+
+    return
+
+def test_profile_workers(small_dataset, tmp_path):
+
+    tmpdirname = str(tmp_path) + "/"
+    shutil.copy(small_dataset + "treetime/annotated_tree.nexus", tmpdirname)
+    with open(small_dataset + "labelled_tree.nwk", "w") as outfile:
+        outfile.write("((A____X:0.1,B____Y:0.1)X:0.1,(C____X:0.1,D____X:0.1)X:0.1)X;\n")
+
+    # the 2 labels are plotted in worker processes, which are timed as a single plotting stage in the parent
+    sys.argv = [
+        "run",
+        "-a", small_dataset + "alignment.fasta",
+        "-t", small_dataset + "tree.nwk",
+        "-lt", small_dataset + "labelled_tree.nwk",
+        "--all_sites",
+        "--start_from_treetime",
+        "-to", small_dataset + "treetime/",
+        "-o", tmpdirname,
+        "--workers", "2",
+        "--profile"
+    ]
+    main()
+
+    with open(tmpdirname + "run_profile.json") as infile:
+        runProfile = json.load(infile)
+
+    stages = {stage["name"]: stage for stage in runProfile["stages"]}
+    assert stages["plotting"]["parent"] == "writing"
+    assert stages["plotting"]["calls"] == 1
+    assert stages["plotting"]["wall_time"] > 0
+    assert runProfile["counts"]["labels_written"] == 2
+    assert os.path.isfile(tmpdirname + "mutational_spectrum_label_Y.pdf")
+
+    return
@@ -0,0 +1,233 @@
+# test reconstruct_spectrum
+from MutTui.reconstruct_spectrum import *
+from MutTui.tree_index import TreeIndex
+from MutTui.gene_index import GeneIndex
+from MutTui.output_tables import TableWriter
+import io
+import os
+import tempfile
+
+def test_iterate_branch_references():
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+
+        # annotated tree in the format written by treetime
+        with open(os.path.join(tmpdirname, "annotated_tree.nexus"), "w") as outfile:
+            outfile.write("#NEXUS\nBegin Taxa;\n Dimensions NTax=3;\n TaxLabels A B C;\nEnd;\nBegin Trees;\n" +
+            ' Tree tree1=((A:0.1000000[&mutations="T2A,A9N"],B:0.1000000[&mutations=""])NODE_0000001:0.1000000[&mutations="C2T,A5G"],' +
+            'C:1.000000000e+00[&mutations="G3A"])NODE_0000000:0.0010000;\nEnd;\n')
+
+        tree, branchMutationDict = readAnnotatedTree(os.path.join(tmpdirname, "annotated_tree.nexus"), None, 16)
+
+    reference = "ACGTACGTAC"
+
+    # check the tree and mutations are read from the nexus
+    assert [clade.name for clade in tree.find_clades()] == ["NODE_0000000", "NODE_0000001", "A", "B", "C"]
+    assert tree.find_any(name = "C").branch_length == 1.0
+    assert sorted(branchMutationDict.keys()) == ["A", "C", "NODE_0000001"]
+    assert getMutationList(branchMutationDict["A"]) == [["T", 2, 2, "A"], ["A", 9, 9, "N"]]
+
+    # check the reference at each branch matches the reference from the upstream branches
+    for clade, updatedReference in iterateBranchReferences(tree, branchMutationDict, reference):
+        assert decodeSequence(updatedReference) == updateReference(TreeIndex(tree), clade, branchMutationDict, reference)
+
+    # check the contexts of the mutations along a branch
+    for clade, updatedReference in iterateBranchReferences(tree, branchMutationDict, reference):
+        if clade.name == "A":
+            upstream, downstream, nucleotideContext = getBranchContexts(branchMutationDict["A"], updatedReference)
+            assert decodeSequence(upstream) == "AT"
+            assert decodeSequence(downstream) == "GC"
+            assert list(nucleotideContext) == [True, True]
+
+    # the clades below a stop clade are not visited, a subtree can be visited from the reference at the start of its branch
+    subtree = tree.find_any(name = "NODE_0000001")
+    references = {clade.name: decodeSequence(updatedReference) for clade, updatedReference in iterateBranchReferences(tree, branchMutationDict, reference)}
+    stopped = [clade.name for clade, updatedReference in iterateBranchReferences(tree, branchMutationDict, reference, stopClades = {id(subtree)})]
+    assert stopped == ["NODE_0000000", "NODE_0000001", "C"]
+    for clade, updatedReference in iterateBranchReferences(None, branchMutationDict, encodeSequence(references["NODE_0000001"]), subtree = subtree):
+        assert decodeSequence(updatedReference) == references[clade.name]
+
+    return
+
+def test_iterate_branch_references_reverts():
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+
+        # a double substitution along NODE_0000001 and NODE_0000003, NODE_0000002 reverts position 3 which its sibling B does not
+        with open(os.path.join(tmpdirname, "annotated_tree.nexus"), "w") as outfile:
+            outfile.write("#NEXUS\nBegin Taxa;\n Dimensions NTax=4;\n TaxLabels A1 A2 B C;\nEnd;\nBegin Trees;\n" +
+            ' Tree tree1=(((A1:0.1[&mutations="C6T"],A2:0.1[&mutations=""])NODE_0000002:0.1[&mutations="G3A,T6C"],' +
+            'B:0.1[&mutations="G4T,G5A"])NODE_0000001:0.1[&mutations="A3G,C4G"],' +
+            '(C:0.1[&mutations="A3T"],D:0.1[&mutations=""])NODE_0000003:0.1[&mutations="A1C,C2A"])NODE_0000000:0.001;\nEnd;\n')
+
+        tree, branchMutationDict = readAnnotatedTree(os.path.join(tmpdirname, "annotated_tree.nexus"), None)
+
+    reference = "ACACGTACGT"
+    referenceArray = encodeSequence(reference)
+
+    # the reference at the start of each branch is the same as from applying its upstream branches one at a time
+    references = dict()
+    for clade, updatedReference in iterateBranchReferences(tree, branchMutationDict, referenceArray):
+        references[clade.name] = decodeSequence(updatedReference)
+        assert references[clade.name] == updateReference(TreeIndex(tree), clade, branchMutationDict, reference)
+
+    assert references == {"NODE_0000000": "ACACGTACGT", "NODE_0000001": "ACACGTACGT", "NODE_0000002": "ACGGGTACGT",
+                          "A1": "ACAGGCACGT", "A2": "ACAGGCACGT", "B": "ACGGGTACGT", "NODE_0000003": "ACACGTACGT",
+                          "C": "CAACGTACGT", "D": "CAACGTACGT"}
+
+    # every mutation is reverted once the tree has been visited
+    assert decodeSequence(referenceArray) == reference
+
+    return
+
+def test_update_reference():
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+
+        # genome positions are translated from the alignment positions in the annotated tree
+        with open(os.path.join(tmpdirname, "annotated_tree.nexus"), "w") as outfile:
+            outfile.write("#NEXUS\nBegin Taxa;\n Dimensions NTax=2;\n TaxLabels A B;\nEnd;\nBegin Trees;\n" +
+            ' Tree tree1=((A:0.1[&mutations="C2T"],B:0.1)NODE_0000001:0.1[&mutations="A1G,C2A"])NODE_0000000:0.001;\nEnd;\n')
+
+        tree, branchMutationDict = readAnnotatedTree(os.path.join(tmpdirname, "annotated_tree.nexus"), np.array([0, 3, 4]))
+
+    treeIndex = TreeIndex(tree)
+    assert updateReference(treeIndex, tree.root, branchMutationDict, "ACACGT") == "ACACGT"
+    assert updateReference(treeIndex, tree.find_any(name = "NODE_0000001"), branchMutationDict, "ACACGT") == "ACACGT"
+    assert updateReference(treeIndex, tree.find_any(name = "A"), branchMutationDict, "ACACGT") == "ACGAGT"
+
+    return
+
+def test_filter_mutations():
+
+    clade = Phylo.Newick.Clade(name = "branch")
+    outFile = io.StringIO()
+    outMutationsNotUsed = TableWriter(outFile, ["Mutation_in_alignment", "Mutation_in_genome", "Branch", "Reason_not_included"])
+
+    # a double substitution, a tract of 3 substitutions, a mutation to N and mutations at the ends of the genome
+    branchMutations = listToMutationArray([["A", 1, 1, "G"], ["C", 5, 5, "T"], ["G", 6, 6, "A"], ["A", 10, 10, "N"],
+    ["T", 20, 20, "C"], ["A", 21, 21, "G"], ["C", 22, 22, "T"], ["G", 30, 30, "A"], ["C", 40, 40, "A"]])
+
+    singles, doubles = filterMutations(branchMutations, clade, ["A", "C", "G", "T"], 40, outMutationsNotUsed)
+
+    assert getMutationList(singles) == [["G", 30, 30, "A"]]
+    assert getMutationList(doubles) == [["C", 5, 5, "T"], ["G", 6, 6, "A"]]
+
+    outMutationsNotUsed.flush()
+    reasons = [line.split(",")[-1] for line in outFile.getvalue().strip().split("\n")[1:]]
+    assert "A1G,A1G,branch,End_of_genome" in outFile.getvalue().split("\n")
+    assert reasons.count("End_of_genome") == 2
+    assert reasons.count("Mutation_does_not_involve_two_nucleotides") == 1
+    assert reasons.count("In_tract_of_three_or_more_substitutions") == 3
+
+    return
+
+def test_get_reference():
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+
+        # reference genome and ancestral reconstruction containing the variable positions of the genome
+        with open(os.path.join(tmpdirname, "reference.fasta"), "w") as outfile:
+            outfile.write(">reference\nacgtacgtac\n")
+        with open(os.path.join(tmpdirname, "ancestral_sequences.fasta"), "w") as outfile:
+            outfile.write(">NODE_0000000\nTTG\n>A\nAAG\n")
+
+        alignment = AlignIO.read(os.path.join(tmpdirname, "ancestral_sequences.fasta"), "fasta")
+
+        with open(os.path.join(tmpdirname, "reference.fasta")) as reference:
+            assert getReference(reference, False, alignment, np.array([0, 2, 5, 10])) == "ATGTTCGTAG"
+            assert getReference(reference, True, alignment, np.array([0, 2, 5, 10])) == "TTG"
+
+        # only the root record is read, headers must match the whole record name
+        with open(os.path.join(tmpdirname, "ancestral_sequences.fasta"), "w") as outfile:
+            outfile.write(">NODE_00000001\nAAA\n>A\nAAG\n>NODE_0000000 root\nTT\nG\n>B\nCCC")
+        root = readFastaRecord(os.path.join(tmpdirname, "ancestral_sequences.fasta"))
+        assert len(root) == 1
+        assert str(root[0].seq) == "TTG"
+        assert str(readFastaRecord(os.path.join(tmpdirname, "ancestral_sequences.fasta"), "B")[0].seq) == "CCC"
+
+    return
+
+def test_convert_translation():
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        with open(os.path.join(tmpdirname, "conversion.txt"), "w") as outfile:
+            outfile.write("1\t3\n2\t4\n4\t9\n")
+
+        # the translation is saved next to the translation file and reused until the file changes
+        for i in range(2):
+            with open(os.path.join(tmpdirname, "conversion.txt")) as positionsFile:
+                assert list(convertTranslation(positionsFile)) == [0, 3, 4, 0, 9]
+            assert os.path.exists(os.path.join(tmpdirname, "conversion.txt.npz"))
+
+        with open(os.path.join(tmpdirname, "conversion.txt"), "w") as outfile:
+            outfile.write("1\t5\n")
+        with open(os.path.join(tmpdirname, "conversion.txt")) as positionsFile:
+            assert list(convertTranslation(positionsFile)) == [0, 5]
+
+        # a change to a file of the same size is found when the file keeps its modification time
+        stat = os.stat(os.path.join(tmpdirname, "conversion.txt"))
+        with open(os.path.join(tmpdirname, "conversion.txt"), "w") as outfile:
+            outfile.write("1\t7\n")
+        os.utime(os.path.join(tmpdirname, "conversion.txt"), ns = (stat.st_atime_ns, stat.st_mtime_ns))
+        with open(os.path.join(tmpdirname, "conversion.txt")) as positionsFile:
+            assert list(convertTranslation(positionsFile)) == [0, 7]
+
+    return
+
+def test_calculate_contexts():
+
+    sequence = "ACGTTGCANNACGGTaCGTCCATGA-CTTGACCA"
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        for rna in [False, True]:
+            # count the triplets one at a time, adding triplets not in the dictionary to their reverse complement
+            if rna:
+                expected = getRNATripletDict()
+            else:
+                expected = getTripletDict()
+            for i in range(len(sequence) - 2):
+                t = sequence[i:(i + 3)]
+                if all(b in "ACGT" for b in t):
+                    if t in expected:
+                        expected[t] += 1
+                    else:
+                        expected[complement(t[2]) + complement(t[1]) + complement(t[0])] += 1
+            if not rna:
+                expected = {t: 2 * expected[t] for t in expected}
+
+            # the second calculation uses the triplet counts from the cache
+            assert calculateContexts(sequence, rna, tmpdirname) == expected
+            assert os.path.exists(os.path.join(tmpdirname, "triplets", hashContent(sequence) + ".npy"))
+            assert calculateContexts(sequence, rna, tmpdirname) == expected
+
+    return
+
+def test_extract_synonymous():
+
+    # gene on the positive strand encoding M K L * and a gene on the negative strand encoding C L, overlapping its final codon
+    reference = encodeSequence("ATGAAACTGTAAGCA")
+    geneIndex = GeneIndex(["gene1", "gene2"], [1, 10], [12, 15], ["+", "-"])
+
+    # AAA to AAG is synonymous, CTG to TTA is synonymous when both mutations are included, ATG to GTG is not
+    branchMutations = listToMutationArray([["A", 1, 1, "G"], ["A", 6, 6, "G"], ["C", 7, 7, "T"], ["G", 9, 9, "A"]])
+    synonymous = extractSynonymous(branchMutations, reference, geneIndex)
+    assert getMutationList(synonymous) == [["A", 6, 6, "G"], ["C", 7, 7, "T"], ["G", 9, 9, "A"]]
+
+    # TAA to TGA is synonymous in gene1 but TTA to TCA in gene2 is not
+    branchMutations = listToMutationArray([["A", 11, 11, "G"]])
+    assert len(extractSynonymous(branchMutations, reference, geneIndex)) == 0
+
+    return
+
+def test_get_strand_bias():
+
+    geneIndex = GeneIndex(["gene1", "gene2", "gene3"], [1, 10, 20], [12, 15, 30], ["+", "-", "-"])
+
+    # C and T mutations are transcribed on the positive strand, A and G mutations on the negative strand
+    # mutations in genes on both strands or outside genes do not have a strand
+    branchMutations = listToMutationArray([["C", 2, 2, "T"], ["A", 3, 3, "G"], ["A", 11, 11, "G"], ["G", 13, 13, "A"],
+    ["T", 25, 25, "C"], ["C", 40, 40, "A"]])
+    assert list(getStrandBias(branchMutations, geneIndex)) == ["t", "u", "", "t", "u", ""]
+
+    return
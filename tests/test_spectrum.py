@@ -0,0 +1,98 @@
+# test spectrum
+from MutTui.spectrum import Spectrum, BranchSpectra, writeBranchSpectra, readBranchSpectra
+from MutTui.reconstruct_spectrum import encodeSequence
+import io
+import os
+import pickle
+import tempfile
+import numpy as np
+
+def test_spectrum():
+
+    spectrum = Spectrum("SBS96")
+
+    # A[C>T]G is in the spectrum, C[G>A]T is added to its reverse complement A[C>T]G
+    channels, forward = spectrum.getChannels(encodeSequence("AC"), encodeSequence("CG"), encodeSequence("TA"), encodeSequence("GT"))
+    assert list(forward) == [True, False]
+    spectrum.addChannels(channels)
+    assert spectrum["ACTG"] == 2
+    assert sum(spectrum.values()) == 2
+
+    # mutations with contexts that are not A, C, G or T do not have a channel
+    channels, forward = spectrum.getChannels(encodeSequence("N"), encodeSequence("C"), encodeSequence("T"), encodeSequence("G"))
+    assert channels[0] == -1
+
+    # double substitutions are converted to the reverse complement of both mutations
+    double = Spectrum("DBS78")
+    channels, forward = double.getChannels(encodeSequence("G"), encodeSequence("G"), encodeSequence("T"), encodeSequence("T"))
+    double.addChannels(channels)
+    assert double["CCAA"] == 1
+
+    # check the spectrum is written in the format of the spectrum files
+    outFile = io.StringIO()
+    (spectrum + spectrum).writeSpectrum(outFile)
+    assert outFile.getvalue().split("\n")[0] == "Substitution,Number_of_mutations"
+    assert "A[C>T]G,4" in outFile.getvalue().split("\n")
+
+    return
+
+def test_spectrum_rescale(capsys):
+
+    spectrum = Spectrum("SBS96")
+    spectrum.addKeys(["ACTG", "ACTG", "ACAA"])
+    contexts = np.full(len(spectrum.channels), 4)
+    contexts[spectrum.channelIndex["ACAA"]] = 0
+    contexts[spectrum.channelIndex["TCAA"]] = 0
+
+    # channels with no available contexts are set to 0 and the channels with mutations are reported
+    rescaled = spectrum.rescale(contexts, 10)
+    assert rescaled["ACTG"] == 5
+    assert rescaled["ACAA"] == 0
+    assert sum(rescaled.values()) == 5
+    assert "A[C>A]A have mutations but no available contexts" in capsys.readouterr().out
+
+    # channels without mutations are not reported
+    spectrum["ACAA"] = 0
+    spectrum.rescale(contexts, 10)
+    assert capsys.readouterr().out == ""
+
+    return
+
+def test_spectrum_pickle():
+
+    spectrum = Spectrum("SB192")
+    spectrum.addKeys(["tACAA", "uTCGA", "tACAA"])
+
+    # spectra are sent to other processes with only their layout and counts
+    copied = pickle.loads(pickle.dumps(spectrum))
+    assert copied.layout == "SB192"
+    assert list(copied.counts) == list(spectrum.counts)
+    assert copied["tACAA"] == 2
+
+    return
+
+def test_branch_spectra():
+
+    branchSpectra = BranchSpectra("SBS96")
+    branchSpectra.addBranch("branch1")
+    branchSpectra.addBranch("branch2")
+    branchSpectra.addBranch("branch3")
+
+    # mutations are added to the row of their branch, branches without mutations are kept
+    channels, forward = branchSpectra["branch1"].getChannels(encodeSequence("AAC"), encodeSequence("CCG"), encodeSequence("TTA"), encodeSequence("GGT"))
+    branchSpectra["branch1"].addChannels(channels)
+    branchSpectra["branch3"].addChannels(np.array([5, 5, 90]))
+
+    assert list(branchSpectra.getTotals()) == [3, 0, 3]
+    assert branchSpectra.getSpectrum("branch1")["ACTG"] == 3
+    assert branchSpectra.toDense()[2, 5] == 2
+
+    # the matrix is the same after it is written and read
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        writeBranchSpectra(os.path.join(tmpdirname, "branch_specific_spectra.npz"), [branchSpectra])
+        copied = readBranchSpectra(os.path.join(tmpdirname, "branch_specific_spectra.npz"))["SBS96"]
+
+    assert copied.branches == ["branch1", "branch2", "branch3"]
+    assert np.array_equal(copied.toDense(), branchSpectra.toDense())
+
+    return
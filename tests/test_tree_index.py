@@ -0,0 +1,42 @@
+# test tree_index
+from MutTui.tree_index import TreeIndex, buildSubtree
+from Bio import Phylo
+from io import StringIO
+
+def test_tree_index():
+
+    tree = Phylo.read(StringIO("(((A:1,B:1)N3:1,C:1,D:1)N2:1,(E:1,F:1)N4:1)N1;"), "newick")
+    treeIndex = TreeIndex(tree)
+
+    # clades are in the same order as find_clades and match get_path
+    assert treeIndex.clades == list(tree.find_clades())
+    for clade in tree.find_clades():
+        assert treeIndex.getPath(clade) == tree.get_path(clade)
+        assert treeIndex.getDepth(clade) == len(tree.get_path(clade))
+
+    assert treeIndex.getParent(tree.root) is None
+    assert treeIndex.getParent(treeIndex.getClade("A")).name == "N3"
+    assert [treeIndex.clades[i].name for i in treeIndex.postorder] == ["A", "B", "N3", "C", "D", "N2", "E", "F", "N4", "N1"]
+
+    return
+
+def test_split_subtrees():
+
+    tree = Phylo.read(StringIO("(((A:1,B:1)N3:1,C:1,D:1)N2:1,(E:1,F:1)N4:1)N1;"), "newick")
+    treeIndex = TreeIndex(tree)
+    weights = [10 if clade.name == "A" else 1 for clade in treeIndex.clades]
+
+    assert list(treeIndex.getSubtreeWeights(weights)) == [19, 15, 12, 10, 1, 1, 1, 3, 1, 1]
+
+    # clades are split until subtrees weigh at most half of the tree, C, D and B are too small to be separate subtrees
+    assert [treeIndex.clades[i].name for i in treeIndex.splitSubtrees(weights, 2)] == ["A", "N4"]
+
+    # subtrees can be copied without the clades
+    names, parents = treeIndex.getSubtreeArrays(treeIndex.getClade("N2"))
+    assert names == ["N2", "N3", "A", "B", "C", "D"]
+    assert list(parents) == [-1, 0, 1, 1, 0, 0]
+    subtree = buildSubtree(names, parents)
+    assert [clade.name for clade in subtree.find_clades()] == names
+    assert [clade.name for clade in subtree.clades] == ["N3", "C", "D"]
+
+    return
@@ -0,0 +1,85 @@
+# test treetime
+from MutTui.treetime import *
+from MutTui.reconstruct_spectrum import readAnnotatedTree
+import io
+import os
+import tempfile
+
+def test_iterate_gaps_to_Ns():
+
+    # wrapped sequences with descriptions and gaps split across chunks
+    alignment = io.BytesIO(b">A first\r\nAC-T\r\nA-\r\n>B\nTTTT\nTT")
+    for chunkSize in [1, 3, 1048576]:
+        alignment.seek(0)
+        assert b"".join(iterateGapsToNs(alignment, chunkSize)) == b">A\nACNTAN\n>B\nTTTTTT\n"
+
+    return
+
+def test_run_treetime_api():
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        tmpdirname = os.path.join(tmpdirname, "")
+
+        with open(tmpdirname + "alignment.fasta", "w") as outfile:
+            outfile.write(">A\nACGTACGTAC\n>B\nACGAACGTAC\n>C\nTCGTACGGA-\n>D\nTCGTACGGAC\n")
+        with open(tmpdirname + "tree.nwk", "w") as outfile:
+            outfile.write("((A:0.1,B:0.1):0.1,(C:0.1,D:0.1):0.1);\n")
+
+        # the converted alignment is the same when written to a file and when read directly
+        change_gaps_to_Ns(open(tmpdirname + "alignment.fasta"), tmpdirname)
+        assert open(tmpdirname + "gaps_to_N_alignment.fasta").read() == ">A\nACGTACGTAC\n>B\nACGAACGTAC\n>C\nTCGTACGGAN\n>D\nTCGTACGGAC\n"
+        gapsToNs = read_gaps_to_Ns(open(tmpdirname + "alignment.fasta"))
+        assert str(gapsToNs[2].seq) == "TCGTACGGAN"
+
+        reconstruction = run_treetime(open(tmpdirname + "gaps_to_N_alignment.fasta"), open(tmpdirname + "tree.nwk"), tmpdirname, None,
+                                      cacheDir = "", backend = "api", alignmentRecords = gapsToNs)
+
+        # the reconstruction matches the files written by treetime
+        tree, branchMutationDict = readAnnotatedTree(tmpdirname + "annotated_tree.nexus", None)
+        assert [clade.name for clade in reconstruction.tree.find_clades()] == [clade.name for clade in tree.find_clades()]
+        assert sorted(reconstruction.mutations.keys()) == sorted(branchMutationDict.keys())
+
+        alignment = AlignIO.read(tmpdirname + "ancestral_sequences.fasta", "fasta")
+        assert str(reconstruction.rootAlignment[0].seq) == str(alignment[0].seq)
+        assert reconstruction.rootAlignment[0].name == alignment[0].name == "NODE_0000000"
+
+    return
+
+def test_run_treetime_convert_gaps(small_dataset, muttui_cache_dir):
+
+    # the treetime command is run on the alignment with gaps converted to Ns when the alignment is passed with its gaps
+    os.makedirs(small_dataset + "piped")
+    reconstruction = run_treetime(open(small_dataset + "alignment.fasta"), open(small_dataset + "tree.nwk"), small_dataset + "piped/", None,
+                                  convertGaps = True)
+    assert reconstruction is None
+    assert open(small_dataset + "piped/gaps_to_N_alignment.fasta").read() == ">A\nACGTACGTAC\n>B\nACGAACGTAC\n>C\nTCGTACGGAN\n>D\nTCGTACGGAC\n"
+
+    # the same reconstruction is used from the cache when the converted alignment is written by MutTui
+    os.makedirs(small_dataset + "converted")
+    change_gaps_to_Ns(open(small_dataset + "alignment.fasta"), small_dataset + "converted/")
+    assert run_treetime(open(small_dataset + "converted/gaps_to_N_alignment.fasta"), open(small_dataset + "tree.nwk"), small_dataset + "converted/",
+                        None, backend = "api") is None
+    assert len(os.listdir(os.path.join(muttui_cache_dir, "treetime"))) == 1
+    assert open(small_dataset + "converted/annotated_tree.nexus").read() == open(small_dataset + "piped/annotated_tree.nexus").read()
+
+    return
+
+def test_run_treetime_api_fallback(small_dataset, monkeypatch):
+
+    # the treetime command is run with versions of treetime not supported by the api backend
+    monkeypatch.setattr("MutTui.treetime.treetime_version", "0.1.0")
+    assert run_treetime_api(open(small_dataset + "alignment.fasta"), open(small_dataset + "tree.nwk"), small_dataset, "--gtr infer", None) is None
+    assert not os.path.isfile(small_dataset + "annotated_tree.nexus")
+    monkeypatch.undo()
+
+    # and if the functions of the treetime command cannot be called as expected
+    def export_sequences_and_tree(tt, basename):
+        return
+    monkeypatch.setattr("treetime.CLI_io.export_sequences_and_tree", export_sequences_and_tree)
+    os.makedirs(small_dataset + "out")
+    assert run_treetime(open(small_dataset + "alignment.fasta"), open(small_dataset + "tree.nwk"), small_dataset + "out/", None,
+                        backend = "api", convertGaps = True) is None
+    assert os.path.isfile(small_dataset + "out/branch_mutations.txt")
+    assert "NODE_0000001" in open(small_dataset + "out/annotated_tree.nexus").read()
+
+    return